@@ -131,6 +131,31 @@ CACHES = {
     }
 }
 
+# Seconds between writes of buffered product view counts (see
+# products/view_counts.py); 0 disables the in-process flusher, leaving it to
+# the flush_product_views command
+PRODUCT_VIEW_FLUSH_INTERVAL = 30
+
+# Seconds between checks of the catalog generation by the in-memory
+# autocomplete index (see products/suggest.py), and the age after which it is
+# rebuilt anyway to pick up new view counts. Rebuilds after the first run on
+# a background thread while the previous index keeps being served.
+PRODUCT_SUGGEST_CHECK_INTERVAL = 1
+PRODUCT_SUGGEST_MAX_AGE = 60 * 5
+PRODUCT_SUGGEST_REBUILD_IN_BACKGROUND = True
+
+# Lifetime (seconds) of cached catalog API responses; see products/cache.py
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+
+# How long (seconds) a checkout stock reservation holds stock; see orders/stock.py
+STOCK_RESERVATION_TTL = 60 * 15
+
+# How long (seconds) responses to requests sent with an Idempotency-Key are
+# kept for replay, and how long a request holds its key before a retry may
+# take over; see orders/idempotency.py
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
 
 
 
@@ -184,6 +209,14 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'mediafiles')
+# Absolute base for media URLs in API responses (e.g. a CDN such as
+# 'https://cdn.example.com/media/'); empty uses the request host + MEDIA_URL
+MEDIA_BASE_URL = ''
+
+# Resized WebP/JPEG variants generated beside every catalog image upload
+# (see products/images.py); widths in pixels
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_VARIANT_QUALITY = 80
 
 
 
@@ -197,6 +230,7 @@ CORS_ALLOWED_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
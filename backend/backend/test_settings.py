@@ -0,0 +1,24 @@
+"""
+Settings for the test suite: the project settings with a local-memory cache,
+so Redis is not required, and the background work the tests drive by hand
+turned off.
+
+manage.py picks this module for the test command; pass --settings or set
+DJANGO_SETTINGS_MODULE to run the tests with other settings.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Tests flush buffered product views explicitly
+PRODUCT_VIEW_FLUSH_INTERVAL = 0
+
+# Catalog changes must show up in suggestions immediately; a background
+# thread would not see the data of the test's open transaction
+PRODUCT_SUGGEST_CHECK_INTERVAL = 0
+PRODUCT_SUGGEST_REBUILD_IN_BACKGROUND = False
@@ -10,7 +10,7 @@ from rest_framework_simplejwt.views import (
 
 from products.views import ProductViewSet, CategoryViewSet, SubCategoryViewSet, ColorViewSet, SizeViewSet
 from shops.views import ShopViewSet
-from orders.views import OrderViewSet, ShippingMethodViewSet, OrderPaymentViewSet, ShippingMethodListAPIView, CouponViewSet, PaymentAccountsAPIView
+from orders.views import OrderViewSet, ShippingMethodViewSet, OrderPaymentViewSet, ShippingMethodListAPIView, CouponViewSet, PaymentAccountsAPIView, RecommendationViewSet, StockReservationViewSet
 from users.views import UserRegistrationView, register_view, RegisterAPIView, CustomTokenObtainPairView
 
 router = DefaultRouter()
@@ -22,8 +22,10 @@ router.register(r'sizes', SizeViewSet, basename='size')
 router.register(r'shops', ShopViewSet, basename='shop')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'order-payments', OrderPaymentViewSet, basename='order-payment')
+router.register(r'stock-reservations', StockReservationViewSet, basename='stock-reservation')
 router.register(r'shipping-methods', ShippingMethodViewSet, basename='shipping-method')
 router.register(r'coupons', CouponViewSet, basename='coupon')
+router.register(r'recommendations', RecommendationViewSet, basename='recommendation')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
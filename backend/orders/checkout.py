@@ -0,0 +1,152 @@
+# orders/checkout.py
+"""
+Checkout of a paid cart (the confirm-payment / submit endpoints).
+
+Cart lines are resolved before anything is written: product ids with one
+in_bulk query and, for lines that only carry a product name, one
+case-insensitive lookup on the Lower(name) index. The order, its stock, its
+items, the payment and the first status update are then written in a
+single transaction, with one statement per table.
+"""
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.functions import Lower
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from products.models import Product
+from .models import Order, OrderItem, OrderPayment, OrderUpdate
+from .stock import take_stock
+
+
+@dataclass
+class CheckoutLine:
+    index: int
+    product: Product
+    quantity: int
+    unit_price: Decimal
+
+
+class InvalidItems(Exception):
+    """
+    Some cart items are malformed, do not reference an existing product or
+    carry an invalid quantity. `errors` maps request indexes to {field: [messages]}.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"Invalid cart item(s) at {sorted(errors)}.")
+
+    def line_errors(self, line_count):
+        """Errors aligned with the request items, as a nested serializer would report them."""
+        return [self.errors.get(line, {}) for line in range(line_count)]
+
+
+# Validates quantities the way the order serializers do
+_quantity_field = serializers.IntegerField(min_value=1)
+
+
+def _shape_errors(item):
+    """{field: [messages]} for an item that is not an object or whose product_name is not a string."""
+    if not isinstance(item, dict):
+        message = serializers.Serializer.default_error_messages['invalid'].format(datatype=type(item).__name__)
+        return {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+    name = item.get('product_name')
+    if name is not None and not isinstance(name, str):
+        return {'product_name': [serializers.CharField.default_error_messages['invalid']]}
+    return {}
+
+
+def _product_id(item):
+    value = item.get('product', item.get('product_id'))
+    if value is None:
+        return None
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def resolve_lines(items):
+    """
+    Turn the request's cart items into CheckoutLines, in request order.
+    Items are objects referencing a product by 'product' or 'product_id',
+    or failing that by 'product_name'; 'quantity' defaults to 1. Raises
+    InvalidItems if any item is malformed or cannot be resolved, or its
+    quantity is not an integer >= 1.
+    """
+    errors = {}
+    for index, item in enumerate(items):
+        item_errors = _shape_errors(item)
+        if item_errors:
+            errors[index] = item_errors
+    well_formed = [item for index, item in enumerate(items) if index not in errors]
+
+    products = Product.objects.defer('description', 'description_html')
+    ids = {_product_id(item) for item in well_formed} - {None}
+    by_id = products.in_bulk(ids)
+
+    names = {
+        item['product_name'].strip().lower()
+        for item in well_formed
+        if 'product' not in item and 'product_id' not in item and item.get('product_name')
+    }
+    by_name = {}
+    if names:
+        # Several products may share a name: prefer active ones, then the newest
+        matches = products.annotate(name_lower=Lower('name')).filter(name_lower__in=names).order_by('-is_active', '-created_at')
+        for product in matches:
+            by_name.setdefault(product.name_lower, product)
+
+    lines = []
+    for index, item in enumerate(items):
+        if index in errors:
+            continue
+        if 'product' in item or 'product_id' in item:
+            product = by_id.get(_product_id(item))
+        else:
+            product = by_name.get((item.get('product_name') or '').strip().lower())
+        if product is None:
+            errors.setdefault(index, {})['product'] = ["Product does not exist."]
+        try:
+            quantity = _quantity_field.run_validation(item.get('quantity', 1))
+        except serializers.ValidationError as e:
+            errors.setdefault(index, {})['quantity'] = [str(message) for message in e.detail]
+            continue
+        if product is not None:
+            lines.append(CheckoutLine(
+                index=index,
+                product=product,
+                quantity=quantity,
+                unit_price=item.get('unit_price', item.get('price', product.price)),
+            ))
+    if errors:
+        raise InvalidItems(errors)
+    return lines
+
+
+def place_paid_order(order_fields, lines, payment_fields, notes):
+    """
+    Write a paid order in one transaction: the order (and its shipping
+    address, if not saved yet), its stock, its items, the payment and the
+    status update. Raises InsufficientStock, leaving nothing written, if
+    any line is short.
+    """
+    with transaction.atomic():
+        shipping_address = order_fields.get('shipping_address')
+        if shipping_address is not None and shipping_address.pk is None:
+            shipping_address.save()
+        order = Order.objects.create(**order_fields)
+
+        take_stock((line.product.pk, line.quantity) for line in lines)
+
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=line.product, quantity=line.quantity, unit_price=line.unit_price)
+            for line in lines
+        ])
+        OrderPayment.objects.create(order=order, **payment_fields)
+        OrderUpdate.objects.create(order=order, status=order.status, notes=notes)
+    return order
@@ -0,0 +1,173 @@
+# orders/idempotency.py
+"""
+Idempotency keys for the order-submitting endpoints.
+
+A client that may retry a request (e.g. a mobile app after a timeout) sends
+the same `Idempotency-Key` header with every attempt. The first attempt
+claims the key by inserting an IdempotencyRecord; the unique (scope, key)
+constraint makes the claim atomic across workers. Its response is stored
+on the record and replayed to later attempts, so the order, its items and
+its payment are written once.
+
+- A retry while the first attempt is still running gets 409 and a
+  Retry-After header instead of running the checkout a second time.
+- Reusing a key for a different request (another endpoint or body) gets
+  422.
+- Server errors (5xx) and conflicts worth retrying (409, 429) are not
+  stored: the key is released and the next attempt runs normally.
+- Keys are scoped per user, and per session for guests; guests without a
+  session cannot be told apart, so their keys are ignored.
+- Records are kept for IDEMPOTENCY_KEY_TTL seconds; an in-progress claim
+  older than IDEMPOTENCY_LOCK_TIMEOUT seconds (its request died) can be
+  taken over by a retry. `purge_idempotency_keys` deletes expired records.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)
+LOCK_TIMEOUT = getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60)
+MAX_KEY_LENGTH = 255
+# Responses that are worth retrying with the same key later
+UNSTORED_STATUSES = {status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS}
+
+
+def request_scope(request):
+    """
+    Namespace of the request's keys: the user, or for guests their session.
+    None for guests without a session, whose keys cannot be told apart from
+    other guests' and are ignored.
+    """
+    user = request.user
+    if user.is_authenticated:
+        return f'user:{user.pk}'
+    session = getattr(request, 'session', None)
+    session_key = session.session_key if session is not None else None
+    return f'session:{session_key}' if session_key else None
+
+
+def request_fingerprint(request):
+    """Hash of what makes two requests "the same": method, path and parsed body."""
+    data = request.data
+    if hasattr(data, 'lists'):
+        # Form data (QueryDict)
+        data = sorted(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def claim(scope, key, fingerprint):
+    """
+    Claim a key for a new request. Returns (record, claimed); when not
+    claimed, the record is the existing one for the key.
+    """
+    now = timezone.now()
+    claimed_fields = {
+        'fingerprint': fingerprint,
+        'status': IdempotencyRecord.Status.IN_PROGRESS,
+        'response_status': None,
+        'response_body': None,
+        'locked_until': now + timedelta(seconds=LOCK_TIMEOUT),
+        'expires_at': now + timedelta(seconds=KEY_TTL),
+    }
+    # Retries are the common case for an existing key: answer them with one read
+    record = IdempotencyRecord.objects.filter(scope=scope, key=key).first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                return IdempotencyRecord.objects.create(scope=scope, key=key, **claimed_fields), True
+        except IntegrityError:
+            # Claimed by a concurrent request since the read
+            return claim(scope, key, fingerprint)
+
+    abandoned = record.status == IdempotencyRecord.Status.IN_PROGRESS and record.locked_until <= now
+    if record.expires_at <= now or abandoned:
+        # Take over only if nobody else did since we read the record
+        taken = IdempotencyRecord.objects.filter(
+            pk=record.pk, status=record.status, locked_until=record.locked_until,
+        ).update(**claimed_fields)
+        if not taken:
+            return claim(scope, key, fingerprint)
+        record.refresh_from_db()
+        return record, True
+    return record, False
+
+
+def complete(record, response):
+    IdempotencyRecord.objects.filter(pk=record.pk).update(
+        status=IdempotencyRecord.Status.COMPLETED,
+        response_status=response.status_code,
+        response_body=response.data,
+    )
+
+
+def release(record):
+    IdempotencyRecord.objects.filter(pk=record.pk, status=IdempotencyRecord.Status.IN_PROGRESS).delete()
+
+
+def purge_expired(now=None):
+    """Delete records past their expiry. Returns the count."""
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
+
+
+def idempotent(view_method):
+    """
+    Make a DRF view method honour the Idempotency-Key header. Requests
+    without the header, or without a scope for it (guests without a
+    session), are handled as before.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        # Also skips views called from another idempotent view with the same request
+        if not key or getattr(request, '_idempotency_record', None) is not None:
+            return view_method(self, request, *args, **kwargs)
+        scope = request_scope(request)
+        if scope is None:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({
+                'success': False,
+                'message': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, claimed = claim(scope, key, fingerprint)
+        if not claimed:
+            if record.fingerprint != fingerprint:
+                return Response({
+                    'success': False,
+                    'message': f'This {IDEMPOTENCY_HEADER} was already used for a different request.'
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record.status == IdempotencyRecord.Status.COMPLETED:
+                return Response(record.response_body, status=record.response_status, headers={REPLAYED_HEADER: 'true'})
+            retry_after = max(1, int((record.locked_until - timezone.now()).total_seconds()))
+            return Response({
+                'success': False,
+                'message': 'A request with this Idempotency-Key is still being processed.'
+            }, status=status.HTTP_409_CONFLICT, headers={'Retry-After': str(min(retry_after, 5))})
+
+        request._idempotency_record = record
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            release(record)
+            raise
+        if response.status_code >= 500 or response.status_code in UNSTORED_STATUSES:
+            release(record)
+        else:
+            complete(record, response)
+        return response
+    return wrapper
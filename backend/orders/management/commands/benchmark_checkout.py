@@ -0,0 +1,164 @@
+# orders/management/commands/benchmark_checkout.py
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from orders.checkout import place_paid_order, resolve_lines
+from orders.models import Order, OrderItem, OrderPayment, OrderUpdate, ShippingMethod
+from products.models import Category, Product, SubCategory
+from shops.models import Shop
+from users.models import Address
+
+User = get_user_model()
+
+MODES = ['legacy', 'batched']
+
+
+def _checkout_legacy(order_fields, items, payment_fields, notes):
+    # The previous confirm-payment path: one lookup per item (a name scan when
+    # only a name is given), one INSERT per item, each statement committed on its own
+    order = Order.objects.create(**order_fields)
+    for item in items:
+        try:
+            if 'product' in item:
+                product = Product.objects.get(id=item['product'])
+            else:
+                product = Product.objects.filter(name__icontains=item['product_name']).first()
+        except Exception:
+            continue
+        if product:
+            OrderItem.objects.create(order=order, product=product, quantity=item['quantity'], unit_price=product.price)
+    OrderPayment.objects.create(order=order, **payment_fields)
+    OrderUpdate.objects.create(order=order, status=order.status, notes=notes)
+    return order
+
+
+def _checkout_batched(order_fields, items, payment_fields, notes):
+    return place_paid_order(order_fields, resolve_lines(items), payment_fields, notes)
+
+
+CHECKOUTS = {
+    'legacy': _checkout_legacy,
+    'batched': _checkout_batched,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the confirm-payment checkout path against the configured database: '
+        'the legacy per-item lookups and inserts against the batched, single-transaction '
+        'service in orders.checkout. Seeds and removes its own products and orders.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=200, help='Checkouts per mode (default: 200)')
+        parser.add_argument('--items', type=int, default=20, help='Items per cart (default: 20)')
+        parser.add_argument('--catalog', type=int, default=5000, help='Products to seed (default: 5000)')
+        parser.add_argument(
+            '--lookup',
+            choices=['id', 'name', 'mixed'],
+            default='mixed',
+            help='How cart items reference products: by id, by name, or half and half (default: mixed)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES,
+            action='append',
+            help='Checkout path to run (may be repeated; default: all)',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['checkouts'], options['items'], options['catalog']) < 1:
+            raise CommandError('--checkouts, --items and --catalog must be positive')
+        if options['items'] > options['catalog']:
+            raise CommandError('--items cannot exceed --catalog')
+
+        self.stdout.write(
+            f'Database: {connection.vendor}, {options["checkouts"]} checkouts of {options["items"]} items '
+            f'by {options["lookup"]}, {options["catalog"]} products'
+        )
+        products, context, cleanup = self.seed(options['catalog'], options['checkouts'] * options['items'])
+        try:
+            for mode in options['mode'] or MODES:
+                self.run(mode, products, context, options)
+        finally:
+            cleanup()
+
+    def seed(self, count, stock):
+        tag = uuid.uuid4().hex[:8]
+        owner = User.objects.create_user(f'bench-{tag}@example.com', uuid.uuid4().hex, name='Benchmark')
+        shop = Shop.objects.create(owner=owner, name=f'Benchmark {tag}', slug=f'bench-{tag}', contact_email=owner.email)
+        category = Category.objects.create(name=f'Benchmark {tag}', slug=f'bench-{tag}')
+        sub_category = SubCategory.objects.create(name=f'Benchmark {tag}', slug=f'bench-{tag}', category=category)
+        products = Product.objects.bulk_create([
+            Product(
+                shop=shop, name=f'Benchmark {tag} product {i}', slug=f'bench-{tag}-{i}',
+                sub_category=sub_category, price=10, stock=stock,
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        address = Address.objects.create(
+            user=owner, address_line_1='1 Benchmark Street', city='Dhaka', state='Dhaka', postal_code='1000', country='Bangladesh',
+        )
+        shipping_method = ShippingMethod.objects.create(name=f'Benchmark {tag}', price=5)
+        context = {'user': owner, 'address': address, 'shipping_method': shipping_method}
+
+        def cleanup():
+            Order.objects.filter(user=owner).delete()
+            Product.objects.filter(sub_category=sub_category).delete()
+            sub_category.delete()
+            category.delete()
+            shipping_method.delete()
+            owner.delete()
+        return products, context, cleanup
+
+    def cart(self, rng, products, options):
+        items = []
+        for position, product in enumerate(rng.sample(products, options['items'])):
+            by_name = options['lookup'] == 'name' or (options['lookup'] == 'mixed' and position % 2)
+            # Names are sent upper-cased, as free text from the client might be
+            reference = {'product_name': product.name.upper()} if by_name else {'product': str(product.pk)}
+            items.append({**reference, 'quantity': rng.randint(1, 3)})
+        return items
+
+    def run(self, mode, products, context, options):
+        checkout = CHECKOUTS[mode]
+        rng = random.Random(0)
+        latencies, queries = [], []
+        for number in range(options['checkouts']):
+            items = self.cart(rng, products, options)
+            order_fields = {
+                'user': context['user'],
+                'total_amount': 100,
+                'cart_subtotal': 95,
+                'status': Order.OrderStatus.PROCESSING,
+                'payment_status': Order.PaymentStatus.PAID,
+                'shipping_address': context['address'],
+                'shipping_method': context['shipping_method'],
+                'tracking_number': f'TRK-BENCH-{number}',
+            }
+            payment_fields = {
+                'sender_number': '01700000000',
+                'transaction_id': f'bench-{uuid.uuid4().hex}',
+                'payment_method': 'bkash',
+            }
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                checkout(order_fields, items, payment_fields, 'Benchmark checkout')
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+            reset_queries()
+
+        latencies.sort()
+        self.stdout.write(f'\n{mode}')
+        self.stdout.write(
+            f'  p50 {statistics.median(latencies):7.2f} ms   '
+            f'p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:7.2f} ms   '
+            f'{statistics.mean(queries):.0f} queries per checkout'
+        )
+        self.stdout.write(self.style.SUCCESS(f'  {len(latencies)} checkouts done!'))
@@ -0,0 +1,179 @@
+# orders/management/commands/benchmark_stock_contention.py
+import multiprocessing
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from orders.stock import InsufficientStock, take_stock
+from products.models import Category, Product, SubCategory
+from shops.models import Shop
+
+User = get_user_model()
+
+STRATEGIES = ['conditional', 'select_for_update', 'read_then_write']
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def _checkout_select_for_update(lines):
+    # Lock every product row of the cart, check, then update line by line
+    with transaction.atomic():
+        ids = sorted({product_id for product_id, _ in lines})
+        stock = dict(Product.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', 'stock'))
+        for product_id, quantity in lines:
+            if stock[product_id] < quantity:
+                raise OutOfStock
+            stock[product_id] -= quantity
+        for product_id, quantity in lines:
+            Product.objects.filter(pk=product_id).update(stock=F('stock') - quantity)
+
+
+def _checkout_read_then_write(lines):
+    # The racy pattern: check stock read earlier, then write absolute values
+    with transaction.atomic():
+        stock = dict(Product.objects.filter(pk__in=[product_id for product_id, _ in lines]).values_list('pk', 'stock'))
+        for product_id, quantity in lines:
+            if stock[product_id] < quantity:
+                raise OutOfStock
+            stock[product_id] -= quantity
+        for product_id, remaining in stock.items():
+            Product.objects.filter(pk=product_id).update(stock=remaining)
+
+
+def _checkout_conditional(lines):
+    try:
+        take_stock(lines)
+    except InsufficientStock:
+        raise OutOfStock
+
+
+CHECKOUTS = {
+    'conditional': _checkout_conditional,
+    'select_for_update': _checkout_select_for_update,
+    'read_then_write': _checkout_read_then_write,
+}
+
+
+def _worker(args):
+    """Run checkouts in a child process; returns (latencies ms, units sold, rejected, errors)."""
+    strategy, product_ids, checkouts, max_lines, seed = args
+    rng = random.Random(seed)
+    checkout = CHECKOUTS[strategy]
+    latencies, sold, rejected, errors = [], 0, 0, 0
+    for _ in range(checkouts):
+        lines = [(product_id, rng.randint(1, 3)) for product_id in rng.sample(product_ids, rng.randint(1, max_lines))]
+        started = time.perf_counter()
+        try:
+            checkout(lines)
+            sold += sum(quantity for _, quantity in lines)
+        except OutOfStock:
+            rejected += 1
+        except DatabaseError:
+            # e.g. "database is locked" on SQLite, serialization failures on PostgreSQL
+            errors += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    connections.close_all()
+    return latencies, sold, rejected, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark concurrent checkouts from several processes against the configured '
+        'database: the conditional single-statement stock update against per-line '
+        'SELECT ... FOR UPDATE and an unguarded read-then-write. Seeds and removes its own products.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8, help='Concurrent worker processes (default: 8)')
+        parser.add_argument('--checkouts', type=int, default=200, help='Checkouts per process (default: 200)')
+        parser.add_argument('--products', type=int, default=10, help='Products competed for (default: 10)')
+        parser.add_argument('--stock', type=int, default=500, help='Initial stock per product (default: 500)')
+        parser.add_argument('--lines', type=int, default=3, help='Maximum lines per cart (default: 3)')
+        parser.add_argument(
+            '--strategy',
+            choices=STRATEGIES,
+            action='append',
+            help='Strategy to run (may be repeated; default: all)',
+        )
+        parser.add_argument(
+            '--wal',
+            action='store_true',
+            help='On SQLite, switch the database to WAL journal mode first (persists in the file)',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['processes'], options['checkouts'], options['products'], options['lines']) < 1:
+            raise CommandError('--processes, --checkouts, --products and --lines must be positive')
+        if options['lines'] > options['products']:
+            raise CommandError('--lines cannot exceed --products')
+
+        connection = connections['default']
+        if connection.vendor == 'sqlite' and options['wal']:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+                self.stdout.write(f'SQLite journal mode: {cursor.fetchone()[0]}')
+        self.stdout.write(f'Database: {connection.vendor}, {options["processes"]} processes x {options["checkouts"]} checkouts')
+
+        product_ids, cleanup = self.seed(options['products'], options['stock'])
+        try:
+            for strategy in options['strategy'] or STRATEGIES:
+                Product.objects.filter(pk__in=product_ids).update(stock=options['stock'])
+                self.run(strategy, product_ids, options)
+        finally:
+            cleanup()
+
+    def seed(self, count, stock):
+        tag = uuid.uuid4().hex[:8]
+        owner = User.objects.create_user(f'bench-{tag}@example.com', uuid.uuid4().hex, name='Benchmark')
+        shop = Shop.objects.create(owner=owner, name=f'Benchmark {tag}', slug=f'bench-{tag}', contact_email=owner.email)
+        category = Category.objects.create(name=f'Benchmark {tag}', slug=f'bench-{tag}')
+        sub_category = SubCategory.objects.create(name=f'Benchmark {tag}', slug=f'bench-{tag}', category=category)
+        products = Product.objects.bulk_create([
+            Product(shop=shop, name=f'Benchmark product {i}', slug=f'bench-{tag}-{i}', sub_category=sub_category, price=10, stock=stock)
+            for i in range(count)
+        ])
+
+        def cleanup():
+            Product.objects.filter(sub_category=sub_category).delete()
+            sub_category.delete()
+            category.delete()
+            owner.delete()
+        return [product.pk for product in products], cleanup
+
+    def run(self, strategy, product_ids, options):
+        initial = options['stock'] * len(product_ids)
+        jobs = [
+            (strategy, product_ids, options['checkouts'], options['lines'], seed)
+            for seed in range(options['processes'])
+        ]
+        # Children must not inherit the parent's open connection
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        with context.Pool(options['processes']) as pool:
+            results = pool.map(_worker, jobs)
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for result in results for latency in result[0])
+        sold = sum(result[1] for result in results)
+        rejected = sum(result[2] for result in results)
+        errors = sum(result[3] for result in results)
+        remaining = sum(Product.objects.filter(pk__in=product_ids).values_list('stock', flat=True))
+        oversold = sold - (initial - remaining)
+
+        self.stdout.write(f'\n{strategy}')
+        self.stdout.write(
+            f'  {len(latencies) / elapsed:8.1f} checkouts/s   '
+            f'p50 {statistics.median(latencies):7.1f} ms   '
+            f'p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:7.1f} ms'
+        )
+        self.stdout.write(f'  {sold} units sold, {rejected} carts rejected, {errors} database errors, {remaining} units left')
+        style = self.style.ERROR if oversold else self.style.SUCCESS
+        self.stdout.write(style(f'  oversold units: {oversold}'))
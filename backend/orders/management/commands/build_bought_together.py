@@ -0,0 +1,51 @@
+# orders/management/commands/build_bought_together.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from orders.recommendations import MIN_SUPPORT, ORDER_CHUNK_SIZE, TOP_K, build_associations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild "frequently bought together" product pairs from order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help=f'Pairs stored per product (default: {TOP_K})',
+        )
+        parser.add_argument(
+            '--min-support',
+            type=int,
+            default=MIN_SUPPORT,
+            help=f'Minimum number of orders a pair must appear in (default: {MIN_SUPPORT})',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=ORDER_CHUNK_SIZE,
+            help=f'Orders read per chunk (default: {ORDER_CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        for name in ('top_k', 'min_support', 'chunk_size'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be positive')
+
+        started = time.monotonic()
+
+        def report(counts):
+            self.stdout.write(f'  {counts.orders} orders read, {len(counts.keys)} distinct pairs')
+
+        self.stdout.write('Mining order baskets...')
+        result = build_associations(
+            top_k=options['top_k'],
+            min_support=options['min_support'],
+            chunk_size=options['chunk_size'],
+            progress=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {result.rows} product pairs from {result.orders} orders '
+            f'({result.pairs} distinct pairs) in {time.monotonic() - started:.1f}s!'
+        ))
@@ -0,0 +1,11 @@
+# orders/management/commands/purge_idempotency_keys.py
+from django.core.management.base import BaseCommand
+from orders.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency records of order submissions (run daily from cron)'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency records!'))
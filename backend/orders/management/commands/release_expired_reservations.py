@@ -0,0 +1,21 @@
+# orders/management/commands/release_expired_reservations.py
+from django.core.management.base import BaseCommand, CommandError
+from orders.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired checkout reservations (run every minute or so from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Reservations expired per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        expired = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {expired} expired reservations!'))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_initial'),
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-ordered_at'], name='order_user_ordered_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderupdate',
+            index=models.Index(fields=['order', '-timestamp'], name='orderupdate_order_time_idx'),
+        ),
+    ]
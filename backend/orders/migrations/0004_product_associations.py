@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_indexes'),
+        ('products', '0008_similar_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAssociation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('support', models.PositiveIntegerField(help_text='Number of orders containing both products')),
+                ('confidence', models.FloatField(help_text="Share of the product's orders that also contain the associated product")),
+                ('lift', models.FloatField(help_text='Confidence relative to how often the associated product is bought at all')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('associated', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='associated_with', to='products.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='associations', to='products.product')),
+            ],
+            options={
+                'ordering': ['product', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='productassociation_product_rank_uniq'), models.UniqueConstraint(fields=('product', 'associated'), name='productassociation_pair_uniq')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 # orders/models.py
 import uuid
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
@@ -251,6 +252,12 @@ class Order(models.Model):
     
     ordered_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A customer's order history, newest first
+            models.Index(fields=['user', '-ordered_at'], name='order_user_ordered_at_idx'),
+        ]
+
     def __str__(self):
         return str(self.order_number)
     
@@ -273,6 +280,69 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity} of {self.product.name}"
 
+class StockReservation(models.Model):
+    """
+    Stock set aside for a cart during checkout. Reserving decrements
+    Product.stock right away; the reservation is either consumed by the
+    order it becomes, released by the customer, or expired and returned to
+    stock by `release_expired_reservations`. See orders/stock.py.
+    """
+    class Status(models.TextChoices):
+        ACTIVE = 'ACTIVE', 'Active'
+        CONSUMED = 'CONSUMED', 'Consumed'
+        RELEASED = 'RELEASED', 'Released'
+        EXPIRED = 'EXPIRED', 'Expired'
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_reservations')
+    order = models.ForeignKey('Order', on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_reservations')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.ACTIVE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The expiry sweep only looks at active reservations
+            models.Index(fields=['expires_at'], condition=models.Q(status='ACTIVE'), name='reservation_active_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reservation {self.token} ({self.status})"
+
+class StockReservationLine(models.Model):
+    reservation = models.ForeignKey(StockReservation, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_reservation_lines')
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.quantity} of {self.product_id}"
+
+class ProductAssociation(models.Model):
+    """
+    "Frequently bought together" pair mined from order baskets by
+    orders.recommendations (the `build_bought_together` command): customers
+    who bought `product` also bought `associated`. Rows are the top pairs per
+    product by lift, ranked from 1.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='associations')
+    associated = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='associated_with')
+    support = models.PositiveIntegerField(help_text="Number of orders containing both products")
+    confidence = models.FloatField(help_text="Share of the product's orders that also contain the associated product")
+    lift = models.FloatField(help_text="Confidence relative to how often the associated product is bought at all")
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='productassociation_product_rank_uniq'),
+            models.UniqueConstraint(fields=['product', 'associated'], name='productassociation_pair_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.associated_id} bought with {self.product_id} (lift {self.lift:.2f})"
+
 class OrderUpdate(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='updates')
     status = models.CharField(max_length=20, choices=Order.OrderStatus.choices)
@@ -281,6 +351,9 @@ class OrderUpdate(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['order', '-timestamp'], name='orderupdate_order_time_idx'),
+        ]
 
     def __str__(self):
         return f"Update for {self.order.order_number} at {self.timestamp}"
@@ -305,3 +378,36 @@ class OrderPayment(models.Model):
 
     def __str__(self):
         return f"Payment for {self.order.order_number} - {self.get_payment_method_display()}"
+
+class IdempotencyRecord(models.Model):
+    """
+    Outcome of an order-submitting request sent with an Idempotency-Key
+    header, so retries of it are answered without repeating its writes. See
+    orders/idempotency.py.
+    """
+    class Status(models.TextChoices):
+        IN_PROGRESS = 'IN_PROGRESS', 'In progress'
+        COMPLETED = 'COMPLETED', 'Completed'
+
+    # "user:<id>" or "anonymous": the same key from different users never collides
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="Hash of the method, path and body of the first request")
+    status = models.CharField(max_length=12, choices=Status.choices, default=Status.IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # An in-progress record older than this belongs to a request that died
+    locked_until = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotencyrecord_scope_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status})"
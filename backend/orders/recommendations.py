@@ -0,0 +1,171 @@
+# orders/recommendations.py
+"""
+"Frequently bought together" recommendations mined from order baskets.
+
+Orders are streamed in chunks of ids. Every chunk is turned into NumPy
+arrays of (order, product) codes, from which all product pairs per basket
+are generated without Python loops and counted with np.unique. Counts are
+accumulated in a sparse, COO-style pair of arrays (sorted pair keys and
+their counts), so memory grows with the number of distinct pairs rather
+than with the number of orders or the square of the catalog.
+
+Pairs are scored by lift: how much more often two products share a basket
+than they would if bought independently. The top pairs per product are
+stored in ProductAssociation and served by the bought-together endpoint.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from products.cache import CATALOG, invalidate
+from products.models import Product
+from .models import Order, OrderItem, ProductAssociation
+
+TOP_K = 10
+# Pairs seen in fewer orders are noise, however high their lift
+MIN_SUPPORT = 2
+ORDER_CHUNK_SIZE = 2000
+# Larger baskets (bulk or wholesale orders) say little about affinity and
+# would add a quadratic number of pairs, so they are skipped
+MAX_BASKET_SIZE = 50
+
+
+@dataclass
+class MiningResult:
+    orders: int = 0
+    pairs: int = 0
+    rows: int = 0
+
+
+class CooccurrenceCounts:
+    """
+    Sparse symmetric product x product co-occurrence matrix. Only the upper
+    triangle is stored, as sorted keys (row * size + column, row < column)
+    with matching counts.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.product_orders = np.zeros(size, dtype=np.int64)
+        self.orders = 0
+
+    def add_baskets(self, order_ids, product_codes):
+        """Count one chunk of order items, given as parallel arrays."""
+        if not len(order_ids):
+            return
+        _, orders = np.unique(order_ids, return_inverse=True)
+        # Distinct (order, product) pairs, sorted by order then product
+        items = np.unique(orders.astype(np.int64) * self.size + product_codes)
+        orders, products = np.divmod(items, self.size)
+
+        starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+        lengths = np.diff(np.r_[starts, len(items)])
+        small = lengths <= MAX_BASKET_SIZE
+        products = products[np.repeat(small, lengths)]
+        lengths = lengths[small]
+        starts = np.cumsum(lengths) - lengths
+
+        self.orders += len(lengths)
+        self.product_orders += np.bincount(products, minlength=self.size)
+
+        # Pair every item with the items after it in the same basket
+        positions = np.arange(len(products))
+        partners = np.repeat(starts + lengths, lengths) - positions - 1
+        left = np.repeat(positions, partners)
+        offsets = np.arange(len(left)) - np.repeat(np.cumsum(partners) - partners, partners)
+        right = left + 1 + offsets
+        keys, counts = np.unique(products[left] * self.size + products[right], return_counts=True)
+        self._merge(keys, counts)
+
+    def _merge(self, keys, counts):
+        if not len(keys):
+            return
+        keys = np.concatenate([self.keys, keys])
+        counts = np.concatenate([self.counts, counts])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts).astype(np.int64)
+
+    def top_pairs(self, top_k=TOP_K, min_support=MIN_SUPPORT):
+        """
+        Directed pairs (product, associated, support, confidence, lift, rank)
+        as arrays, keeping the `top_k` highest-lift partners per product.
+        """
+        frequent = self.counts >= min_support
+        rows, columns = np.divmod(self.keys[frequent], self.size)
+        support = self.counts[frequent]
+        products = np.concatenate([rows, columns])
+        associated = np.concatenate([columns, rows])
+        support = np.concatenate([support, support])
+
+        confidence = support / self.product_orders[products]
+        lift = confidence * self.orders / self.product_orders[associated]
+
+        order = np.lexsort((associated, -support, -lift, products))
+        products, associated = products[order], associated[order]
+        support, confidence, lift = support[order], confidence[order], lift[order]
+        starts = np.flatnonzero(np.r_[True, products[1:] != products[:-1]])
+        group_sizes = np.diff(np.r_[starts, len(products)])
+        ranks = np.arange(len(products)) - np.repeat(starts, group_sizes) + 1
+        top = ranks <= top_k
+        return products[top], associated[top], support[top], confidence[top], lift[top], ranks[top]
+
+
+def order_item_chunks(chunk_size=ORDER_CHUNK_SIZE):
+    """Yield lists of (order id, product id) for consecutive ranges of non-cancelled orders."""
+    orders = Order.objects.exclude(status=Order.OrderStatus.CANCELLED).order_by('pk')
+    last_id = 0
+    while True:
+        ids = list(orders.filter(pk__gt=last_id).values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield list(
+            OrderItem.objects.filter(order_id__gte=ids[0], order_id__lte=last_id)
+            .exclude(order__status=Order.OrderStatus.CANCELLED)
+            .values_list('order_id', 'product_id')
+        )
+
+
+def build_associations(top_k=TOP_K, min_support=MIN_SUPPORT, chunk_size=ORDER_CHUNK_SIZE, progress=None):
+    """
+    Rebuild ProductAssociation from all order baskets. `progress` is called
+    with the running CooccurrenceCounts after every chunk.
+    """
+    computed_at = timezone.now()
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    codes = {product_id: code for code, product_id in enumerate(product_ids)}
+    counts = CooccurrenceCounts(len(product_ids))
+
+    for items in order_item_chunks(chunk_size):
+        # Products created while mining are not in the code table yet
+        items = [(order_id, codes[product_id]) for order_id, product_id in items if product_id in codes]
+        if items:
+            items = np.array(items, dtype=np.int64)
+            counts.add_baskets(items[:, 0], items[:, 1])
+        if progress:
+            progress(counts)
+
+    products, associated, support, confidence, lift, ranks = counts.top_pairs(top_k, min_support)
+    rows = [
+        ProductAssociation(
+            product_id=product_ids[product],
+            associated_id=product_ids[partner],
+            support=int(pair_support),
+            confidence=round(float(pair_confidence), 6),
+            lift=round(float(pair_lift), 6),
+            rank=int(rank),
+            computed_at=computed_at,
+        )
+        for product, partner, pair_support, pair_confidence, pair_lift, rank
+        in zip(products, associated, support, confidence, lift, ranks)
+    ]
+    with transaction.atomic():
+        ProductAssociation.objects.all().delete()
+        ProductAssociation.objects.bulk_create(rows, batch_size=2000)
+        # Served through the catalog response cache
+        invalidate(CATALOG)
+    return MiningResult(orders=counts.orders, pairs=len(counts.keys), rows=len(rows))
@@ -6,48 +6,27 @@ from rest_framework.response import Response
 from django.db import transaction
 from django.contrib.auth import get_user_model
 from decimal import Decimal
-from .models import Order, OrderItem, OrderUpdate, ShippingMethod, OrderPayment, Coupon, ShippingTier
+from .models import Order, OrderItem, OrderUpdate, ShippingMethod, OrderPayment, Coupon, ShippingTier, StockReservation, StockReservationLine
 from products.models import Product, Color, Size
 from products.serializers import ColorSerializer, SizeSerializer
 from users.models import Address
+from .stock import InsufficientStock, consume, take_stock
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 # New serializers for order creation with atomic transactions
 class OrderItemCreateSerializer(serializers.Serializer):
-    """Serializer for order items (write-only)"""
-    product = serializers.IntegerField()
+    """
+    Serializer for order items (write-only). Products, colors and sizes are
+    checked for the whole list at once by OrderCreateSerializer.validate_items,
+    which replaces the ids with the resolved objects.
+    """
+    product = serializers.UUIDField()
     color = serializers.IntegerField(allow_null=True, required=False)
     size = serializers.IntegerField(allow_null=True, required=False)
     quantity = serializers.IntegerField(min_value=1)
     unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, read_only=True)
-    
-    def validate_product(self, value):
-        """Validate that product exists"""
-        try:
-            product = Product.objects.get(id=value)
-            return value
-        except Product.DoesNotExist:
-            raise serializers.ValidationError("Product does not exist.")
-    
-    def validate_color(self, value):
-        """Validate that color exists if provided"""
-        if value is not None:
-            try:
-                Color.objects.get(id=value)
-            except Color.DoesNotExist:
-                raise serializers.ValidationError("Color does not exist.")
-        return value
-    
-    def validate_size(self, value):
-        """Validate that size exists if provided"""
-        if value is not None:
-            try:
-                Size.objects.get(id=value)
-            except Size.DoesNotExist:
-                raise serializers.ValidationError("Size does not exist.")
-        return value
 
 class OrderPaymentCreateSerializer(serializers.Serializer):
     """Serializer for order payment"""
@@ -67,21 +46,51 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     items = OrderItemCreateSerializer(many=True, write_only=True)
     payment = OrderPaymentCreateSerializer(write_only=True, required=False)
     coupon_code = serializers.CharField(max_length=50, required=False, write_only=True)
+    reservation = serializers.UUIDField(required=False, write_only=True, help_text="Token of the cart's stock reservation, if any")
     
     class Meta:
         model = Order
         fields = [
             'customer_name', 'customer_email', 'customer_phone',
             'shipping_address', 'shipping_method', 'items',
-            'coupon_code', 'payment', 'order_number', 'total_amount',
+            'coupon_code', 'reservation', 'payment', 'order_number', 'total_amount',
             'cart_subtotal', 'status', 'payment_status', 'ordered_at'
         ]
         read_only_fields = ['order_number', 'total_amount', 'cart_subtotal', 'status', 'payment_status', 'ordered_at']
     
     def validate_items(self, value):
-        """Validate that items list is not empty"""
+        """
+        Validate that the items list is not empty and that every referenced
+        product, color and size exists, with one query per model. Errors are
+        reported per item index, like nested field errors; valid items get
+        the resolved objects in place of their ids.
+        """
         if not value:
             raise serializers.ValidationError("At least one item is required.")
+        
+        references = [
+            ('product', Product.objects.defer('description', 'description_html'), "Product does not exist."),
+            ('color', Color.objects.all(), "Color does not exist."),
+            ('size', Size.objects.all(), "Size does not exist."),
+        ]
+        resolved = {}
+        for field, queryset, _ in references:
+            ids = {item[field] for item in value if item.get(field) is not None}
+            resolved[field] = queryset.in_bulk(ids)
+        
+        errors = [{} for _ in value]
+        for item, item_errors in zip(value, errors):
+            for field, _, message in references:
+                if item.get(field) is not None and item[field] not in resolved[field]:
+                    item_errors[field] = [message]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        
+        # Hand the objects to create() so they are not fetched again
+        for item in value:
+            for field, _, _ in references:
+                if item.get(field) is not None:
+                    item[field] = resolved[field][item[field]]
         return value
     
     def validate_shipping_address(self, value):
@@ -108,6 +117,7 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             items_data = validated_data.pop('items')
             payment_data = validated_data.pop('payment', None)
             coupon_code = validated_data.pop('coupon_code', None)
+            reservation_token = validated_data.pop('reservation', None)
             
             # Get user from request context if available
             request = self.context.get('request')
@@ -120,17 +130,9 @@ class OrderCreateSerializer(serializers.ModelSerializer):
                     cart_items = []
                     total_quantity = 0
                     
+                    # Products were resolved by validate_items
                     for item_data in items_data:
-                        try:
-                            product = Product.objects.get(id=item_data['product'])
-                        except Product.DoesNotExist:
-                            logger.warning(f"Product not found: {item_data['product']}")
-                            raise serializers.ValidationError(f"Product with id {item_data['product']} does not exist.")
-                        except Exception as e:
-                            logger.exception(f"Error fetching product {item_data['product']}")
-                            traceback.print_exc()
-                            raise serializers.ValidationError(f"Error processing product {item_data['product']}: {str(e)}")
-                        
+                        product = item_data['product']
                         quantity = item_data['quantity']
                         unit_price = product.price
                         item_total = unit_price * quantity
@@ -252,35 +254,29 @@ class OrderCreateSerializer(serializers.ModelSerializer):
                         traceback.print_exc()
                         raise serializers.ValidationError(f"Error creating order: {str(e)}")
                     
+                    # Take stock for all lines at once; the cart's reservation, if
+                    # still active, is handed over to the order first
+                    if reservation_token:
+                        consume(reservation_token, order)
+                    try:
+                        take_stock((item['product'].pk, item['quantity']) for item in cart_items)
+                    except InsufficientStock as e:
+                        logger.warning(f"Insufficient stock for order {order.order_number}: {e.failures}")
+                        raise serializers.ValidationError({'items': e.line_errors(len(cart_items))})
+                    
                     # Create order items
                     try:
-                        for i, item_data in enumerate(items_data):
-                            product = Product.objects.get(id=item_data['product'])
-                            color = None
-                            size = None
-                            
-                            if item_data.get('color'):
-                                try:
-                                    color = Color.objects.get(id=item_data['color'])
-                                except Color.DoesNotExist:
-                                    logger.warning(f"Color not found: {item_data['color']}")
-                                    pass
-                            
-                            if item_data.get('size'):
-                                try:
-                                    size = Size.objects.get(id=item_data['size'])
-                                except Size.DoesNotExist:
-                                    logger.warning(f"Size not found: {item_data['size']}")
-                                    pass
-                            
-                            OrderItem.objects.create(
+                        order_items = []
+                        for item_data, cart_item in zip(items_data, cart_items):
+                            order_items.append(OrderItem(
                                 order=order,
-                                product=product,
-                                color=color,
-                                size=size,
-                                quantity=item_data['quantity'],
-                                unit_price=product.price
-                            )
+                                product=cart_item['product'],
+                                color=item_data.get('color'),
+                                size=item_data.get('size'),
+                                quantity=cart_item['quantity'],
+                                unit_price=cart_item['unit_price']
+                            ))
+                        OrderItem.objects.bulk_create(order_items)
                     except Exception as e:
                         logger.exception("Error creating order items")
                         traceback.print_exc()
@@ -354,6 +350,28 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             traceback.print_exc()
             raise serializers.ValidationError(f"Internal server error: {str(e)}")
 
+class StockReservationLineSerializer(serializers.ModelSerializer):
+    product = serializers.UUIDField(source='product_id')
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = StockReservationLine
+        fields = ['product', 'quantity']
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    """Checkout stock reservation; creating one takes the stock for its items"""
+    items = StockReservationLineSerializer(source='lines', many=True)
+
+    class Meta:
+        model = StockReservation
+        fields = ['token', 'status', 'expires_at', 'items']
+        read_only_fields = ['token', 'status', 'expires_at']
+
+    def validate_items(self, value):
+        if not value:
+            raise serializers.ValidationError("At least one item is required.")
+        return value
+
 # Read-only serializers for responses
 class OrderItemReadSerializer(serializers.ModelSerializer):
     """Read-only serializer for order items"""
@@ -474,11 +492,6 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'product', 'color', 'size', 'quantity', 'unit_price']
 
-class OrderItemCreateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = OrderItem
-        fields = ['product', 'color', 'size', 'quantity', 'unit_price']
-
 class OrderUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderUpdate
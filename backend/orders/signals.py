@@ -0,0 +1,13 @@
+# orders/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from products.cache import SHIPPING, invalidate
+from .models import ShippingMethod, ShippingTier
+
+
+@receiver([post_save, post_delete], sender=ShippingMethod)
+@receiver([post_save, post_delete], sender=ShippingTier)
+def invalidate_shipping_cache(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate(SHIPPING)
@@ -0,0 +1,207 @@
+# orders/stock.py
+"""
+Stock reservation for checkout.
+
+All lines of a cart are taken from Product.stock with one conditional
+UPDATE:
+
+    UPDATE product SET stock = stock - CASE id WHEN ... END
+     WHERE id IN (...) AND is_active AND stock >= CASE id WHEN ... END
+
+Each row's check and decrement happen atomically under the row lock the
+UPDATE takes anyway, so concurrent checkouts cannot oversell and never hold
+SELECT ... FOR UPDATE locks across round trips. If fewer rows than products
+were updated, some line was short: the statement is rolled back to its
+savepoint and a single SELECT works out which lines failed.
+
+Reservations hold stock for a cart for STOCK_RESERVATION_TTL seconds. They
+end consumed by an order, released by the customer, or expired by
+`release_expired_reservations`; the latter two return the stock with the
+same statement shape.
+
+Both directions touch Product.updated_at and retire the cached catalog
+responses once the transaction commits, since product pages, their
+validators and cached bodies all show the current stock.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from products.cache import CATALOG, invalidate
+from products.models import Product
+from .models import StockReservation, StockReservationLine
+
+RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', 60 * 15)
+# Retries when a shortfall disappears before it can be reported (restocked meanwhile)
+TAKE_ATTEMPTS = 3
+
+
+class InsufficientStock(Exception):
+    """
+    Some cart lines cannot be fulfilled. `failures` lists
+    {'line', 'product', 'requested', 'available'} dicts, `line` being the
+    index of the line in the request.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__(f"Insufficient stock for {len(failures)} line(s).")
+
+    def line_errors(self, line_count):
+        """Errors aligned with the request lines, as a nested serializer would report them."""
+        errors = [{} for _ in range(line_count)]
+        for failure in self.failures:
+            available = failure['available']
+            message = f"Only {available} left in stock." if available else "Out of stock."
+            errors[failure['line']] = {'quantity': [message]}
+        return errors
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def _totals(lines):
+    """
+    Total quantity per product for (product id, quantity) lines. Raises
+    ValueError for a quantity that is not a positive integer: a zero or
+    negative line would add stock instead of taking it.
+    """
+    totals = {}
+    for product_id, quantity in lines:
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            raise ValueError(f"Invalid quantity {quantity!r} for product {product_id}: must be a positive integer.")
+        totals[product_id] = totals.get(product_id, 0) + quantity
+    return totals
+
+
+def _per_product(totals):
+    return Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in totals.items()], output_field=IntegerField())
+
+
+def stock_failures(lines):
+    """Lines that current stock cannot cover, filling earlier lines first."""
+    available = dict(
+        Product.objects.filter(pk__in={product_id for product_id, _ in lines}, is_active=True)
+        .values_list('pk', 'stock')
+    )
+    failures = []
+    for line, (product_id, quantity) in enumerate(lines):
+        remaining = available.get(product_id, 0)
+        if quantity <= remaining:
+            available[product_id] = remaining - quantity
+        else:
+            failures.append({'line': line, 'product': product_id, 'requested': quantity, 'available': remaining})
+    return failures
+
+
+def take_stock(lines):
+    """
+    Decrement stock for all (product id, quantity) lines in one statement,
+    or raise InsufficientStock and leave stock untouched. Unknown and
+    inactive products count as out of stock; quantities must be positive
+    integers (ValueError otherwise).
+    """
+    lines = list(lines)
+    totals = _totals(lines)
+    if not totals:
+        return
+    quantity = _per_product(totals)
+    for _ in range(TAKE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                updated = Product.objects.filter(
+                    pk__in=list(totals), is_active=True, stock__gte=quantity,
+                ).update(stock=F('stock') - quantity, updated_at=Now())
+                if updated != len(totals):
+                    raise _Shortfall
+                invalidate(CATALOG)
+            return
+        except _Shortfall:
+            failures = stock_failures(lines)
+            if failures:
+                raise InsufficientStock(failures)
+    raise InsufficientStock(stock_failures(lines))
+
+
+def return_stock(totals):
+    """Add {product id: quantity} back to stock in one statement."""
+    if totals:
+        quantity = _per_product(totals)
+        Product.objects.filter(pk__in=list(totals)).update(stock=F('stock') + quantity, updated_at=Now())
+        invalidate(CATALOG)
+
+
+def _return_lines(lines):
+    return_stock(dict(lines.values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')))
+
+
+def reserve(lines, user=None, ttl=None):
+    """Take stock for (product id, quantity) lines and record it as a reservation."""
+    lines = list(lines)
+    totals = _totals(lines)
+    with transaction.atomic():
+        take_stock(lines)
+        reservation = StockReservation.objects.create(
+            user=user,
+            expires_at=timezone.now() + timedelta(seconds=RESERVATION_TTL if ttl is None else ttl),
+        )
+        StockReservationLine.objects.bulk_create([
+            StockReservationLine(reservation=reservation, product_id=product_id, quantity=quantity)
+            for product_id, quantity in totals.items()
+        ])
+    return reservation
+
+
+def _close(token, status, order=None):
+    with transaction.atomic():
+        # The status transition claims the reservation, so stock is returned exactly once
+        closed = StockReservation.objects.filter(token=token, status=StockReservation.Status.ACTIVE).update(
+            status=status, released_at=timezone.now(), order=order,
+        )
+        if closed:
+            _return_lines(StockReservationLine.objects.filter(reservation__token=token))
+    return bool(closed)
+
+
+def release(token):
+    """Give a reservation's stock back. False if it is no longer active."""
+    return _close(token, StockReservation.Status.RELEASED)
+
+
+def consume(token, order):
+    """
+    Hand a reservation's stock over to `order`, whose own lines must then be
+    taken with take_stock() in the same transaction. False if the
+    reservation is no longer active.
+    """
+    return _close(token, StockReservation.Status.CONSUMED, order)
+
+
+def release_expired(now=None, batch_size=500):
+    """Expire active reservations past their expiry and return their stock. Returns the count."""
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(status=StockReservation.Status.ACTIVE, expires_at__lte=now)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return expired
+        with transaction.atomic():
+            claimed_at = timezone.now()
+            claimed = StockReservation.objects.filter(pk__in=ids, status=StockReservation.Status.ACTIVE).update(
+                status=StockReservation.Status.EXPIRED, released_at=claimed_at,
+            )
+            if claimed:
+                _return_lines(StockReservationLine.objects.filter(
+                    reservation__in=ids,
+                    reservation__status=StockReservation.Status.EXPIRED,
+                    reservation__released_at=claimed_at,
+                ))
+        expired += claimed
@@ -1,3 +1,480 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+
+from products.models import Category, Color, Product, Size, SubCategory
+from products.view_counts import get_buffer
+from shops.models import Shop
+from users.models import Address, User
+from .models import (
+    IdempotencyRecord, Order, OrderItem, OrderPayment, OrderUpdate, ProductAssociation, ShippingMethod, StockReservation,
+)
+from .recommendations import build_associations
+from .serializers import OrderCreateSerializer
+from .stock import InsufficientStock, consume, release, release_expired, reserve, take_stock
+
+
+class OrderIndexUsageTests(TestCase):
+    """Order history lookups should be answered from the composite indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer@example.com', 'password', name='Customer')
+        cls.order = Order.objects.create(user=cls.user, total_amount=10)
+        OrderUpdate.objects.create(order=cls.order, status=Order.OrderStatus.PENDING)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_user_orders_newest_first(self):
+        self.assertUsesIndex(
+            Order.objects.filter(user=self.user).order_by('-ordered_at'),
+            'order_user_ordered_at_idx',
+        )
+
+    def test_order_updates_timeline(self):
+        self.assertUsesIndex(
+            OrderUpdate.objects.filter(order=self.order),
+            'orderupdate_order_time_idx',
+        )
+
+
+class CheckoutFixtures:
+    """A customer with a default address, a shop with `product_count` stocked products and a shipping method."""
+    product_count = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer@example.com', 'password', name='Customer')
+        owner = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        shop = Shop.objects.create(owner=owner, name='Shop', slug='shop', contact_email='owner@example.com')
+        category = Category.objects.create(name='Category', slug='category')
+        sub_category = SubCategory.objects.create(name='Sub', slug='sub', category=category)
+        cls.products = Product.objects.bulk_create([
+            Product(shop=shop, name=f'Product {i}', slug=f'product-{i}', sub_category=sub_category, price=10, stock=1000)
+            for i in range(cls.product_count)
+        ])
+        cls.address = Address.objects.create(
+            user=cls.user, address_line_1='1 Street', city='City', state='State', postal_code='1000', country='BD', is_default=True,
+        )
+        cls.shipping_method = ShippingMethod.objects.create(name='Standard', price=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class OrderCreateQueryCountTests(CheckoutFixtures, TestCase):
+    """Validating and creating an order cost the same number of queries whatever the cart size."""
+    product_count = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.color = Color.objects.create(name='Red', hex_code='#ff0000')
+        cls.size = Size.objects.create(name='M')
+
+    def order_data(self, lines):
+        return {
+            'customer_name': 'Customer',
+            'customer_email': 'customer@example.com',
+            'customer_phone': '01700000000',
+            'shipping_address': self.address.pk,
+            'shipping_method': self.shipping_method.pk,
+            'items': [
+                {'product': str(product.pk), 'color': self.color.pk, 'size': self.size.pk, 'quantity': 2}
+                for product in self.products[:lines]
+            ],
+        }
+
+    def serializer(self, data):
+        request = APIRequestFactory().post('/api/orders/')
+        request.user = self.user
+        return OrderCreateSerializer(data=data, context={'request': request})
+
+    def create_order(self, lines):
+        serializer = self.serializer(self.order_data(lines))
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as queries:
+            order = serializer.save()
+        return order, len(queries)
+
+    def test_constant_queries_for_1_10_and_100_lines(self):
+        counts = {}
+        for lines in (1, 10, 100):
+            order, counts[lines] = self.create_order(lines)
+            self.assertEqual(order.items.count(), lines)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_items_are_priced_and_linked(self):
+        order, _ = self.create_order(3)
+        self.assertEqual(order.cart_subtotal, 60)
+        item = OrderItem.objects.filter(order=order).first()
+        self.assertEqual((item.color, item.size, item.unit_price), (self.color, self.size, 10))
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 998)
+
+    def test_items_are_validated_with_one_query_per_model(self):
+        counts = {}
+        for lines in (1, 10, 100):
+            serializer = self.serializer(self.order_data(lines))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertTrue(serializer.is_valid(), serializer.errors)
+            counts[lines] = len(queries)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_unknown_references_are_reported_per_item(self):
+        data = self.order_data(3)
+        data['items'][1]['product'] = '00000000-0000-0000-0000-000000000000'
+        data['items'][2]['color'] = 999
+        serializer = self.serializer(data)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['items'], [
+            {},
+            {'product': ['Product does not exist.']},
+            {'color': ['Color does not exist.']},
+        ])
+
+
+class ConfirmPaymentCheckoutTests(CheckoutFixtures, TestCase):
+    """The confirm-payment checkout resolves and writes a cart in a constant number of queries."""
+
+    def confirm(self, items, transaction_id='TXN1'):
+        return self.client.post('/api/orders/confirm-payment/', {
+            'payment': {'sender_number': '01700000000', 'transaction_id': transaction_id},
+            'subtotal': 100,
+            'items': items,
+        }, format='json')
+
+    def test_constant_queries_and_name_lookup(self):
+        counts = {}
+        for lines in (2, 20):
+            items = [{'product': str(product.pk), 'quantity': 1} for product in self.products[:lines - 1]]
+            items.append({'product_name': 'PRODUCT 19', 'quantity': 2})
+            with CaptureQueriesContext(connection) as queries:
+                response = self.confirm(items, transaction_id=f'TXN{lines}')
+            self.assertEqual(response.status_code, 201, response.data)
+            counts[lines] = len(queries)
+            order = Order.objects.get(order_number=response.data['order_number'])
+            self.assertEqual(order.items.get(product=self.products[19]).quantity, 2)
+            self.assertEqual(order.items.count(), lines)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_unknown_products_write_nothing(self):
+        response = self.confirm([
+            {'product': str(self.products[0].pk), 'quantity': 1},
+            {'product_name': 'No such product', 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors']['items'], [{}, {'product': ['Product does not exist.']}])
+        self.assertFalse(Order.objects.exists())
+
+    def test_invalid_quantities_write_nothing(self):
+        response = self.confirm([
+            {'product': str(self.products[0].pk), 'quantity': 'abc'},
+            {'product': str(self.products[1].pk), 'quantity': 0},
+            {'product': str(self.products[2].pk), 'quantity': 2},
+            {'product': str(self.products[3].pk), 'quantity': -3},
+            {'product_name': 'No such product', 'quantity': 2.5},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors']['items'], [
+            {'quantity': ['A valid integer is required.']},
+            {'quantity': ['Ensure this value is greater than or equal to 1.']},
+            {},
+            {'quantity': ['Ensure this value is greater than or equal to 1.']},
+            {'product': ['Product does not exist.'], 'quantity': ['A valid integer is required.']},
+        ])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[product.pk for product in self.products[:4]]).values_list('stock', flat=True)),
+            [1000] * 4,
+        )
+
+    def test_malformed_items_write_nothing(self):
+        response = self.confirm([
+            'product-0',
+            {'product_name': 42, 'quantity': 1},
+            {'product': str(self.products[0].pk), 'quantity': 1},
+            None,
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors']['items'], [
+            {'non_field_errors': ['Invalid data. Expected a dictionary, but got str.']},
+            {'product_name': ['Not a valid string.']},
+            {},
+            {'non_field_errors': ['Invalid data. Expected a dictionary, but got NoneType.']},
+        ])
+        self.assertFalse(Order.objects.exists())
+
+    def test_quantity_defaults_to_one(self):
+        response = self.confirm([{'product': str(self.products[0].pk)}, {'product': str(self.products[1].pk), 'quantity': '3'}])
+        self.assertEqual(response.status_code, 201, response.data)
+        order = Order.objects.get(order_number=response.data['order_number'])
+        self.assertEqual(sorted(order.items.values_list('quantity', flat=True)), [1, 3])
+
+    def test_checkout_changes_product_etag_and_cached_stock(self):
+        cache.clear()
+        # Detail requests buffer views; drop them rather than flush them at exit
+        self.addCleanup(get_buffer().drain)
+        url = f'/api/products/{self.products[0].slug}/'
+        before = self.client.get(url)
+        self.assertEqual(before.data['stock'], 1000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.confirm([{'product': str(self.products[0].pk), 'quantity': 3}])
+        self.assertEqual(response.status_code, 201, response.data)
+
+        after = self.client.get(url, HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertEqual(after.data['stock'], 997)
+
+
+class IdempotencyKeyTests(CheckoutFixtures, TestCase):
+    """Retries carrying the same Idempotency-Key replay the first response."""
+
+    def confirm(self, items, transaction_id='TXN1', key='retry-1'):
+        return self.client.post('/api/orders/confirm-payment/', {
+            'payment': {'sender_number': '01700000000', 'transaction_id': transaction_id},
+            'subtotal': 100,
+            'items': items,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def items(self):
+        return [{'product': str(self.products[0].pk), 'quantity': 1}]
+
+    def test_retry_replays_first_response(self):
+        first = self.confirm(self.items())
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            retry = self.confirm(self.items())
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.confirm(self.items())
+        response = self.confirm(self.items(), transaction_id='TXN2')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_request_in_flight(self):
+        self.confirm(self.items())
+        IdempotencyRecord.objects.update(status=IdempotencyRecord.Status.IN_PROGRESS)
+        response = self.confirm(self.items())
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_conflicts_release_the_key(self):
+        items = [{'product': str(self.products[0].pk), 'quantity': 5000}]
+        self.assertEqual(self.confirm(items).status_code, 409)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_keys_are_scoped_per_user(self):
+        self.confirm(self.items())
+        other = User.objects.create_user('other@example.com', 'password', name='Other')
+        Address.objects.create(
+            user=other, address_line_1='2 Street', city='City', state='State', postal_code='1000', country='BD', is_default=True,
+        )
+        self.client.force_authenticate(other)
+        self.assertEqual(self.confirm(self.items(), transaction_id='TXN2').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def guest_confirm(self, client):
+        # Guests without a shipping address get a 400, which is stored like any other response
+        return client.post('/api/orders/confirm-payment/', {
+            'payment': {'sender_number': '01700000000', 'transaction_id': 'TXN1'},
+            'subtotal': 100,
+            'items': self.items(),
+        }, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+    def test_guest_keys_are_scoped_per_session(self):
+        first, second = APIClient(), APIClient()
+        # Accessing the test client's session starts one and sets its cookie
+        self.assertNotEqual(first.session.session_key, second.session.session_key)
+        self.assertEqual(self.guest_confirm(first).status_code, 400)
+        response = self.guest_confirm(second)
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(IdempotencyRecord.objects.count(), 2)
+        self.assertEqual(self.guest_confirm(first)['Idempotent-Replayed'], 'true')
+
+    def test_guest_keys_without_a_session_are_ignored(self):
+        for client in (APIClient(), APIClient()):
+            response = self.guest_confirm(client)
+            self.assertEqual(response.status_code, 400)
+            self.assertNotIn('Idempotent-Replayed', response)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+
+class OrderReadQueryCountTests(CheckoutFixtures, TestCase):
+    """Order list pages and details cost a fixed number of queries."""
+
+    def create_orders(self, count):
+        color = Color.objects.create(name=f'Color {count}', hex_code=f'#00000{count}')
+        size = Size.objects.create(name=f'Size {count}')
+        orders = []
+        for number in range(count):
+            order = Order.objects.create(user=self.user, total_amount=30, shipping_method=self.shipping_method)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, color=color, size=size, quantity=1, unit_price=10)
+                for product in self.products[:3]
+            ])
+            OrderPayment.objects.create(
+                order=order, sender_number='01700000000', transaction_id=f'TXN-{count}-{number}', payment_method='bkash',
+            )
+            orders.append(order)
+        return orders
+
+    def test_list_page(self):
+        # Page count, orders with shipping method and payment, items with their names
+        self.create_orders(1)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.client.get('/api/orders/').data['results']), 1)
+        self.create_orders(5)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/orders/')
+        self.assertEqual(len(response.data['results']), 6)
+        item = response.data['results'][0]['items'][0]
+        self.assertEqual((item['product_name'], item['color_name'], item['size_name']), ('Product 0', 'Color 5', 'Size 5'))
+        self.assertEqual(response.data['results'][0]['shipping_method_name'], 'Standard')
+
+    def test_detail(self):
+        order = self.create_orders(1)[0]
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/orders/{order.order_number}/')
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertEqual(response.data['payment']['transaction_id'], 'TXN-1-0')
+
+
+class BoughtTogetherTests(CheckoutFixtures, TestCase):
+    """Associations are ranked by lift, not by how often a pair was bought."""
+
+    def basket(self, *products, status=Order.OrderStatus.DELIVERED):
+        order = Order.objects.create(user=self.user, total_amount=10, status=status)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, unit_price=10) for product in products
+        ])
+
+    def setUp(self):
+        super().setUp()
+        a, b, c, d, e = self.products[:5]
+        for basket in [(a, b), (a, b), (a, c), (a, c), (a, c), (c, d), (c, d), (c,), (d,), (a, e)]:
+            self.basket(*basket)
+        # Cancelled orders are ignored
+        for _ in range(3):
+            self.basket(a, d, status=Order.OrderStatus.CANCELLED)
+
+    def associations(self, product):
+        return list(
+            ProductAssociation.objects.filter(product=product).order_by('rank')
+            .values_list('associated__slug', 'support', 'lift')
+        )
+
+    def test_lift_ranking(self):
+        result = build_associations()
+        self.assertEqual(result.orders, 10)
+        a, b, c, d, _ = self.products[:5]
+        # 10 orders; A is in 6, B in 2, C in 6, D in 3. A+E is bought once, below the minimum support
+        [(first, first_support, first_lift), (second, second_support, second_lift)] = self.associations(a)
+        self.assertEqual((first, first_support, second, second_support), ('product-1', 2, 'product-2', 3))
+        self.assertAlmostEqual(first_lift, 2 / 6 * 10 / 2, places=5)
+        self.assertAlmostEqual(second_lift, 3 / 6 * 10 / 6, places=5)
+        self.assertEqual([slug for slug, _, _ in self.associations(d)], ['product-2'])
+
+        cache.clear()
+        response = self.client.get(f'/api/recommendations/bought-together/?ids={a.pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['slug'] for product in response.json()], ['product-1', 'product-2'])
+        # With several ids a product scores by its strongest association, and ids are left out
+        response = self.client.get(f'/api/recommendations/bought-together/?ids={a.pk},{d.pk}')
+        self.assertEqual([product['slug'] for product in response.json()], ['product-1', 'product-2'])
+
+
+class StockTests(CheckoutFixtures, TestCase):
+    def stock(self, *products):
+        return [Product.objects.get(pk=product.pk).stock for product in products]
+
+    def test_shortfall_on_any_line_takes_nothing(self):
+        a, b, c = self.products[:3]
+        with self.assertRaises(InsufficientStock) as raised:
+            take_stock([(a.pk, 5), (b.pk, 1001), (c.pk, 5), (a.pk, 996)])
+        self.assertEqual(raised.exception.failures, [
+            {'line': 1, 'product': b.pk, 'requested': 1001, 'available': 1000},
+            {'line': 3, 'product': a.pk, 'requested': 996, 'available': 995},
+        ])
+        self.assertEqual(self.stock(a, b, c), [1000, 1000, 1000])
+
+    def test_stock_taken_to_zero(self):
+        a, b = self.products[:2]
+        take_stock([(a.pk, 400), (a.pk, 600), (b.pk, 1)])
+        self.assertEqual(self.stock(a, b), [0, 999])
+        with self.assertRaises(InsufficientStock) as raised:
+            take_stock([(a.pk, 1)])
+        self.assertEqual(raised.exception.line_errors(1), [{'quantity': ['Out of stock.']}])
+
+    def test_inactive_products_are_out_of_stock(self):
+        a = self.products[0]
+        Product.objects.filter(pk=a.pk).update(is_active=False)
+        with self.assertRaises(InsufficientStock):
+            take_stock([(a.pk, 1)])
+        self.assertEqual(self.stock(a), [1000])
+
+    def test_non_positive_quantities_are_rejected(self):
+        a, b = self.products[:2]
+        for quantity in (0, -3, 1.5, True, '2'):
+            with self.subTest(quantity=quantity):
+                with self.assertRaises(ValueError):
+                    take_stock([(a.pk, 1), (b.pk, quantity)])
+                with self.assertRaises(ValueError):
+                    reserve([(a.pk, 1), (b.pk, quantity)])
+        self.assertEqual(self.stock(a, b), [1000, 1000])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_reservation_release(self):
+        a, b = self.products[:2]
+        reservation = reserve([(a.pk, 3), (b.pk, 1), (a.pk, 2)], user=self.user)
+        self.assertEqual(self.stock(a, b), [995, 999])
+        self.assertTrue(release(reservation.token))
+        self.assertEqual(self.stock(a, b), [1000, 1000])
+        # Stock is returned once
+        self.assertFalse(release(reservation.token))
+        self.assertEqual(self.stock(a, b), [1000, 1000])
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.Status.RELEASED)
+
+    def test_reservation_consumed_by_an_order(self):
+        a = self.products[0]
+        reservation = reserve([(a.pk, 3)])
+        order = Order.objects.create(user=self.user, total_amount=30)
+        with transaction.atomic():
+            self.assertTrue(consume(reservation.token, order))
+            take_stock([(a.pk, 3)])
+        self.assertEqual(self.stock(a), [997])
+        self.assertFalse(release(reservation.token))
+        self.assertEqual(self.stock(a), [997])
+        reservation.refresh_from_db()
+        self.assertEqual((reservation.status, reservation.order), (StockReservation.Status.CONSUMED, order))
 
-# Create your tests here.
+    def test_expired_reservations_return_stock(self):
+        a, b = self.products[:2]
+        expired = reserve([(a.pk, 4)], ttl=60)
+        active = reserve([(b.pk, 2)], ttl=60 * 60)
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(minutes=5), batch_size=1), 1)
+        self.assertEqual(self.stock(a, b), [1000, 998])
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, StockReservation.Status.EXPIRED)
+        # An expired reservation cannot be released or consumed any more
+        self.assertFalse(release(expired.token))
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(minutes=5)), 0)
+        self.assertEqual(self.stock(a, b), [1000, 998])
+        active.refresh_from_db()
+        self.assertEqual(active.status, StockReservation.Status.ACTIVE)
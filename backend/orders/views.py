@@ -1,17 +1,26 @@
 # orders/views.py
 import logging
 import traceback
-from rest_framework import viewsets, permissions, status, generics, serializers
+import uuid
+from rest_framework import viewsets, permissions, status, generics, serializers, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db import transaction
+from django.db.models import Max, Prefetch
 from django.shortcuts import get_object_or_404
-from .models import Order, ShippingMethod, OrderPayment, Coupon, OrderItem, OrderUpdate
+from .models import Order, ShippingMethod, OrderPayment, Coupon, OrderItem, OrderUpdate, StockReservation
 from .serializers import (
     OrderSerializer, ShippingMethodSerializer, OrderPaymentSerializer, 
-    OrderCreateSerializer, OrderReadSerializer, CouponSerializer, CouponValidationSerializer
+    OrderCreateSerializer, OrderReadSerializer, CouponSerializer, CouponValidationSerializer,
+    StockReservationSerializer
 )
 from users.permissions import IsCustomerForOrder
+from products.cache import CATALOG, SHIPPING, cache_response
+from .checkout import InvalidItems, place_paid_order, resolve_lines
+from .idempotency import idempotent
+from .stock import InsufficientStock, release, reserve
+from products.models import Product
+from products.serializers import ProductCardSerializer
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +58,27 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         return [permission() for permission in permission_classes]
 
+    def get_action_queryset(self):
+        """
+        Orders with exactly the relations the action's serializer renders
+        loaded up front: a page of orders costs one query for the orders
+        (with shipping method and payment joined) and one for all their items.
+        """
+        if self.action in ['list', 'retrieve']:
+            # OrderReadSerializer shows the names of each item's product, color and size
+            items = OrderItem.objects.select_related('product', 'color', 'size').only(
+                'order', 'product__name', 'color__name', 'size__name', 'quantity', 'unit_price',
+            )
+            # Newest first, which the (user, -ordered_at) index serves
+            return Order.objects.select_related('shipping_method', 'payment').prefetch_related(
+                Prefetch('items', queryset=items),
+            ).order_by('-ordered_at')
+        return Order.objects.select_related('shipping_method', 'shipping_address', 'payment').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product', 'color', 'size')),
+            'updates',
+            'shipping_method__shipping_tiers',
+        )
+
     def get_queryset(self):
         """
         Custom queryset logic:
@@ -57,7 +87,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         - If accessed from web (no query params), show all orders for admin, or all orders for non-admin (for /orders page)
         - Otherwise, for authenticated users, show only their orders
         """
-        queryset = Order.objects.all().prefetch_related('items', 'updates', 'payment')
+        queryset = self.get_action_queryset()
         user_param = self.request.query_params.get('user')
         order_number_param = self.request.query_params.get('order_number')
         user = self.request.user
@@ -82,6 +112,7 @@ class OrderViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         """
         Create a new order with payment information.
@@ -133,6 +164,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=False, methods=['post'], url_path='submit', permission_classes=[permissions.AllowAny])
+    @idempotent
     def submit_order(self, request):
         """
         Submit a new order - alias for create method with explicit endpoint.
@@ -145,6 +177,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         return self.confirm_payment(request)
 
     @action(detail=False, methods=['post'], url_path='confirm-payment', permission_classes=[permissions.AllowAny])
+    @idempotent
     def confirm_payment(self, request):
         """
         Confirm payment for an order and update payment status.
@@ -210,17 +243,16 @@ class OrderViewSet(viewsets.ModelViewSet):
             # If no shipping address found or user is not authenticated, and we have shipping address data
             if not shipping_address and shipping_address_data:
                 from users.models import Address
-                # Create a new address record (for both authenticated and guest users)
-                address_fields = {
-                    'user': request.user if request.user.is_authenticated else None,
-                    'address_line_1': shipping_address_data.get('street_address', ''),
-                    'city': shipping_address_data.get('city', ''),
-                    'state': shipping_address_data.get('state', ''),
-                    'postal_code': shipping_address_data.get('zip_code', ''),
-                    'country': shipping_address_data.get('country', 'Bangladesh'),
-                    'is_default': False  # Don't set as default for guest users
-                }
-                shipping_address = Address.objects.create(**address_fields)
+                # A new address record (for both authenticated and guest users), saved with the order
+                shipping_address = Address(
+                    user=request.user if request.user.is_authenticated else None,
+                    address_line_1=shipping_address_data.get('street_address', ''),
+                    city=shipping_address_data.get('city', ''),
+                    state=shipping_address_data.get('state', ''),
+                    postal_code=shipping_address_data.get('zip_code', ''),
+                    country=shipping_address_data.get('country', 'Bangladesh'),
+                    is_default=False  # Don't set as default for guest users
+                )
             
             # Ensure we have a shipping address
             if not shipping_address:
@@ -266,51 +298,16 @@ class OrderViewSet(viewsets.ModelViewSet):
                 'customer_phone': request.data.get('customer_phone', ''),
             }
 
-            # Create the order
-            order = Order.objects.create(**order_data)
+            # Resolve the cart lines before anything is written
+            order_lines = resolve_lines(items)
 
-            # Create order items
-            from products.models import Product
-            for item in items:
-                try:
-                    # Try to find the product by ID first (frontend sends 'product' field)
-                    product = None
-                    if 'product' in item:
-                        product = Product.objects.get(id=item['product'])
-                    elif 'product_id' in item:
-                        product = Product.objects.get(id=item['product_id'])
-                    elif 'product_name' in item:
-                        # Try to find by name (this is a fallback)
-                        product = Product.objects.filter(name__icontains=item['product_name']).first()
-                    
-                    if product:
-                        OrderItem.objects.create(
-                            order=order,
-                            product=product,
-                            quantity=item.get('quantity', 1),
-                            unit_price=item.get('unit_price', item.get('price', product.price))
-                        )
-                except Exception as e:
-                    # If product not found, continue with other items
-                    continue
-
-            # Create payment record
-            payment_method_from_frontend = payment_data.get('payment_method', 'bkash')
             payment_record_data = {
-                'order': order,
                 'sender_number': transaction_number,
                 'transaction_id': transaction_id,
-                'payment_method': payment_method_from_frontend,
+                'payment_method': payment_data.get('payment_method', 'bkash'),
             }
-            
-            payment = OrderPayment.objects.create(**payment_record_data)
-
-            # Create order update for payment confirmation
-            OrderUpdate.objects.create(
-                order=order,
-                status=Order.OrderStatus.PROCESSING,
-                notes=f"Payment confirmed. Transaction ID: {transaction_id}. {comment if comment else ''}"
-            )
+            notes = f"Payment confirmed. Transaction ID: {transaction_id}. {comment if comment else ''}"
+            order = place_paid_order(order_data, order_lines, payment_record_data, notes)
 
             # Prepare response data
             response_data = {
@@ -326,6 +323,26 @@ class OrderViewSet(viewsets.ModelViewSet):
 
             return Response(response_data, status=status.HTTP_201_CREATED)
 
+        except InvalidItems as e:
+            logger.warning(f"Payment confirmation rejected, invalid items: {e.errors}")
+            return Response({
+                'success': False,
+                'message': 'Some items are not available or invalid.',
+                'errors': {'items': e.line_errors(len(items))}
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        except InsufficientStock as e:
+            logger.warning(f"Payment confirmation rejected, insufficient stock: {e.failures}")
+            # Report the errors against the request's item positions
+            item_errors = [{} for _ in items]
+            for line, error in zip(order_lines, e.line_errors(len(order_lines))):
+                item_errors[line.index] = error
+            return Response({
+                'success': False,
+                'message': 'Some items are no longer available in the requested quantity.',
+                'errors': {'items': item_errors}
+            }, status=status.HTTP_409_CONFLICT)
+
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -335,6 +352,55 @@ class OrderViewSet(viewsets.ModelViewSet):
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class StockReservationViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Stock held for a cart during checkout. Creating a reservation takes the
+    stock of all its items at once and holds it for STOCK_RESERVATION_TTL
+    seconds; pass its token as `reservation` when creating the order.
+    Deleting a reservation gives the stock back.
+    POST /api/stock-reservations/  {"items": [{"product": "<uuid>", "quantity": 2}]}
+    DELETE /api/stock-reservations/{token}/
+    """
+    queryset = StockReservation.objects.prefetch_related('lines')
+    serializer_class = StockReservationSerializer
+    permission_classes = [permissions.AllowAny]
+    lookup_field = 'token'
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['lines']
+        try:
+            reservation = reserve(
+                [(item['product_id'], item['quantity']) for item in items],
+                user=request.user if request.user.is_authenticated else None,
+            )
+        except InsufficientStock as e:
+            logger.info(f"Stock reservation rejected: {e.failures}")
+            return Response({
+                'success': False,
+                'message': 'Some items are not available in the requested quantity.',
+                'errors': {'items': e.line_errors(len(items))}
+            }, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"Error in StockReservationViewSet.create: {str(e)}", exc_info=True)
+            return Response(
+                {"error": f"Internal server error: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        logger.info(f"Stock reserved: {reservation.token}")
+        return Response(self.get_serializer(reservation).data, status=status.HTTP_201_CREATED)
+
+    def destroy(self, request, *args, **kwargs):
+        reservation = self.get_object()
+        if not release(reservation.token):
+            return Response(
+                {"error": f"Reservation is already {reservation.get_status_display().lower()}."},
+                status=status.HTTP_409_CONFLICT
+            )
+        logger.info(f"Stock reservation released: {reservation.token}")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class ShippingMethodViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows shipping methods to be viewed.
@@ -342,6 +408,14 @@ class ShippingMethodViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ShippingMethod.objects.filter(is_active=True)
     serializer_class = ShippingMethodSerializer
     permission_classes = [permissions.AllowAny]
+
+    @cache_response(SHIPPING)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response(SHIPPING)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'], url_path='price-for-quantity')
     def price_for_quantity(self, request, pk=None):
@@ -544,3 +618,68 @@ class PaymentAccountsAPIView(generics.RetrieveAPIView):
         return Response({
             "accounts": payment_accounts
         }, status=status.HTTP_200_OK)
+
+class RecommendationViewSet(viewsets.ViewSet):
+    """
+    Product recommendations for the cart and checkout pages, served from the
+    pairs precomputed by `build_bought_together`.
+    """
+    permission_classes = [permissions.AllowAny]
+    # Upper bounds on the products a request may send and receive
+    max_products = 50
+    max_limit = 20
+    default_limit = 8
+
+    @action(detail=False, methods=['get'], url_path='bought-together')
+    @cache_response(CATALOG)
+    def bought_together(self, request):
+        """
+        Products frequently bought together with the given products, best
+        first. Products already in `ids` are left out; with several ids a
+        product scores by its strongest association.
+        GET /api/recommendations/bought-together/?ids=<uuid>,<uuid>&limit=8
+        """
+        try:
+            logger.info(f"RecommendationViewSet.bought_together called with params: {request.query_params}")
+            ids = []
+            for raw in request.query_params.getlist('ids'):
+                for value in raw.split(','):
+                    value = value.strip()
+                    if not value:
+                        continue
+                    try:
+                        ids.append(uuid.UUID(value))
+                    except ValueError:
+                        return Response({"error": f"Invalid product id: {value}"}, status=status.HTTP_400_BAD_REQUEST)
+            if not ids:
+                return Response({"error": "Provide product ids."}, status=status.HTTP_400_BAD_REQUEST)
+            if len(ids) > self.max_products:
+                return Response(
+                    {"error": f"At most {self.max_products} products can be sent at once."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            except ValueError:
+                return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # One query over the (product, rank) index, scored by the best lift per product
+            products = (
+                Product.objects.filter(is_active=True, associated_with__product_id__in=ids)
+                .exclude(pk__in=ids)
+                .annotate(association_lift=Max('associated_with__lift'))
+                .select_related('shop', 'sub_category__category', 'rating_summary')
+                .prefetch_related('colors', 'sizes')
+                .defer('description', 'description_html')
+                .order_by('-association_lift', 'pk')[:max(limit, 0)]
+            )
+            serializer = ProductCardSerializer(products, many=True, context={'request': request})
+            data = serializer.data
+            logger.info(f"Successfully returned {len(data)} bought-together products")
+            return Response(data)
+        except Exception as e:
+            logger.error(f"Error in RecommendationViewSet.bought_together: {str(e)}", exc_info=True)
+            return Response(
+                {"error": f"Internal server error: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
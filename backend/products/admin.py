@@ -1,7 +1,9 @@
 # products/admin.py
 from django.contrib import admin
+from django.db.models import Q
 from unfold.admin import ModelAdmin, TabularInline, StackedInline
 from .models import *
+from .search import search_products
 
 @admin.register(Color)
 class ColorAdmin(ModelAdmin):
@@ -39,3 +41,10 @@ class ProductAdmin(ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     inlines = [ProductSpecificationInline, ProductAdditionalImageInline]
     filter_horizontal = ('colors', 'sizes')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains scans; exact slugs still match
+        if not search_term:
+            return queryset, False
+        matches = search_products(Product.objects.all(), search_term, rank=False).values('pk')
+        return queryset.filter(Q(pk__in=matches) | Q(slug=search_term.strip())), False
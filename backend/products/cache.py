@@ -0,0 +1,85 @@
+# products/cache.py
+"""
+Read-through response caching with generation-based invalidation.
+
+Every cache key embeds the current generation of a namespace (e.g. the
+catalog). Model signals bump the generation once the writing transaction
+commits, which orphans every response cached under the old generation in a
+single O(1) operation; orphaned entries simply expire.
+"""
+import hashlib
+import json
+import time
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+CATALOG = 'catalog'
+SHIPPING = 'shipping'
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 10)
+
+
+def _generation_key(namespace):
+    return f'cache-generation:{namespace}'
+
+
+def get_generation(namespace):
+    """Current generation of a namespace, initialising it on first use."""
+    key = _generation_key(namespace)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so an evicted counter never reuses old generations
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key) or 0
+    return generation
+
+
+def bump_generation(namespace):
+    key = _generation_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def invalidate(namespace):
+    """Bump the namespace generation once the current transaction commits."""
+    transaction.on_commit(partial(bump_generation, namespace))
+
+
+def response_cache_key(namespace, view, request, kwargs):
+    params = sorted((name, request.query_params.getlist(name)) for name in request.query_params)
+    fingerprint = json.dumps(
+        [request.get_host(), sorted((name, str(value)) for name, value in kwargs.items()), params],
+        separators=(',', ':'),
+    )
+    digest = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+    return f'response:{namespace}:{get_generation(namespace)}:{view.__class__.__name__}:{view.action}:{digest}'
+
+
+def cache_response(namespace, timeout=None):
+    """
+    Cache the data of successful GET responses of a view method, keyed by the
+    namespace generation, URL kwargs and normalized query parameters.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_method(self, request, *args, **kwargs)
+
+            key = response_cache_key(namespace, self, request, kwargs)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT if timeout is None else timeout)
+            return response
+        return wrapper
+    return decorator
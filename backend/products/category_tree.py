@@ -0,0 +1,95 @@
+# products/category_tree.py
+"""
+Precomputed category tree for navigation menus.
+
+The tree (categories, their sub-categories and active product counts) is
+built with two queries and kept in the cache as a plain JSON-serializable
+blob without expiry. It is only rebuilt after a Category or SubCategory
+changes, or a product is created, deleted, moved to another sub-category or
+(de)activated; see products/signals.py.
+
+Images are cached as storage names and turned into URLs per response by
+resolve_category_tree(), so the blob holds no host and serves every
+request's absolute media base (products/media.py).
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .images import format_srcset, image_variants
+from .media import media_url
+from .models import Category, SubCategory
+
+CATEGORY_TREE_CACHE_KEY = 'products:category-tree'
+
+
+def _image_name(image):
+    return image.name if image else None
+
+
+def build_category_tree():
+    """Build the tree from the database: one query per level."""
+    categories = {
+        category.pk: {
+            'id': category.pk,
+            'name': category.name,
+            'slug': category.slug,
+            'image': _image_name(category.image),
+            'image_srcset': image_variants(category.image),
+            'product_count': 0,
+            'subcategories': [],
+        }
+        for category in Category.objects.order_by('name')
+    }
+
+    sub_categories = SubCategory.objects.order_by('name').annotate(
+        product_count=Count('products', filter=Q(products__is_active=True)),
+    )
+    for sub_category in sub_categories:
+        category = categories[sub_category.category_id]
+        category['product_count'] += sub_category.product_count
+        category['subcategories'].append({
+            'id': sub_category.pk,
+            'name': sub_category.name,
+            'slug': sub_category.slug,
+            'image': _image_name(sub_category.image),
+            'image_srcset': image_variants(sub_category.image),
+            'product_count': sub_category.product_count,
+        })
+    return list(categories.values())
+
+
+def _resolve_node(node, build_url):
+    return {
+        **node,
+        'image': build_url(node['image']),
+        'image_srcset': format_srcset(node['image_srcset'], build_url),
+    }
+
+
+def resolve_category_tree(tree, request=None):
+    """The tree as served: storage names replaced by media URLs for `request`."""
+    def build_url(name):
+        return media_url(name, request)
+
+    return [
+        {
+            **_resolve_node(category, build_url),
+            'subcategories': [_resolve_node(sub_category, build_url) for sub_category in category['subcategories']],
+        }
+        for category in tree
+    ]
+
+
+def get_category_tree(request=None):
+    """Return the tree with media URLs for `request`, building and caching it on a miss."""
+    tree = cache.get(CATEGORY_TREE_CACHE_KEY)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(CATEGORY_TREE_CACHE_KEY, tree, None)
+    return resolve_category_tree(tree, request)
+
+
+def invalidate_category_tree():
+    """Drop the cached tree once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(CATEGORY_TREE_CACHE_KEY))
@@ -0,0 +1,65 @@
+# products/conditional.py
+"""
+HTTP validators (ETag / Last-Modified) for product and shop detail pages.
+
+The validators are read with a single values_list() query over updated_at
+columns, so a conditional request answered with 304 never loads or
+serializes the object. Everything else embedded in a product body (reviews,
+images, specifications, additional descriptions, colors, sizes and the
+sub-category) bumps Product.updated_at through touch_products(), see
+products/signals.py.
+"""
+import hashlib
+
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from shops.models import Shop
+from .models import Product
+
+
+def touch_products(products):
+    """Mark products (a queryset or an iterable of ids) as modified now."""
+    if not hasattr(products, 'model'):
+        products = Product.objects.filter(pk__in=list(products))
+    return products.update(updated_at=timezone.now())
+
+
+def _build_validators(row):
+    if row is None:
+        return None, None
+    pk, *timestamps = row
+    last_modified = max(timestamps)
+    version = ':'.join([str(pk), *(timestamp.isoformat() for timestamp in timestamps)])
+    return hashlib.sha1(version.encode('utf-8')).hexdigest(), last_modified
+
+
+def product_validators(request, slug=None, **kwargs):
+    # condition() asks for the ETag and Last-Modified separately; query once per request
+    if not hasattr(request, '_product_validators'):
+        row = (
+            Product.objects.filter(slug=slug, is_active=True)
+            .values_list('pk', 'updated_at', 'shop__updated_at')
+            .first()
+        )
+        request._product_validators = _build_validators(row)
+    return request._product_validators
+
+
+def shop_validators(request, slug=None, **kwargs):
+    if not hasattr(request, '_shop_validators'):
+        row = Shop.objects.filter(slug=slug).values_list('pk', 'updated_at').first()
+        request._shop_validators = _build_validators(row)
+    return request._shop_validators
+
+
+def conditional_view(validators):
+    """
+    Decorate a viewset method so GET requests carrying a matching
+    If-None-Match / If-Modified-Since are answered with 304 Not Modified.
+    """
+    return method_decorator(condition(
+        etag_func=lambda request, *args, **kwargs: validators(request, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: validators(request, **kwargs)[1],
+    ))
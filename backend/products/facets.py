@@ -0,0 +1,153 @@
+# products/facets.py
+"""
+Facet counts for the catalog filter sidebar.
+
+Counts follow the usual disjunctive faceting rule: each facet is counted
+against the products matching every *other* active filter, so selecting
+"Red" still shows how many products the other colors would add. Results are
+cached per normalized filter set and catalog generation, so any catalog
+change (see products/cache.py) retires them.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+
+from .cache import CATALOG, get_generation
+from .filters import ProductFilter
+from .models import Product
+from .search import search_products
+
+FACETS_CACHE_TIMEOUT = 60 * 5
+
+# (min, max) price ranges; max is exclusive and None means unbounded
+PRICE_BUCKETS = [
+    (0, 25), (25, 50), (50, 100), (100, 250), (250, 500), (500, 1000), (1000, None),
+]
+
+# Filter parameters that select each facet and are therefore ignored when counting it
+FACET_PARAMS = {
+    'colors': ['colors', 'color_ids'],
+    'sizes': ['sizes', 'size_ids'],
+    'brands': ['brands'],
+    'categories': ['category'],
+    'price': ['min_price', 'max_price'],
+}
+
+IGNORED_PARAMS = {'ordering'}
+LIST_PARAMS = {'brands', 'colors', 'color_ids', 'sizes', 'size_ids'}
+
+
+def normalize_params(query_params):
+    """Keep only ProductFilter parameters, with stable ordering of keys and list values."""
+    params = {}
+    for name in ProductFilter.base_filters:
+        value = query_params.get(name)
+        if name in IGNORED_PARAMS or value is None or not str(value).strip():
+            continue
+        value = str(value).strip()
+        if name in LIST_PARAMS:
+            value = ','.join(sorted({item.strip() for item in value.split(',') if item.strip()}))
+        params[name] = value
+    return params
+
+
+def cache_key(params):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    return f'products:facets:{get_generation(CATALOG)}:{digest}'
+
+
+def _matching_ids(queryset, params, exclude=()):
+    # Text search is applied as a plain subquery; the ranked variant used by the
+    # list endpoint cannot be nested inside the facet queries.
+    if 'q' in params:
+        queryset = search_products(queryset, params['q'], rank=False)
+    data = {name: value for name, value in params.items() if name not in exclude and name != 'q'}
+    filterset = ProductFilter(data, queryset=queryset)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    return filterset.qs.order_by().values('pk')
+
+
+def compute_facets(queryset, params):
+    """Compute facet counts for a base product queryset and normalized filter params."""
+    color_ids = _matching_ids(queryset, params, FACET_PARAMS['colors'])
+    colors = (
+        Product.colors.through.objects.filter(product_id__in=color_ids)
+        .values('color_id', 'color__name', 'color__hex_code')
+        .annotate(count=Count('product_id'))
+        .order_by('color__name')
+    )
+
+    sizes = (
+        Product.sizes.through.objects.filter(product_id__in=_matching_ids(queryset, params, FACET_PARAMS['sizes']))
+        .values('size_id', 'size__name')
+        .annotate(count=Count('product_id'))
+        .order_by('size__name')
+    )
+
+    brands = (
+        Product.objects.filter(pk__in=_matching_ids(queryset, params, FACET_PARAMS['brands']))
+        .values('shop__slug', 'shop__name')
+        .annotate(count=Count('pk'))
+        .order_by('shop__name')
+    )
+
+    categories = (
+        Product.objects.filter(pk__in=_matching_ids(queryset, params, FACET_PARAMS['categories']))
+        .values('sub_category__category__slug', 'sub_category__category__name')
+        .annotate(count=Count('pk'))
+        .order_by('sub_category__category__name')
+    )
+
+    # Price buckets and the overall total come out of a single aggregate:
+    # the total re-applies the price range the price facet itself ignores.
+    price_filter = Q()
+    if 'min_price' in params:
+        price_filter &= Q(price__gte=params['min_price'])
+    if 'max_price' in params:
+        price_filter &= Q(price__lte=params['max_price'])
+    aggregates = {'total': Count('pk', filter=price_filter) if price_filter else Count('pk')}
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        bucket = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f'bucket_{index}'] = Count('pk', filter=bucket)
+    price_counts = Product.objects.filter(
+        pk__in=_matching_ids(queryset, params, FACET_PARAMS['price'])
+    ).aggregate(**aggregates)
+
+    return {
+        'total': price_counts['total'],
+        'colors': [
+            {'id': row['color_id'], 'name': row['color__name'], 'hex_code': row['color__hex_code'], 'count': row['count']}
+            for row in colors
+        ],
+        'sizes': [
+            {'id': row['size_id'], 'name': row['size__name'], 'count': row['count']}
+            for row in sizes
+        ],
+        'brands': [
+            {'slug': row['shop__slug'], 'name': row['shop__name'], 'count': row['count']}
+            for row in brands
+        ],
+        'categories': [
+            {'slug': row['sub_category__category__slug'], 'name': row['sub_category__category__name'], 'count': row['count']}
+            for row in categories
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': price_counts[f'bucket_{index}']}
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
+
+
+def get_facets(queryset, query_params):
+    """Return facet counts for the request's filters, computing them on a cache miss."""
+    params = normalize_params(query_params)
+    key = cache_key(params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset, params)
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
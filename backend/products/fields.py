@@ -0,0 +1,49 @@
+# products/fields.py
+from rest_framework import serializers
+
+from .images import image_srcset
+from .media import media_url
+
+
+class MediaUrlField(serializers.ImageField):
+    """
+    Image field whose representation is the public media URL, resolved with
+    products.media (settings-driven base URL, no per-image storage calls).
+    Accepts uploads like a regular ImageField unless declared read_only.
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return media_url(value.name, self.context.get('request'))
+
+
+class ImageSrcsetField(serializers.Field):
+    """
+    Read-only srcset strings per format ({'jpeg': ..., 'webp': ...}) for an
+    image field, listing the variants recorded as generated for it
+    (products/images.py); None until there are any.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return image_srcset(value, lambda name: media_url(name, request))
+
+
+class RenderedHtmlField(serializers.CharField):
+    """
+    Rich-text field that accepts the editor's HTML on write and represents
+    the sanitized rendering stored alongside it at save time
+    (see products/richtext.py).
+    """
+
+    def __init__(self, rendered_source, **kwargs):
+        self.rendered_source = rendered_source
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return getattr(instance, self.rendered_source)
@@ -1,14 +1,25 @@
 # products/filters.py
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 from .models import Product
+from .search import search_products
 
 class CharInFilter(filters.BaseInFilter, filters.CharFilter):
     pass
 
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
 class ProductFilter(filters.FilterSet):
+    q = filters.CharFilter(method='filter_search') # Ranked full-text search
     category = filters.CharFilter(field_name='sub_category__category__slug')
     brands = CharInFilter(field_name='shop__slug', lookup_expr='in')
-    colors = CharInFilter(field_name='colors__name', lookup_expr='in') # Filter by color name
+    # Colors and sizes match through EXISTS subqueries on the M2M tables, so
+    # the product rows are never multiplied and no DISTINCT is needed
+    colors = CharInFilter(method='filter_colors') # Filter by color name
+    color_ids = NumberInFilter(method='filter_colors')
+    sizes = CharInFilter(method='filter_sizes') # Filter by size name
+    size_ids = NumberInFilter(method='filter_sizes')
     min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
     ordering = filters.OrderingFilter(
@@ -16,13 +27,25 @@ class ProductFilter(filters.FilterSet):
             ('price', 'price'),
             ('name', 'name'),
             ('created_at', 'created_at'),
+            ('view_count', 'views'),
         )
     )
 
     class Meta:
         model = Product
-        fields = ['category', 'brands', 'colors', 'min_price', 'max_price', 'ordering']
+        fields = ['q', 'category', 'brands', 'colors', 'color_ids', 'sizes', 'size_ids', 'min_price', 'max_price', 'ordering']
+
+    def filter_search(self, queryset, name, value):
+        return search_products(queryset, value)
+
+    def filter_colors(self, queryset, name, value):
+        lookup = 'color__name__in' if name == 'colors' else 'color_id__in'
+        return queryset.filter(Exists(
+            Product.colors.through.objects.filter(product_id=OuterRef('pk'), **{lookup: value})
+        ))
 
-    def filter_queryset(self, queryset):
-        # Use distinct() to avoid duplicate results when filtering on ManyToMany fields
-        return super().filter_queryset(queryset).distinct()
+    def filter_sizes(self, queryset, name, value):
+        lookup = 'size__name__in' if name == 'sizes' else 'size_id__in'
+        return queryset.filter(Exists(
+            Product.sizes.through.objects.filter(product_id=OuterRef('pk'), **{lookup: value})
+        ))
@@ -0,0 +1,200 @@
+# products/images.py
+"""
+Resized image variants for catalog media.
+
+Every uploaded image gets one WebP and one JPEG file per configured width
+up to its own width (images are never upscaled), stored beside the original
+as `<name>_<width>w.<ext>`. Once written, the widths are recorded on the
+owning row in `<field>_variants` as {'name': <original name>, 'widths': [...]},
+so serializers can emit a srcset of existing files without touching
+storage; a record for another name (the image was replaced since) is
+ignored. Generation runs on a small thread pool after the uploading
+transaction commits; `generate_image_variants` backfills existing media.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps
+
+from .cache import CATALOG, bump_generation
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = sorted(getattr(settings, 'IMAGE_VARIANT_WIDTHS', [320, 640, 1280]))
+VARIANT_QUALITY = getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+# srcset key -> (file extension, Pillow format); WebP is written last
+VARIANT_FORMATS = {
+    'jpeg': ('jpg', 'JPEG'),
+    'webp': ('webp', 'WEBP'),
+}
+
+# Image fields that get variants, by model label
+IMAGE_FIELDS = {
+    'products.Product': ['thumbnail'],
+    'products.ProductAdditionalImage': ['image'],
+    'products.Category': ['image'],
+    'products.SubCategory': ['image'],
+    'shops.Shop': ['logo', 'cover_photo'],
+}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+
+
+def variant_name(name, width, extension):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}_{width}w.{extension}'
+
+
+def variants_field(field_name):
+    """Name of the model field recording the variants of an image field."""
+    return f'{field_name}_variants'
+
+
+def variant_names(name, widths=VARIANT_WIDTHS):
+    """{format: {width: storage name}} for an original image name."""
+    return {
+        key: {width: variant_name(name, width, extension) for width in widths}
+        for key, (extension, _) in VARIANT_FORMATS.items()
+    }
+
+
+def variant_widths(image_width):
+    """Configured widths an image `image_width` pixels wide is resized to."""
+    return [width for width in VARIANT_WIDTHS if width <= image_width]
+
+
+def _upright_width(image):
+    # EXIF orientations 5-8 are rotated by 90 degrees: the stored height is the displayed width
+    if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        return image.height
+    return image.width
+
+
+def has_variants(name, widths, storage=default_storage):
+    # The widest WebP is written last, so its presence means the set is complete
+    return not widths or storage.exists(variant_name(name, widths[-1], VARIANT_FORMATS['webp'][0]))
+
+
+def _encode(image, width, image_format):
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel: flatten transparent images onto white
+        rgba = image.convert('RGBA')
+        flattened = Image.new('RGB', rgba.size, (255, 255, 255))
+        flattened.paste(rgba, mask=rgba.getchannel('A'))
+        image = flattened
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, quality=VARIANT_QUALITY, optimize=image_format == 'JPEG')
+    return buffer.getvalue()
+
+
+def generate_variants(name, storage=default_storage, overwrite=False):
+    """
+    Write the variants of the original stored under `name`, for every
+    configured width up to the image's own. Returns (widths, number of files
+    written); existing variants are kept unless `overwrite`.
+    """
+    with storage.open(name) as original:
+        image = Image.open(original)
+        widths = variant_widths(_upright_width(image))
+        if not overwrite and has_variants(name, widths, storage):
+            return widths, 0
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    written = 0
+    for extension, image_format in VARIANT_FORMATS.values():
+        for width in widths:
+            target = variant_name(name, width, extension)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(_encode(image, width, image_format)))
+            written += 1
+    return widths, written
+
+
+def record_variants(label, field_name, name, widths):
+    """
+    Record the generated widths on the rows of model `label` whose
+    `field_name` is still `name`, and retire the cached responses and
+    validators that embed their srcset. Returns the number of rows updated.
+    """
+    from .category_tree import CATEGORY_TREE_CACHE_KEY
+    from .conditional import touch_products
+
+    model = apps.get_model(label)
+    record = {'name': name, 'widths': widths}
+    rows = model._default_manager.filter(**{field_name: name}).exclude(**{variants_field(field_name): record})
+    values = {variants_field(field_name): record}
+    field_names = {field.name for field in model._meta.get_fields()}
+    if 'updated_at' in field_names:
+        values['updated_at'] = timezone.now()
+    if 'product' in field_names:
+        touch_products(list(rows.values_list('product_id', flat=True)))
+    updated = rows.update(**values)
+    if updated:
+        bump_generation(CATALOG)
+        cache.delete(CATEGORY_TREE_CACHE_KEY)
+    return updated
+
+
+def _generate_quietly(label, field_name, name):
+    try:
+        widths, _ = generate_variants(name)
+        record_variants(label, field_name, name, widths)
+    except Exception as e:
+        logger.error(f"Could not generate image variants for {name}: {str(e)}", exc_info=True)
+
+
+def schedule_variants(field_file):
+    """Generate and record variants for an image field off the request thread, after commit."""
+    if not field_file or not field_file.name:
+        return
+    name = field_file.name
+    label, field_name = field_file.instance._meta.label, field_file.field.name
+    transaction.on_commit(lambda: _executor.submit(_generate_quietly, label, field_name, name))
+
+
+def image_variants(field_file):
+    """
+    {format: {width: storage name}} of the variants generated for an image
+    field; None without an image or before any variant was recorded for it.
+    """
+    if not field_file or not field_file.name:
+        return None
+    record = getattr(field_file.instance, variants_field(field_file.field.name), None) or {}
+    if record.get('name') != field_file.name or not record.get('widths'):
+        return None
+    return variant_names(field_file.name, record['widths'])
+
+
+def format_srcset(variants, build_url):
+    """srcset strings per format for image_variants() output; `build_url` turns a storage name into a URL."""
+    if not variants:
+        return None
+    return {
+        key: ', '.join(f'{build_url(name)} {width}w' for width, name in names.items())
+        for key, names in variants.items()
+    }
+
+
+def image_srcset(field_file, build_url):
+    """
+    srcset strings per format for an image field, e.g.
+    {'webp': '<url> 320w, <url> 640w, ...', 'jpeg': '...'}; None without an image.
+    `build_url` turns a storage name into a URL.
+    """
+    return format_srcset(image_variants(field_file), build_url)
@@ -0,0 +1,258 @@
+# products/importer.py
+"""
+Bulk product import from CSV or JSON Lines.
+
+Rows are streamed and written in batches, so memory use does not grow with
+the size of the file. Shops, sub-categories, colors and sizes are resolved
+through lookup maps loaded once up front; each batch costs one SELECT for
+existing slugs, one bulk INSERT and/or UPDATE, and bulk inserts into the
+colors/sizes through tables.
+
+Recognized columns (only `slug` is required for updates; new products also
+need name, shop, sub_category and price):
+
+    slug, name, shop (slug), sub_category (slug), description, price,
+    discount_price, stock, is_active, colors, sizes
+
+In CSV, colors and sizes are names separated by "|"; in JSONL they may also
+be lists. Rows are matched to existing products by slug and updated in place.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from shops.models import Shop
+from . import search
+from .cache import CATALOG, invalidate
+from .category_tree import invalidate_category_tree
+from .models import Color, Product, Size, SubCategory
+from .richtext import make_excerpt, sanitize_html
+
+LIST_SEPARATOR = '|'
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', 'off'}
+REQUIRED_FOR_CREATE = ['name', 'shop', 'sub_category', 'price']
+MAX_REPORTED_ERRORS = 100
+
+
+class RowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def read_rows(stream, file_format):
+    """Yield (line number, row dict) pairs from an open text stream."""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, RowError(f'Invalid JSON: {e}')
+                continue
+            yield line_number, row if isinstance(row, dict) else RowError('Expected a JSON object')
+    else:
+        raise ValueError(f'Unsupported format: {file_format}')
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _names(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        names = value
+    else:
+        names = str(value).split(LIST_SEPARATOR)
+    return [name for name in (_text(name) for name in names) if name]
+
+
+def _decimal(value, name, required=False):
+    value = _text(value)
+    if not value:
+        if required:
+            raise RowError(f'{name} is required')
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise RowError(f'Invalid {name}: {value!r}')
+    if not number.is_finite() or number < 0:
+        raise RowError(f'Invalid {name}: {value!r}')
+    return number
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    value = _text(value).lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'Invalid is_active: {value!r}')
+
+
+class ProductImporter:
+    """Import product rows in batches; see the module docstring for the format."""
+
+    def __init__(self, batch_size=1000, reindex=True, progress=None):
+        self.batch_size = batch_size
+        self.reindex = reindex
+        self.progress = progress
+        self.shops = dict(Shop.objects.values_list('slug', 'pk'))
+        self.sub_categories = dict(SubCategory.objects.values_list('slug', 'pk'))
+        self.colors = {name.lower(): pk for pk, name in Color.objects.values_list('pk', 'name')}
+        self.sizes = {name.lower(): pk for pk, name in Size.objects.values_list('pk', 'name')}
+
+    def run(self, rows):
+        result = ImportResult()
+        batch = {}
+        for line, row in rows:
+            result.rows += 1
+            if isinstance(row, Exception):
+                result.add_error(line, str(row))
+                continue
+            try:
+                parsed = self.parse_row(row)
+            except RowError as e:
+                result.add_error(line, str(e))
+                continue
+            # A slug repeated within a batch: the last row wins
+            batch.pop(parsed['slug'], None)
+            batch[parsed['slug']] = (line, parsed)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, result)
+                batch = {}
+        if batch:
+            self.write_batch(batch, result)
+
+        if result.created or result.updated:
+            invalidate(CATALOG)
+            invalidate_category_tree()
+        return result
+
+    def parse_row(self, row):
+        slug = _text(row.get('slug'))
+        if not slug:
+            raise RowError('slug is required')
+        parsed = {'slug': slug}
+
+        if 'name' in row:
+            parsed['name'] = _text(row['name'])
+        if 'shop' in row:
+            shop = _text(row['shop'])
+            if shop not in self.shops:
+                raise RowError(f'Unknown shop: {shop!r}')
+            parsed['shop_id'] = self.shops[shop]
+        if 'sub_category' in row:
+            sub_category = _text(row['sub_category'])
+            if sub_category not in self.sub_categories:
+                raise RowError(f'Unknown sub_category: {sub_category!r}')
+            parsed['sub_category_id'] = self.sub_categories[sub_category]
+        if 'description' in row:
+            parsed['description'] = row['description'] or ''
+        if 'price' in row:
+            parsed['price'] = _decimal(row['price'], 'price', required=True)
+        if 'discount_price' in row:
+            parsed['discount_price'] = _decimal(row['discount_price'], 'discount_price')
+        if 'stock' in row:
+            stock = _text(row['stock']) or '0'
+            if not stock.isdigit():
+                raise RowError(f'Invalid stock: {stock!r}')
+            parsed['stock'] = int(stock)
+        if 'is_active' in row and _text(row['is_active']):
+            parsed['is_active'] = _boolean(row['is_active'])
+
+        for column, lookup in (('colors', self.colors), ('sizes', self.sizes)):
+            names = _names(row.get(column))
+            if names is None:
+                continue
+            unknown = [name for name in names if name.lower() not in lookup]
+            if unknown:
+                raise RowError(f'Unknown {column}: {", ".join(unknown)}')
+            parsed[column] = {lookup[name.lower()] for name in names}
+        return parsed
+
+    def write_batch(self, batch, result):
+        existing = dict(Product.objects.filter(slug__in=list(batch)).values_list('slug', 'pk'))
+        now = timezone.now()
+        to_create, to_update = [], {}
+        links = {'colors': {}, 'sizes': {}}
+
+        for slug, (line, parsed) in batch.items():
+            values = {key: value for key, value in parsed.items() if key not in links}
+            if 'description' in values:
+                values['description_html'] = sanitize_html(values['description'])
+                values['description_excerpt'] = make_excerpt(values['description_html'])
+
+            if slug in existing:
+                product = Product(pk=existing[slug], updated_at=now, **values)
+                # Rows are grouped by the columns they set so absent columns are left untouched
+                fields = tuple(sorted(key for key in values if key != 'slug'))
+                to_update.setdefault(fields, []).append(product)
+            else:
+                missing = [name for name in REQUIRED_FOR_CREATE if _missing(parsed, name)]
+                if missing:
+                    result.add_error(line, f'New product needs: {", ".join(missing)}')
+                    continue
+                product = Product(**values)
+                to_create.append(product)
+
+            for column in links:
+                if column in parsed:
+                    links[column][product.pk] = parsed[column]
+
+        with transaction.atomic():
+            Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+            for fields, products in to_update.items():
+                Product.objects.bulk_update(products, ['updated_at', *fields], batch_size=self.batch_size)
+            self._replace_links(Product.colors.through, 'color_id', links['colors'])
+            self._replace_links(Product.sizes.through, 'size_id', links['sizes'])
+            updated = [product for products in to_update.values() for product in products]
+            if self.reindex:
+                search.index_products([product.pk for product in (*to_create, *updated)], batch_size=self.batch_size)
+
+        result.created += len(to_create)
+        result.updated += len(updated)
+        if self.progress:
+            self.progress(result)
+
+    def _replace_links(self, through, target_column, links):
+        if not links:
+            return
+        through.objects.filter(product_id__in=list(links)).delete()
+        through.objects.bulk_create(
+            [through(product_id=product_id, **{target_column: target}) for product_id, targets in links.items() for target in targets],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+
+def _missing(parsed, name):
+    key = {'shop': 'shop_id', 'sub_category': 'sub_category_id'}.get(name, name)
+    return parsed.get(key) in (None, '')
@@ -0,0 +1,140 @@
+# products/management/commands/benchmark_product_filters.py
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.filters import ProductFilter
+from products.models import Category, Color, Product, Size, SubCategory
+from shops.models import Shop
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark color/size filtering: the old JOIN + DISTINCT query against '
+        'the EXISTS-based ProductFilter. Seeds a synthetic catalog inside a '
+        'transaction that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=100000,
+            help='Number of synthetic products to seed (default: 100000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Timed runs per query (default: 5)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert while seeding (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                colors, sizes = self.seed(options['products'], options['batch_size'])
+                self.run_benchmarks(colors, sizes, options['repeat'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Synthetic data rolled back.')
+
+    def seed(self, count, batch_size):
+        self.stdout.write(f'Seeding {count} products...')
+        started = time.monotonic()
+        rng = random.Random(42)
+        tag = uuid.uuid4().hex[:8]
+
+        owner = User.objects.create_user(f'bench-{tag}@example.com', uuid.uuid4().hex, name='Benchmark')
+        shop = Shop.objects.create(owner=owner, name=f'Benchmark {tag}', slug=f'bench-{tag}', contact_email=owner.email)
+        category = Category.objects.create(name=f'Benchmark {tag}', slug=f'bench-{tag}')
+        sub_categories = SubCategory.objects.bulk_create([
+            SubCategory(name=f'Sub {i}', slug=f'bench-{tag}-{i}', category=category) for i in range(10)
+        ])
+        colors = Color.objects.bulk_create([
+            Color(name=f'Bench {tag} {i}', hex_code=f'#{i:02x}{tag[:4]}') for i in range(20)
+        ])
+        sizes = Size.objects.bulk_create([Size(name=f'Bench {tag} {i}') for i in range(8)])
+
+        # Wide rows make the cost of DISTINCT over whole products visible
+        description = '<p>' + 'Lorem ipsum dolor sit amet. ' * 60 + '</p>'
+        for offset in range(0, count, batch_size):
+            products = [
+                Product(
+                    shop=shop,
+                    name=f'Benchmark product {i}',
+                    slug=f'bench-{tag}-{i}',
+                    description=description,
+                    description_html=description,
+                    sub_category=rng.choice(sub_categories),
+                    price=rng.randint(1, 2000),
+                    stock=rng.randint(0, 50),
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            ]
+            Product.objects.bulk_create(products)
+            Product.colors.through.objects.bulk_create([
+                Product.colors.through(product_id=product.pk, color_id=color.pk)
+                for product in products for color in rng.sample(colors, rng.randint(1, 4))
+            ])
+            Product.sizes.through.objects.bulk_create([
+                Product.sizes.through(product_id=product.pk, size_id=size.pk)
+                for product in products for size in rng.sample(sizes, rng.randint(1, 3))
+            ])
+        self.stdout.write(f'Seeded in {time.monotonic() - started:.1f}s')
+        return colors, sizes
+
+    def run_benchmarks(self, colors, sizes, repeat):
+        base = Product.objects.filter(is_active=True).order_by('-created_at')
+        color_names = [color.name for color in colors[:3]]
+        size_names = [size.name for size in sizes[:2]]
+        cases = [
+            ('colors', {'colors__name__in': color_names}, {'colors': ','.join(color_names)}),
+            ('colors + sizes', {'colors__name__in': color_names, 'sizes__name__in': size_names},
+             {'colors': ','.join(color_names), 'sizes': ','.join(size_names)}),
+            ('color ids', {'colors__in': [color.pk for color in colors[:3]]},
+             {'color_ids': ','.join(str(color.pk) for color in colors[:3])}),
+        ]
+
+        for label, legacy_lookups, params in cases:
+            legacy = base.filter(**legacy_lookups).distinct()
+            current = ProductFilter(params, queryset=base).qs
+            legacy_count, current_count = legacy.count(), current.count()
+            if legacy_count != current_count:
+                self.stdout.write(self.style.ERROR(f'{label}: result mismatch ({legacy_count} vs {current_count})'))
+
+            self.stdout.write(f'\n{label} ({current_count} matching products)')
+            for query_label, run in (
+                ('count', lambda qs: qs.count()),
+                ('first page', lambda qs: list(qs[:10])),
+                ('page 100', lambda qs: list(qs[990:1000])),
+            ):
+                legacy_ms = self.time(lambda: run(legacy), repeat)
+                current_ms = self.time(lambda: run(current), repeat)
+                self.stdout.write(
+                    f'  {query_label:<11} join+distinct {legacy_ms:9.1f} ms   '
+                    f'exists {current_ms:9.1f} ms   x{legacy_ms / current_ms if current_ms else 0:.1f}'
+                )
+
+    def time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,60 @@
+# products/management/commands/compute_similar_products.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from products.models import Category
+from products.similarity import TOP_K, compute_similar_products
+
+
+class Command(BaseCommand):
+    help = (
+        'Compute the "similar products" neighbour table. By default only '
+        'categories with products changed since their last computation are refreshed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every category, not only stale ones',
+        )
+        parser.add_argument(
+            '--category',
+            action='append',
+            metavar='SLUG',
+            help='Recompute this category (may be repeated)',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help=f'Neighbours stored per product (default: {TOP_K})',
+        )
+
+    def handle(self, *args, **options):
+        if options['top_k'] < 1:
+            raise CommandError('--top-k must be positive')
+
+        category_ids = None
+        if options['category']:
+            categories = dict(Category.objects.filter(slug__in=options['category']).values_list('slug', 'pk'))
+            unknown = sorted(set(options['category']) - set(categories))
+            if unknown:
+                raise CommandError(f'Unknown categories: {", ".join(unknown)}')
+            category_ids = list(categories.values())
+
+        def report(category, products, rows):
+            self.stdout.write(f'  {category.name}: {products} products, {rows} neighbour rows')
+
+        started = time.monotonic()
+        self.stdout.write('Computing similar products...')
+        result = compute_similar_products(
+            top_k=options['top_k'],
+            full=options['full'],
+            category_ids=category_ids,
+            progress=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {result.categories} categories ({result.products} products, '
+            f'{result.rows} neighbour rows) in {time.monotonic() - started:.1f}s!'
+        ))
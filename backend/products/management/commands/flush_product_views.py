@@ -0,0 +1,44 @@
+# products/management/commands/flush_product_views.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from products.view_counts import FLUSH_BATCH_SIZE, flush_views
+
+
+class Command(BaseCommand):
+    help = (
+        'Write buffered product view counts to the database. Only sees the shared '
+        '(Redis) buffer; in-process buffers are flushed by their own processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep flushing every --interval seconds instead of once',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help='Seconds between flushes with --loop (default: 30)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=FLUSH_BATCH_SIZE,
+            help=f'Products updated per statement (default: {FLUSH_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['interval'] <= 0:
+            raise CommandError('--batch-size and --interval must be positive')
+
+        while True:
+            written = flush_views(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Flushed {written} product views!'))
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
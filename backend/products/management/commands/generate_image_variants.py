@@ -0,0 +1,67 @@
+# products/management/commands/generate_image_variants.py
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from products.images import IMAGE_FIELDS, generate_variants, record_variants
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate resized WebP/JPEG variants for existing catalog and shop images '
+        'and record their widths on the rows using them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Regenerate variants that already exist',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of images processed in parallel (default: 4)',
+        )
+
+    def handle(self, *args, **options):
+        # Image name -> the (model label, field name) pairs using it
+        names = {}
+        for label, field_names in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            for field_name in field_names:
+                used = (
+                    model.objects.exclude(**{f'{field_name}__isnull': True})
+                    .exclude(**{field_name: ''})
+                    .values_list(field_name, flat=True)
+                    .distinct()
+                )
+                for name in used:
+                    names.setdefault(name, []).append((label, field_name))
+        self.stdout.write(f'Generating variants for {len(names)} images...')
+
+        started = time.monotonic()
+        processed = written = failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {
+                executor.submit(generate_variants, name, overwrite=options['overwrite']): name
+                for name in sorted(names)
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    widths, files = future.result()
+                    for label, field_name in names[name]:
+                        record_variants(label, field_name, name, widths)
+                    written += files
+                    processed += 1
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Skipped {name}: {e}'))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} images ({written} variant files written, {failed} failed) in {elapsed:.1f}s!'
+        ))
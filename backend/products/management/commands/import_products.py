@@ -0,0 +1,77 @@
+# products/management/commands/import_products.py
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from products.importer import ProductImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import or update products in bulk from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or "-" to read from stdin')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Input format (default: guessed from the file extension)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows written per batch (default: 1000)',
+        )
+        parser.add_argument(
+            '--no-reindex',
+            action='store_true',
+            help='Skip search indexing (run rebuild_search_index afterwards)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            extension = os.path.splitext(path)[1].lower()
+            file_format = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(extension)
+            if file_format is None:
+                raise CommandError('Cannot guess the input format; pass --format csv or --format jsonl')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        started = time.monotonic()
+
+        def report(result):
+            elapsed = time.monotonic() - started
+            rate = result.rows / elapsed if elapsed else 0
+            self.stdout.write(f'  {result.rows} rows read, {result.created} created, {result.updated} updated ({rate:,.0f} rows/s)')
+
+        importer = ProductImporter(
+            batch_size=options['batch_size'],
+            reindex=not options['no_reindex'],
+            progress=report,
+        )
+        self.stdout.write(f'Importing products from {path}...')
+        if path == '-':
+            result = importer.run(read_rows(sys.stdin, file_format))
+        else:
+            try:
+                stream = open(path, newline='', encoding='utf-8-sig')
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+            with stream:
+                result = importer.run(read_rows(stream, file_format))
+
+        for line, message in result.errors:
+            self.stdout.write(self.style.WARNING(f'  line {line}: {message}'))
+        if result.failed > len(result.errors):
+            self.stdout.write(self.style.WARNING(f'  ... and {result.failed - len(result.errors)} more errors'))
+
+        elapsed = time.monotonic() - started
+        rate = result.rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created + result.updated} of {result.rows} rows '
+            f'({result.created} created, {result.updated} updated, {result.failed} failed) '
+            f'in {elapsed:.1f}s ({rate:,.0f} rows/s)!'
+        ))
@@ -0,0 +1,27 @@
+# products/management/commands/rebuild_rating_summaries.py
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.ratings import rebuild_rating_summaries
+
+
+class Command(BaseCommand):
+    help = 'Backfill or repair the denormalized product rating summaries from reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            action='append',
+            dest='slugs',
+            help='Only rebuild the summary for the product with this slug (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        product_ids = None
+        if options['slugs']:
+            product_ids = list(Product.objects.filter(slug__in=options['slugs']).values_list('id', flat=True))
+            self.stdout.write(f'Rebuilding rating summaries for {len(product_ids)} products...')
+        else:
+            self.stdout.write('Rebuilding rating summaries for all reviewed products...')
+
+        written = rebuild_rating_summaries(product_ids=product_ids)
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {written} rating summaries!'))
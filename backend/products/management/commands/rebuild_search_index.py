@@ -0,0 +1,23 @@
+# products/management/commands/rebuild_search_index.py
+import time
+from django.core.management.base import BaseCommand
+from products.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of products indexed per batch (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding product search index...')
+        started = time.monotonic()
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Successfully indexed {indexed} products in {elapsed:.1f}s!'))
@@ -0,0 +1,38 @@
+# products/media.py
+"""
+Media URL resolution for API responses.
+
+URLs are built by joining a base URL with the stored file name, without
+going through storage.url() or parsing the request for every image. The base
+is, in order of preference:
+
+- settings.MEDIA_BASE_URL (e.g. a CDN prefix), when set
+- the request's absolute MEDIA_URL, computed once per request
+- the bare MEDIA_URL, outside of a request (exports, background jobs)
+"""
+from django.conf import settings
+from django.utils.encoding import filepath_to_uri
+
+
+def _with_trailing_slash(url):
+    return url if url.endswith('/') else f'{url}/'
+
+
+def media_base_url(request=None):
+    configured = getattr(settings, 'MEDIA_BASE_URL', '')
+    if configured:
+        return _with_trailing_slash(configured)
+    if request is None:
+        return _with_trailing_slash(settings.MEDIA_URL)
+    base = getattr(request, '_media_base_url', None)
+    if base is None:
+        base = _with_trailing_slash(request.build_absolute_uri(settings.MEDIA_URL))
+        request._media_base_url = base
+    return base
+
+
+def media_url(name, request=None):
+    """Public URL of a stored media file name, or None for an empty name."""
+    if not name:
+        return None
+    return media_base_url(request) + filepath_to_uri(name).lstrip('/')
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+DOCUMENT_TABLE = 'products_productsearchdocument'
+FTS_TABLE = 'products_productsearchdocument_fts'
+COLUMNS = 'name, shop_name, category, specifications'
+
+SQLITE_FORWARD = [
+    # External-content FTS5 table over the document table; the triggers keep
+    # the inverted index in step with every INSERT/UPDATE/DELETE on it.
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        {COLUMNS}, content='{DOCUMENT_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {COLUMNS})
+        VALUES (new.id, new.name, new.shop_name, new.category, new.specifications);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS})
+        VALUES ('delete', old.id, old.name, old.shop_name, old.category, old.specifications);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS})
+        VALUES ('delete', old.id, old.name, old.shop_name, old.category, old.specifications);
+        INSERT INTO {FTS_TABLE}(rowid, {COLUMNS})
+        VALUES (new.id, new.name, new.shop_name, new.category, new.specifications);
+    END""",
+]
+
+SQLITE_BACKWARD = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRES_FORWARD = [
+    f"""ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(shop_name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(specifications, '')), 'D')
+    ) STORED""",
+    f'CREATE INDEX {DOCUMENT_TABLE}_vector_idx ON {DOCUMENT_TABLE} USING GIN (search_vector)',
+]
+
+POSTGRES_BACKWARD = [
+    f'DROP INDEX IF EXISTS {DOCUMENT_TABLE}_vector_idx',
+    f'ALTER TABLE {DOCUMENT_TABLE} DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_rating_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('shop_name', models.CharField(blank=True, max_length=255)),
+                ('category', models.CharField(blank=True, max_length=255)),
+                ('specifications', models.TextField(blank=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='products.product')),
+            ],
+        ),
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:11
+
+from django.db import migrations, models
+
+from products.richtext import make_excerpt, sanitize_html
+
+BATCH_SIZE = 500
+
+
+def render_descriptions(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductAdditionalDescription = apps.get_model('products', 'ProductAdditionalDescription')
+
+    batch = []
+    for product in Product.objects.only('pk', 'description').iterator(chunk_size=BATCH_SIZE):
+        product.description_html = sanitize_html(product.description)
+        product.description_excerpt = make_excerpt(product.description_html)
+        batch.append(product)
+        if len(batch) >= BATCH_SIZE:
+            Product.objects.bulk_update(batch, ['description_html', 'description_excerpt'])
+            batch = []
+    Product.objects.bulk_update(batch, ['description_html', 'description_excerpt'])
+
+    batch = []
+    for extra in ProductAdditionalDescription.objects.only('pk', 'description').iterator(chunk_size=BATCH_SIZE):
+        extra.description_html = sanitize_html(extra.description)
+        batch.append(extra)
+        if len(batch) >= BATCH_SIZE:
+            ProductAdditionalDescription.objects.bulk_update(batch, ['description_html'])
+            batch = []
+    ProductAdditionalDescription.objects.bulk_update(batch, ['description_html'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='description_excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='description_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productadditionaldescription',
+            name='description_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_descriptions, migrations.RunPython.noop),
+    ]
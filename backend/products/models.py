@@ -1,9 +1,11 @@
 # products/models.py
 import uuid
 from django.db import models
+from django.db.models.functions import Lower
 from django.conf import settings
 from shops.models import Shop
 from ckeditor.fields import RichTextField
+from .richtext import make_excerpt, sanitize_html
 
 class Color(models.Model):
     name = models.CharField(max_length=50, unique=True, help_text="e.g., Red, Ocean Blue")
@@ -27,6 +29,8 @@ class Size(models.Model):
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Resized variants written for `image`, see products/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.SlugField(unique=True)
     
     class Meta:
@@ -39,6 +43,8 @@ class Category(models.Model):
 class SubCategory(models.Model):
     name = models.CharField(max_length=100)
     image = models.ImageField(upload_to='subcategories/', blank=True, null=True)
+    # Resized variants written for `image`, see products/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.SlugField(unique=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='subcategories')
     
@@ -55,26 +61,66 @@ class Product(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
     description = RichTextField()
+    # Sanitized rendering and plain-text excerpt of `description`, computed on save
+    description_html = models.TextField(blank=True, editable=False)
+    description_excerpt = models.CharField(max_length=255, blank=True, editable=False)
     sub_category = models.ForeignKey(SubCategory, on_delete=models.PROTECT, related_name='products')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     stock = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
     thumbnail = models.ImageField(upload_to='products/thumbnails/', blank=True, null=True)
+    # Resized variants written for `thumbnail`, see products/images.py
+    thumbnail_variants = models.JSONField(default=dict, blank=True, editable=False)
     colors = models.ManyToManyField(Color, blank=True, related_name='products')
     sizes = models.ManyToManyField(Size, blank=True, related_name='products')
+    # Detail page views, written in batches from a buffer by products.view_counts
+    view_count = models.PositiveBigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']  # Order by newest first
+        # The catalog only ever lists active products, so the indexes are
+        # partial on is_active rather than leading with a boolean column
+        # (which SQLite cannot use for Django's bare `WHERE is_active`).
+        indexes = [
+            # Catalog listing, newest first
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True), name='product_active_created_idx'),
+            # Category/sub-category filters combined with price ranges
+            models.Index(fields=['sub_category', 'price'], condition=models.Q(is_active=True), name='product_active_sub_price_idx'),
+            # Shop pages and the brands filter, newest first
+            models.Index(fields=['shop', '-created_at'], condition=models.Q(is_active=True), name='product_shop_active_idx'),
+            # "Most viewed" sorting
+            models.Index(fields=['-view_count'], condition=models.Q(is_active=True), name='product_active_views_idx'),
+            # Case-insensitive name lookups of checkout items (orders.checkout)
+            models.Index(Lower('name'), name='product_name_lower_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.description_html = sanitize_html(self.description)
+        self.description_excerpt = make_excerpt(self.description_html)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'description' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'description_html', 'description_excerpt'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the persisted sub-category/active flag so signals can tell
+        # whether a save changed the category tree counts.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
 class ProductAdditionalImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='additional_images')
     image = models.ImageField(upload_to='products/additional_images/')
+    # Resized variants written for `image`, see products/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     class Meta:
         verbose_name_plural = "Product Additional Images"
     def __str__(self):
@@ -83,9 +129,19 @@ class ProductAdditionalImage(models.Model):
 class ProductAdditionalDescription(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='additional_descriptions')
     description = RichTextField()
+    # Sanitized rendering of `description`, computed on save
+    description_html = models.TextField(blank=True, editable=False)
+
     def __str__(self):
         return f"Additional description for {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        self.description_html = sanitize_html(self.description)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'description' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'description_html'}
+        super().save(*args, **kwargs)
+
 class ProductSpecification(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='specifications')
     name = models.CharField(max_length=255, help_text="e.g., Material, Weight (Not for Color or Size)")
@@ -103,3 +159,78 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     class Meta:
         unique_together = ('user', 'product')
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='review_product_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the persisted product/rating so the rating summary can be
+        # adjusted incrementally when a review is edited.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+class ProductRatingSummary(models.Model):
+    """
+    Denormalized review aggregates for a product, kept in sync with Review
+    writes by products.ratings so catalog pages never aggregate per row.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Product Rating Summaries"
+
+    def __str__(self):
+        return f"{self.average_rating:.2f} ({self.review_count} reviews) for {self.product_id}"
+
+    @property
+    def histogram(self):
+        return {str(star): getattr(self, f'stars_{star}') for star in range(1, 6)}
+
+class ProductSearchDocument(models.Model):
+    """
+    Denormalized text that the full-text index is built from (see
+    products.search). The database-specific index (an FTS5 table on SQLite,
+    a generated tsvector column with a GIN index on PostgreSQL) is created
+    by migration 0005 and kept in sync by the database itself.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='search_document')
+    name = models.CharField(max_length=255)
+    shop_name = models.CharField(max_length=255, blank=True)
+    category = models.CharField(max_length=255, blank=True)
+    specifications = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Search document for {self.name}"
+
+class SimilarProduct(models.Model):
+    """
+    Precomputed nearest neighbours of a product, written in bulk by
+    products.similarity (the `compute_similar_products` command). Serving
+    reads one product's rows in rank order through the (product, rank)
+    unique index.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='similarproduct_product_rank_uniq'),
+            models.UniqueConstraint(fields=['product', 'similar'], name='similarproduct_product_similar_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.similar_id} similar to {self.product_id} (#{self.rank})"
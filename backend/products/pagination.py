@@ -0,0 +1,158 @@
+# products/pagination.py
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over (ordering field, id).
+
+    Each page is fetched with a WHERE clause on the last row of the previous
+    page instead of an OFFSET, and no COUNT(*) is issued, so page 500 costs
+    the same as page 1. The ordering comes from the filterset's `ordering`
+    parameter (only orderings it declares are accepted) and is baked into the
+    opaque cursor, so a cursor cannot be replayed against another ordering.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        cursor = self.decode_cursor(request)
+
+        field_name = self.ordering.lstrip('-')
+        model_field = queryset.model._meta.get_field(field_name)
+        pk_field = queryset.model._meta.pk
+        reverse = bool(cursor and cursor['r'])
+        # Walking backwards from a cursor flips the direction of the scan.
+        descending = self.ordering.startswith('-') != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{field_name}', f'{prefix}{pk_field.name}')
+
+        if cursor:
+            lookup = 'lt' if descending else 'gt'
+            try:
+                value = model_field.to_python(cursor['v'])
+                pk = pk_field.to_python(cursor['id'])
+                # A decodable but forged cursor may carry lists, objects or nulls
+                queryset = queryset.filter(
+                    Q(**{f'{field_name}__{lookup}': value})
+                    | Q(**{field_name: value, f'{pk_field.name}__{lookup}': pk})
+                )
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.field_name = field_name
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering_fields(self, view):
+        """Orderings accepted by the view's filterset `ordering` filter."""
+        filterset_class = getattr(view, 'filterset_class', None)
+        ordering_filter = filterset_class.base_filters.get('ordering') if filterset_class else None
+        if ordering_filter is None:
+            return {self.default_ordering.lstrip('-'): self.default_ordering.lstrip('-')}
+        return ordering_filter.param_map
+
+    def get_ordering(self, request, view):
+        param = request.query_params.get(self.ordering_query_param, '').split(',')[0].strip()
+        param_map = self.get_ordering_fields(view)
+        name = param.lstrip('-')
+        if name not in param_map:
+            return self.default_ordering
+        return ('-' if param.startswith('-') else '') + param_map[name]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            cursor = {'o': cursor['o'], 'v': cursor['v'], 'id': cursor['id'], 'r': bool(cursor.get('r'))}
+        except (binascii.Error, ValueError, TypeError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor['o'] != self.ordering:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.field_name)
+        cursor = {
+            'o': self.ordering,
+            'v': value.isoformat() if hasattr(value, 'isoformat') else str(value),
+            'id': str(instance.pk),
+            'r': int(reverse),
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8'))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded.decode('ascii').rstrip('='))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
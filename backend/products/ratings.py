@@ -0,0 +1,127 @@
+# products/ratings.py
+"""
+Maintenance of ProductRatingSummary rows.
+
+Review writes adjust the summary with a single conditional UPDATE so the
+catalog never has to aggregate reviews per product at read time.
+rebuild_rating_summaries() recomputes the rows from scratch and is used by
+the backfill command and as a fallback when a summary row is missing.
+"""
+from django.db.models import Count, Exists, F, FloatField, OuterRef, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import ProductRatingSummary, Review
+
+STAR_FIELDS = {star: f'stars_{star}' for star in range(1, 6)}
+SUMMARY_FIELDS = ['review_count', 'rating_total', 'average_rating', *STAR_FIELDS.values()]
+
+
+def _average_after(count_delta, total_delta):
+    """SQL expression for the average once the deltas have been applied."""
+    total = Cast(F('rating_total') + total_delta, FloatField())
+    count = NullIf(F('review_count') + count_delta, Value(0))
+    return Coalesce(total / count, Value(0.0), output_field=FloatField())
+
+
+def apply_rating_deltas(product_id, star_deltas, rebuild_missing=True):
+    """
+    Apply per-star deltas (e.g. {4: 1} for a new 4-star review) to a product's
+    summary in one UPDATE. Returns False if there was no summary row.
+    """
+    star_deltas = {star: delta for star, delta in star_deltas.items() if star in STAR_FIELDS and delta}
+    if not star_deltas:
+        return True
+
+    count_delta = sum(star_deltas.values())
+    total_delta = sum(star * delta for star, delta in star_deltas.items())
+    updates = {STAR_FIELDS[star]: F(STAR_FIELDS[star]) + delta for star, delta in star_deltas.items()}
+
+    updated = ProductRatingSummary.objects.filter(product_id=product_id).update(
+        review_count=F('review_count') + count_delta,
+        rating_total=F('rating_total') + total_delta,
+        average_rating=_average_after(count_delta, total_delta),
+        **updates,
+    )
+    if not updated and rebuild_missing:
+        # Products reviewed before summaries existed: compute from scratch.
+        rebuild_rating_summaries(product_ids=[product_id])
+    return bool(updated)
+
+
+def review_saved(review, created):
+    """Adjust summaries after a Review has been created or updated."""
+    previous = getattr(review, '_loaded_values', None)
+    if created or not previous:
+        apply_rating_deltas(review.product_id, {review.rating: 1})
+    else:
+        old_product_id = previous.get('product_id', review.product_id)
+        old_rating = previous.get('rating', review.rating)
+        if old_product_id == review.product_id:
+            if old_rating != review.rating:
+                apply_rating_deltas(review.product_id, {old_rating: -1, review.rating: 1})
+        else:
+            apply_rating_deltas(old_product_id, {old_rating: -1})
+            apply_rating_deltas(review.product_id, {review.rating: 1})
+
+    review._loaded_values = {'product_id': review.product_id, 'rating': review.rating}
+
+
+def review_deleted(review):
+    """Adjust summaries after a Review has been deleted."""
+    previous = getattr(review, '_loaded_values', None) or {}
+    # Never recreate a summary on delete: during a product cascade the
+    # summary may already be gone along with the product itself.
+    apply_rating_deltas(
+        previous.get('product_id', review.product_id),
+        {previous.get('rating', review.rating): -1},
+        rebuild_missing=False,
+    )
+
+
+def rebuild_rating_summaries(product_ids=None, batch_size=500):
+    """
+    Recompute summaries from the Review table, for all products or only the
+    given ids. Returns the number of summaries written.
+    """
+    reviews = Review.objects.all()
+    summaries = ProductRatingSummary.objects.all()
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+        summaries = summaries.filter(product_id__in=product_ids)
+
+    rows = reviews.order_by().values('product_id').annotate(
+        review_count=Count('id'),
+        rating_total=Sum('rating'),
+        **{field: Count('id', filter=Q(rating=star)) for star, field in STAR_FIELDS.items()},
+    )
+    objs = [
+        ProductRatingSummary(
+            product_id=row['product_id'],
+            review_count=row['review_count'],
+            rating_total=row['rating_total'],
+            average_rating=row['rating_total'] / row['review_count'],
+            **{field: row[field] for field in STAR_FIELDS.values()},
+        )
+        for row in rows
+    ]
+    ProductRatingSummary.objects.bulk_create(
+        objs,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=SUMMARY_FIELDS,
+    )
+
+    # Products whose reviews have all gone away keep a zeroed summary.
+    summaries.filter(~Exists(Review.objects.filter(product_id=OuterRef('product_id')))).update(
+        **{field: 0 for field in SUMMARY_FIELDS}
+    )
+    return len(objs)
+
+
+def get_rating_summary(product):
+    """Return the product's summary, or None if it has never been reviewed."""
+    try:
+        return product.rating_summary
+    except ProductRatingSummary.DoesNotExist:
+        return None
@@ -0,0 +1,170 @@
+# products/richtext.py
+"""
+Sanitizing and summarizing of rich-text (CKEditor) content.
+
+sanitize_html() keeps an allowlist of tags and attributes, drops scripts,
+styles and event handlers, neutralizes unsafe URLs and normalizes the
+markup (lower-case tags, quoted attributes, balanced closing tags).
+make_excerpt() derives a short plain-text summary. Both run once when a
+product or additional description is saved; responses serve the stored
+results.
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+
+EXCERPT_LENGTH = 200
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'code', 'del', 'div', 'em',
+    'figcaption', 'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img',
+    'ins', 'li', 'ol', 'p', 'pre', 's', 'small', 'span', 'strike', 'strong', 'sub',
+    'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+# Elements dropped together with everything inside them
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template', 'head', 'title'}
+# Elements that end a line of text in the excerpt
+BLOCK_TAGS = {
+    'blockquote', 'br', 'div', 'figcaption', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'li', 'p', 'pre', 'td', 'th', 'tr',
+}
+
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title', 'target'},
+    'abbr': {'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+    'ol': {'start', 'type'},
+}
+# Start tags that implicitly close open elements, as HTML parsers do
+# (e.g. "<li>one<li>two" or a list started inside a paragraph)
+IMPLIED_END_TAGS = {
+    'li': {'li'},
+    'tr': {'tr', 'td', 'th'},
+    'td': {'td', 'th'},
+    'th': {'td', 'th'},
+}
+PARAGRAPH_CLOSERS = {
+    'blockquote', 'div', 'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+    'ol', 'p', 'pre', 'table', 'ul',
+}
+
+URL_ATTRIBUTES = {'href', 'src'}
+ALLOWED_URL_SCHEMES = {'http', 'https', 'mailto', 'tel'}
+
+_SCHEME_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9+.-]*):')
+_CONTROL_RE = re.compile(r'[\x00-\x20]+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _is_safe_url(value):
+    # Browsers ignore control characters and whitespace inside schemes ("java\tscript:")
+    match = _SCHEME_RE.match(_CONTROL_RE.sub('', value))
+    return match is None or match.group(1).lower() in ALLOWED_URL_SCHEMES
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.output = []
+        self.text = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append('\n')
+        if tag not in ALLOWED_TAGS:
+            return
+        self._close_implied(tag)
+
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+        rendered = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not _is_safe_url(value):
+                continue
+            rendered.append(f' {name}="{escape(value, quote=True)}"')
+        if tag == 'a' and any(name == 'target' for name, _ in attrs):
+            rendered.append(' rel="noopener noreferrer"')
+        self.output.append(f"<{tag}{''.join(rendered)}>")
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def _close_until(self, tag):
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.output.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def _close_implied(self, tag):
+        if tag in PARAGRAPH_CLOSERS and 'p' in self.open_tags:
+            self._close_until('p')
+        implied = IMPLIED_END_TAGS.get(tag, ())
+        while self.open_tags and self.open_tags[-1] in implied:
+            self._close_until(self.open_tags[-1])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append('\n')
+        if tag in self.open_tags:
+            # Close anything left open inside this element
+            self._close_until(tag)
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.output.append(escape(data, quote=False))
+        self.text.append(data)
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.output.append(f'</{self.open_tags.pop()}>')
+
+
+def _parse(html):
+    parser = _Sanitizer()
+    parser.feed(html or '')
+    parser.close()
+    return parser
+
+
+def sanitize_html(html):
+    """Return an allowlisted, normalized copy of rich-text HTML."""
+    return ''.join(_parse(html).output).strip()
+
+
+def html_to_text(html):
+    """Plain text of rich-text HTML with whitespace collapsed."""
+    return _WHITESPACE_RE.sub(' ', ''.join(_parse(html).text)).strip()
+
+
+def make_excerpt(html, length=EXCERPT_LENGTH):
+    """Plain-text excerpt of at most `length` characters, cut at a word boundary."""
+    text = html_to_text(html)
+    if len(text) <= length:
+        return text
+    cut = text[:length - 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip(' ,.;:-') + '…'
@@ -0,0 +1,147 @@
+# products/search.py
+"""
+Ranked full-text search over products.
+
+ProductSearchDocument holds one row of denormalized text per product (name,
+shop name, sub-category/category and specifications). The inverted index on
+top of it is database specific and maintained by the database itself:
+
+- SQLite: an external-content FTS5 table ranked with bm25()
+- PostgreSQL: a generated tsvector column with a GIN index ranked with ts_rank_cd()
+
+Other backends fall back to icontains on the product name.
+"""
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from .models import Product, ProductSearchDocument
+
+DOCUMENT_TABLE = ProductSearchDocument._meta.db_table
+FTS_TABLE = f'{DOCUMENT_TABLE}_fts'
+DOCUMENT_FIELDS = ['name', 'shop_name', 'category', 'specifications']
+# Column weights for bm25(), in FTS5 column order (name, shop, category, specs)
+SQLITE_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(query):
+    """Split user input into safe search terms (letters and digits only)."""
+    return _TERM_RE.findall((query or '').lower())[:MAX_TERMS]
+
+
+def build_document(product):
+    """Build the search document for a product with shop, category and specifications loaded."""
+    sub_category = product.sub_category
+    return ProductSearchDocument(
+        product=product,
+        name=product.name,
+        shop_name=product.shop.name,
+        category=f"{sub_category.name} {sub_category.category.name}",
+        specifications=' '.join(f"{spec.name} {spec.value}" for spec in product.specifications.all()),
+    )
+
+
+def index_products(products, batch_size=500):
+    """
+    (Re)index the given products, which may be a queryset or an iterable of
+    ids. Returns the number of documents written.
+    """
+    if not hasattr(products, 'model'):
+        products = Product.objects.filter(pk__in=list(products))
+    products = products.select_related('shop', 'sub_category__category').prefetch_related('specifications')
+
+    documents = [build_document(product) for product in products]
+    ProductSearchDocument.objects.bulk_create(
+        documents,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=DOCUMENT_FIELDS,
+    )
+    return len(documents)
+
+
+def rebuild_index(batch_size=500):
+    """Reindex every product and compact the index. Returns the number of documents."""
+    total = 0
+    last_pk = None
+    while True:
+        batch = Product.objects.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        ids = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        total += index_products(ids, batch_size=batch_size)
+        last_pk = ids[-1]
+
+    connection = connections[ProductSearchDocument.objects.db]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def search_products(queryset, query, rank=True):
+    """
+    Restrict a product queryset to matches for `query`. Every term must
+    match, as a prefix, in any indexed column.
+
+    With rank=True the index is joined into the query, which is annotated
+    with `search_rank` and ordered best match first; such a queryset must be
+    evaluated at the top level. With rank=False the match is expressed as a
+    self-contained `pk IN (...)` subquery, so the result can itself be used
+    inside other subqueries (facet counts, admin search).
+    """
+    terms = tokenize(query)
+    if not terms:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        if not rank:
+            return queryset.filter(pk__in=RawSQL(
+                f'SELECT {DOCUMENT_TABLE}.product_id FROM {DOCUMENT_TABLE} '
+                f'JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = {DOCUMENT_TABLE}.id '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [match],
+            ))
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        queryset = queryset.extra(
+            tables=[DOCUMENT_TABLE, FTS_TABLE],
+            where=[_join_condition(queryset), f'{FTS_TABLE}.rowid = {DOCUMENT_TABLE}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            # bm25() is lower-is-better, so negate it to rank like PostgreSQL
+            select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+        )
+    elif vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        if not rank:
+            return queryset.filter(pk__in=RawSQL(
+                f"SELECT product_id FROM {DOCUMENT_TABLE} WHERE search_vector @@ to_tsquery('simple', %s)",
+                [tsquery],
+            ))
+        queryset = queryset.extra(
+            tables=[DOCUMENT_TABLE],
+            where=[_join_condition(queryset), f"{DOCUMENT_TABLE}.search_vector @@ to_tsquery('simple', %s)"],
+            params=[tsquery],
+            select={'search_rank': f"ts_rank_cd({DOCUMENT_TABLE}.search_vector, to_tsquery('simple', %s))"},
+            select_params=[tsquery],
+        )
+    else:
+        for term in terms:
+            queryset = queryset.filter(name__icontains=term)
+        return queryset
+
+    return queryset.order_by('-search_rank')
+
+
+def _join_condition(queryset):
+    opts = queryset.model._meta
+    return f'{DOCUMENT_TABLE}.product_id = {opts.db_table}.{opts.pk.column}'
@@ -1,7 +1,10 @@
 # products/serializers.py
 from rest_framework import serializers
 from .models import *
+from shops.models import Shop
 from shops.serializers import ShopSerializer
+from .ratings import get_rating_summary
+from .fields import ImageSrcsetField, MediaUrlField, RenderedHtmlField
 
 class ColorSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,15 +17,20 @@ class SizeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 class SubCategorySerializer(serializers.ModelSerializer):
+    image = MediaUrlField(required=False, allow_null=True)
+    image_srcset = ImageSrcsetField(source='image')
+
     class Meta:
         model = SubCategory
-        fields = '__all__'
+        exclude = ['image_variants']
 
 class CategorySerializer(serializers.ModelSerializer):
     subcategories = SubCategorySerializer(many=True, read_only=True)
+    image = MediaUrlField(required=False, allow_null=True)
+    image_srcset = ImageSrcsetField(source='image')
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'image', 'subcategories']
+        fields = ['id', 'name', 'slug', 'image', 'image_srcset', 'subcategories']
 
 class ProductSpecificationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -30,15 +38,17 @@ class ProductSpecificationSerializer(serializers.ModelSerializer):
         fields = ['name', 'value']
 
 class ProductAdditionalImageSerializer(serializers.ModelSerializer):
-    image = serializers.SerializerMethodField()
+    image = MediaUrlField(read_only=True)
+    srcset = ImageSrcsetField(source='image')
     class Meta:
         model = ProductAdditionalImage
-        fields = ['id', 'image']
-    def get_image(self, obj):
-        request = self.context.get('request')
-        if obj.image and hasattr(obj.image, 'url'):
-            return request.build_absolute_uri(obj.image.url)
-        return None
+        fields = ['id', 'image', 'srcset']
+
+class ProductAdditionalDescriptionSerializer(serializers.ModelSerializer):
+    description = RenderedHtmlField('description_html', read_only=True)
+    class Meta:
+        model = ProductAdditionalDescription
+        fields = ['id', 'description']
 
 class ReviewSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField()
@@ -46,36 +56,84 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ['id', 'user', 'rating', 'comment', 'created_at']
 
+class ShopCardSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Shop
+        fields = ['id', 'name', 'slug']
+
+class SubCategoryCardSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SubCategory
+        fields = ['id', 'name', 'slug']
+
 class ProductSerializer(serializers.ModelSerializer):
     shop = ShopSerializer(read_only=True)
+    description = RenderedHtmlField('description_html')
     sub_category = SubCategorySerializer(read_only=True)
     specifications = ProductSpecificationSerializer(many=True, read_only=True)
     additional_images = ProductAdditionalImageSerializer(many=True, read_only=True)
+    additional_descriptions = ProductAdditionalDescriptionSerializer(many=True, read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
     colors = ColorSerializer(many=True, read_only=True)
     sizes = SizeSerializer(many=True, read_only=True)
-    thumbnail_url = serializers.SerializerMethodField()
+    thumbnail_url = MediaUrlField(source='thumbnail', read_only=True)
+    thumbnail_srcset = ImageSrcsetField(source='thumbnail')
     rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
+        # view_count is left out: flushes change it without touching updated_at or the
+        # catalog cache generation, so cached and ETagged bodies would serve stale counts.
+        # Shop owners read it from the shop traffic endpoint.
         fields = [
-            'id', 'shop', 'name', 'slug', 'description', 'sub_category', 
+            'id', 'shop', 'name', 'slug', 'description', 'additional_descriptions', 'sub_category', 
             'price', 'discount_price', 'stock', 'is_active',
-            'thumbnail_url', 'specifications', 'additional_images',
-            'colors', 'sizes', 'reviews', 'rating', 'review_count'
+            'thumbnail_url', 'thumbnail_srcset', 'specifications', 'additional_images',
+            'colors', 'sizes', 'reviews', 'rating', 'review_count', 'rating_histogram'
         ]
         
-    def get_thumbnail_url(self, obj):
-        request = self.context.get('request')
-        if obj.thumbnail and hasattr(obj.thumbnail, 'url'):
-            return request.build_absolute_uri(obj.thumbnail.url)
-        return None
-        
     def get_rating(self, obj):
-        from django.db.models import Avg
-        return obj.reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+        summary = get_rating_summary(obj)
+        return summary.average_rating if summary else 0
 
     def get_review_count(self, obj):
-        return obj.reviews.count()
+        summary = get_rating_summary(obj)
+        return summary.review_count if summary else 0
+
+    def get_rating_histogram(self, obj):
+        summary = get_rating_summary(obj)
+        return summary.histogram if summary else ProductRatingSummary().histogram
+
+
+class ProductCardSerializer(ProductSerializer):
+    """
+    Compact representation used for catalog grids. Leaves out the rich-text
+    description (only its plain-text excerpt is sent), reviews,
+    specifications and additional images.
+    """
+    shop = ShopCardSerializer(read_only=True)
+    sub_category = SubCategoryCardSerializer(read_only=True)
+    excerpt = serializers.CharField(source='description_excerpt', read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = [
+            'id', 'shop', 'name', 'slug', 'excerpt', 'sub_category',
+            'price', 'discount_price', 'stock', 'is_active',
+            'thumbnail_url', 'thumbnail_srcset', 'colors', 'sizes', 'rating', 'review_count'
+        ]
+
+
+class ProductBatchSerializer(ProductSerializer):
+    """
+    Minimal per-product data for refreshing carts and checkout: current
+    pricing, stock and availability.
+    """
+    shop = ShopCardSerializer(read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = [
+            'id', 'slug', 'name', 'shop', 'price', 'discount_price',
+            'stock', 'is_active', 'thumbnail_url', 'thumbnail_srcset'
+        ]
@@ -0,0 +1,164 @@
+# products/signals.py
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from shops.models import Shop
+from . import ratings, search
+from .images import IMAGE_FIELDS, schedule_variants
+from .cache import CATALOG, invalidate
+from .category_tree import invalidate_category_tree
+from .conditional import touch_products
+from .models import (
+    Category, Color, Product, ProductAdditionalDescription, ProductAdditionalImage,
+    ProductSpecification, Review, Size, SubCategory,
+)
+
+# Models whose changes can alter any cached catalog response
+CATALOG_MODELS = [
+    Product, Review, Category, SubCategory, Color, Size, Shop,
+    ProductSpecification, ProductAdditionalImage, ProductAdditionalDescription,
+]
+
+
+@receiver(post_save, sender=Review)
+def update_rating_summary_on_review_save(sender, instance, created, **kwargs):
+    ratings.review_saved(instance, created)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_summary_on_review_delete(sender, instance, **kwargs):
+    ratings.review_deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw=False, **kwargs):
+    # Deleting a product cascades to its search document, so only saves need handling
+    if not raw:
+        search.index_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductSpecification)
+def index_product_on_specification_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductSpecification)
+def index_product_on_specification_delete(sender, instance, origin=None, **kwargs):
+    # Specifications removed by a cascade (product or shop deletion) belong to
+    # a product that is going away too; reindexing it would resurrect its document.
+    if isinstance(origin, ProductSpecification) or getattr(origin, 'model', None) is ProductSpecification:
+        search.index_products([instance.product_id])
+
+
+@receiver(post_save, sender=Shop)
+def index_products_on_shop_rename(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products(instance.products.exclude(search_document__shop_name=instance.name))
+
+
+@receiver(post_save, sender=Category)
+def index_products_on_category_rename(sender, instance, raw=False, **kwargs):
+    if not raw:
+        for sub_category in instance.subcategories.all():
+            index_products_on_sub_category_rename(SubCategory, sub_category)
+
+
+@receiver(post_save, sender=SubCategory)
+def index_products_on_sub_category_rename(sender, instance, raw=False, **kwargs):
+    if not raw:
+        category = f"{instance.name} {instance.category.name}"
+        search.index_products(instance.products.exclude(search_document__category=category))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+def invalidate_category_tree_on_change(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_category_tree()
+
+
+@receiver(post_save, sender=Product)
+def invalidate_category_tree_on_product_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_values', None) or {}
+    if (
+        created
+        or not previous
+        or previous.get('sub_category_id', instance.sub_category_id) != instance.sub_category_id
+        or previous.get('is_active', instance.is_active) != instance.is_active
+    ):
+        invalidate_category_tree()
+    instance._loaded_values = {**previous, 'sub_category_id': instance.sub_category_id, 'is_active': instance.is_active}
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_category_tree_on_product_delete(sender, instance, **kwargs):
+    invalidate_category_tree()
+
+
+# Objects embedded in the product detail body bump Product.updated_at so the
+# detail endpoint's ETag / Last-Modified change with them (products/conditional.py).
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=ProductAdditionalImage)
+@receiver([post_save, post_delete], sender=ProductAdditionalDescription)
+@receiver([post_save, post_delete], sender=ProductSpecification)
+def touch_product_on_related_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_products([instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.colors.through)
+@receiver(m2m_changed, sender=Product.sizes.through)
+def touch_products_on_variant_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            touch_products([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        touch_products(pk_set)
+    elif action == 'pre_clear':
+        touch_products(instance.products.all())
+
+
+@receiver(post_save, sender=Color)
+@receiver(pre_delete, sender=Color)
+@receiver(post_save, sender=Size)
+@receiver(pre_delete, sender=Size)
+@receiver(post_save, sender=SubCategory)
+def touch_linked_products(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_products(instance.products.all())
+
+
+@receiver(post_save, sender=Category)
+def touch_products_on_category_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_products(Product.objects.filter(sub_category__category=instance))
+
+
+def schedule_image_variants(sender, instance, raw=False, **kwargs):
+    # Variants already generated for the current file are skipped by the worker
+    if not raw:
+        for field_name in IMAGE_FIELDS[sender._meta.label]:
+            schedule_variants(getattr(instance, field_name))
+
+
+for model in (Product, ProductAdditionalImage, Category, SubCategory, Shop):
+    post_save.connect(schedule_image_variants, sender=model, dispatch_uid=f'image_variants_{model.__name__}')
+
+
+def invalidate_catalog_cache(sender, **kwargs):
+    if kwargs.get('raw'):
+        return
+    action = kwargs.get('action')
+    if action is None or action.startswith('post_'):
+        invalidate(CATALOG)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog_cache, sender=model, dispatch_uid=f'catalog_cache_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog_cache, sender=model, dispatch_uid=f'catalog_cache_delete_{model.__name__}')
+
+for through in (Product.colors.through, Product.sizes.through):
+    m2m_changed.connect(invalidate_catalog_cache, sender=through, dispatch_uid=f'catalog_cache_m2m_{through.__name__}')
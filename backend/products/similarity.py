@@ -0,0 +1,213 @@
+# products/similarity.py
+"""
+Offline computation of the "similar products" neighbour table.
+
+Each active product is described by feature vectors: its sub-category,
+colors, sizes and specification values ("material=cotton"), plus its
+effective price. Similarity between two products is a weighted sum of the
+cosine similarity of each vector group and a price proximity term. Only
+products in the same top-level category are compared, so every category is
+an independent block: its feature matrices are built with NumPy and scored
+in float32 row chunks sized from the category's product count, and the top
+K neighbours of each product are written to SimilarProduct.
+
+Incremental runs only recompute the categories that contain a product
+changed (or added, or deactivated) since its neighbours were computed, or
+whose stored neighbours changed since. Product.updated_at is already
+touched by color/size/specification edits (products.conditional), so those
+count as changes too.
+"""
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .cache import CATALOG, invalidate
+from .models import Category, Product, ProductSpecification, SimilarProduct
+
+TOP_K = 12
+# Size of the chunk x category float32 score matrix; scoring a chunk also
+# allocates a couple of temporaries of the same size
+CHUNK_BYTES = 32 * 1024 * 1024
+# Most frequent specification tokens kept as features per category
+MAX_SPEC_TOKENS = 512
+WEIGHTS = {
+    'sub_category': 0.35,
+    'specifications': 0.25,
+    'colors': 0.15,
+    'sizes': 0.10,
+    'price': 0.15,
+}
+# Price proximity is exp(-|log(p1 / p2)| / PRICE_SCALE): 0.25 at a 2x difference
+PRICE_SCALE = 0.5
+
+
+@dataclass
+class SimilarityResult:
+    categories: int = 0
+    products: int = 0
+    rows: int = 0
+
+
+def stale_category_ids():
+    """Categories whose neighbour rows are missing or older than a product they involve."""
+    products = Product.objects.annotate(computed_at=Max('similar_links__computed_at'))
+    changed = products.filter(
+        Q(is_active=True, computed_at__isnull=True)
+        | Q(is_active=False, computed_at__isnull=False)
+        | Q(updated_at__gt=F('computed_at'))
+    ).values_list('sub_category__category_id', flat=True)
+    # Products listing a neighbour that changed since, e.g. one moved to another category
+    referencing = SimilarProduct.objects.filter(
+        similar__updated_at__gt=F('computed_at'),
+    ).values_list('product__sub_category__category_id', flat=True)
+    return set(changed) | set(referencing)
+
+
+def _normalized(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def _link_matrix(pairs, index, width_index):
+    matrix = np.zeros((len(index), len(width_index)), dtype=np.float32)
+    if pairs:
+        rows, cols = zip(*((index[product_id], width_index[target]) for product_id, target in pairs))
+        matrix[list(rows), list(cols)] = 1
+    return _normalized(matrix)
+
+
+def _spec_token(name, value):
+    return f'{name.strip().lower()}={value.strip().lower()}'
+
+
+def build_features(category_id):
+    """
+    Feature arrays for the active products of one category:
+    (product ids, sub-category codes, log prices, {group: row-normalized matrix}).
+    """
+    rows = list(
+        Product.objects.filter(is_active=True, sub_category__category_id=category_id)
+        .order_by('pk')
+        .values_list('pk', 'sub_category_id', 'price', 'discount_price')
+    )
+    ids = [row[0] for row in rows]
+    index = {product_id: position for position, product_id in enumerate(ids)}
+    sub_categories = np.array([row[1] for row in rows], dtype=np.int64)
+    prices = np.array([float(row[3] or row[2]) for row in rows], dtype=np.float32)
+    log_prices = np.log(np.maximum(prices, 0.01))
+
+    matrices = {}
+    product_filter = {'product__is_active': True, 'product__sub_category__category_id': category_id}
+    for group, through, column in (
+        ('colors', Product.colors.through, 'color_id'),
+        ('sizes', Product.sizes.through, 'size_id'),
+    ):
+        pairs = list(through.objects.filter(**product_filter).values_list('product_id', column))
+        targets = {target: position for position, target in enumerate(sorted({target for _, target in pairs}))}
+        matrices[group] = _link_matrix(pairs, index, targets)
+
+    specs = [
+        (product_id, _spec_token(name, value))
+        for product_id, name, value in ProductSpecification.objects.filter(**product_filter)
+        .values_list('product_id', 'name', 'value')
+    ]
+    # Tokens carried by a single product cannot make two products similar
+    counts = Counter(token for _, token in specs)
+    vocabulary = [token for token, count in counts.most_common(MAX_SPEC_TOKENS) if count > 1]
+    tokens = {token: position for position, token in enumerate(vocabulary)}
+    matrices['specifications'] = _link_matrix(
+        [(product_id, token) for product_id, token in specs if token in tokens], index, tokens,
+    )
+    return ids, sub_categories, log_prices, matrices
+
+
+def chunk_rows(count, chunk_bytes=CHUNK_BYTES):
+    """Rows scored at once so that a chunk x `count` float32 matrix fits in `chunk_bytes`."""
+    return max(1, min(count, chunk_bytes // (np.dtype(np.float32).itemsize * max(count, 1))))
+
+
+def nearest_neighbours(sub_categories, log_prices, matrices, top_k=TOP_K, chunk_size=None):
+    """Yield (row, neighbour rows, scores) for every product, best first."""
+    count = len(sub_categories)
+    k = min(top_k, count - 1)
+    if k <= 0:
+        return
+    chunk_size = chunk_size or chunk_rows(count)
+    for start in range(0, count, chunk_size):
+        stop = min(start + chunk_size, count)
+        # Every term is computed in float32 and added in place
+        scores = np.equal(sub_categories[start:stop, None], sub_categories[None, :]).astype(np.float32)
+        scores *= WEIGHTS['sub_category']
+        for group, matrix in matrices.items():
+            if matrix.shape[1]:
+                term = matrix[start:stop] @ matrix.T
+                term *= WEIGHTS[group]
+                scores += term
+        term = np.abs(log_prices[start:stop, None] - log_prices[None, :])
+        term /= -PRICE_SCALE
+        np.exp(term, out=term)
+        term *= WEIGHTS['price']
+        scores += term
+        # Freed before argpartition allocates its chunk x count index array
+        del term
+        # A product is never its own neighbour
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        candidates = np.argpartition(scores, -k, axis=1)[:, -k:]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        neighbours = np.take_along_axis(candidates, order, axis=1)
+        neighbour_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        for offset in range(stop - start):
+            yield start + offset, neighbours[offset], neighbour_scores[offset]
+
+
+def compute_category(category_id, top_k=TOP_K, computed_at=None, batch_size=2000):
+    """Replace the neighbour rows of one category. Returns (products, rows written)."""
+    computed_at = computed_at or timezone.now()
+    ids, sub_categories, log_prices, matrices = build_features(category_id)
+    links = [
+        SimilarProduct(
+            product_id=ids[row],
+            similar_id=ids[neighbour],
+            score=round(float(score), 6),
+            rank=rank,
+            computed_at=computed_at,
+        )
+        for row, neighbours, scores in nearest_neighbours(sub_categories, log_prices, matrices, top_k)
+        for rank, (neighbour, score) in enumerate(zip(neighbours, scores), start=1)
+    ]
+    with transaction.atomic():
+        # Also clears rows of products deactivated since the last run
+        SimilarProduct.objects.filter(product__sub_category__category_id=category_id).delete()
+        SimilarProduct.objects.bulk_create(links, batch_size=batch_size)
+    return len(ids), len(links)
+
+
+def compute_similar_products(top_k=TOP_K, full=False, category_ids=None, progress=None):
+    """
+    Recompute neighbours for the given categories, every category (`full`),
+    or only the stale ones. `progress` is called with (category, products, rows).
+    """
+    # Taken before reading so products changed during the run stay stale
+    computed_at = timezone.now()
+    if category_ids is None:
+        category_ids = Category.objects.values_list('pk', flat=True) if full else stale_category_ids()
+
+    result = SimilarityResult()
+    for category in Category.objects.filter(pk__in=list(category_ids)).order_by('name'):
+        products, rows = compute_category(category.pk, top_k, computed_at)
+        result.categories += 1
+        result.products += products
+        result.rows += rows
+        if progress:
+            progress(category, products, rows)
+
+    if result.categories:
+        invalidate(CATALOG)
+    return result
@@ -0,0 +1,201 @@
+# products/suggest.py
+"""
+In-memory prefix index for search-box autocomplete.
+
+Every word of every active product, active shop and category name is a key
+in one sorted array; a query word matches the contiguous run of keys it is a
+prefix of, found with bisect. Entries are numbered by descending popularity
+(product views, summed over their products for shops and categories), so
+the top N matches are simply the N smallest entry numbers. For prefixes of
+up to PRECOMPUTED_PREFIX_LENGTH characters, where runs are long, the top
+MAX_LIMIT entries are precomputed at build time.
+
+Each process builds its index lazily on the first suggestion and keeps it
+until the catalog cache generation changes (products/cache.py; bumped by
+the catalog model signals) or it is older than PRODUCT_SUGGEST_MAX_AGE,
+which picks up new view counts. Looking up the generation is a cache read,
+done at most every PRODUCT_SUGGEST_CHECK_INTERVAL seconds; suggestions
+themselves never touch the database. Only the first build runs in a
+request; later rebuilds run on one background thread per process while
+every request keeps serving the previous index
+(PRODUCT_SUGGEST_REBUILD_IN_BACKGROUND).
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Sum
+
+from shops.models import Shop
+from .cache import CATALOG, get_generation
+from .models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+MAX_LIMIT = 20
+DEFAULT_LIMIT = 8
+PRECOMPUTED_PREFIX_LENGTH = 3
+MAX_QUERY_TERMS = 5
+
+Suggestion = namedtuple('Suggestion', ['type', 'name', 'slug'])
+
+_WORD_RE = re.compile(r'[^\W_]+')
+# Sorts after every character a normalized key can contain
+_KEY_END = '\U0010ffff'
+
+
+def normalize_terms(text):
+    """Lower-cased, accent-free words of `text`."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD_RE.findall(text.casefold())
+
+
+class SuggestIndex:
+    def __init__(self, entries, generation=None):
+        """`entries` are (popularity, Suggestion) pairs in any order."""
+        # Most popular first, then products before shops before categories
+        kinds = {'product': 0, 'shop': 1, 'category': 2}
+        entries = sorted(entries, key=lambda entry: (-entry[0], kinds[entry[1].type], entry[1].name))
+        self.suggestions = [suggestion for _, suggestion in entries]
+        self.terms = [frozenset(normalize_terms(suggestion.name)) for suggestion in self.suggestions]
+        self.generation = generation
+        self.built_at = time.monotonic()
+
+        keys = sorted((term, number) for number, terms in enumerate(self.terms) for term in terms)
+        self.keys = [term for term, _ in keys]
+        self.numbers = [number for _, number in keys]
+
+        self.top = {}
+        for number, terms in enumerate(self.terms):
+            prefixes = {term[:length] for term in terms for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1)}
+            for prefix in prefixes:
+                top = self.top.setdefault(prefix, [])
+                if len(top) < MAX_LIMIT:
+                    top.append(number)
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def _range(self, prefix):
+        """Slice bounds of the keys starting with `prefix`."""
+        start = bisect_left(self.keys, prefix)
+        return start, bisect_left(self.keys, prefix + _KEY_END, start)
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """Most popular entries with a word starting with every word of `query`."""
+        terms = normalize_terms(query)[:MAX_QUERY_TERMS]
+        limit = max(0, min(limit, MAX_LIMIT))
+        if not terms or not limit:
+            return []
+        if len(terms) == 1 and len(terms[0]) <= PRECOMPUTED_PREFIX_LENGTH:
+            numbers = self.top.get(terms[0], [])[:limit]
+            return [self.suggestions[number] for number in numbers]
+
+        # Start from the most selective word and narrow down with the others
+        ranges = sorted(((self._range(term), term) for term in terms), key=lambda item: item[0][1] - item[0][0])
+        (start, stop), _ = ranges[0]
+        candidates = set(self.numbers[start:stop])
+        for (start, stop), term in ranges[1:]:
+            if not candidates:
+                break
+            if stop - start <= 8 * len(candidates):
+                candidates.intersection_update(self.numbers[start:stop])
+            else:
+                # Cheaper to check the few candidates than to collect a long run
+                candidates = {
+                    number for number in candidates
+                    if any(word.startswith(term) for word in self.terms[number])
+                }
+        return [self.suggestions[number] for number in heapq.nsmallest(limit, candidates)]
+
+
+def build_index(generation=None):
+    """Build the index from the database: one query per entry type."""
+    views = Sum('products__view_count', filter=Q(products__is_active=True), default=0)
+    entries = [
+        (view_count, Suggestion('product', name, slug))
+        for name, slug, view_count in Product.objects.filter(is_active=True).values_list('name', 'slug', 'view_count')
+    ]
+    entries += [
+        (view_count, Suggestion('shop', name, slug))
+        for name, slug, view_count in Shop.objects.filter(is_active=True).annotate(views=views)
+        .values_list('name', 'slug', 'views')
+    ]
+    entries += [
+        (view_count, Suggestion('category', name, slug))
+        for name, slug, view_count in Category.objects.annotate(
+            views=Sum(
+                'subcategories__products__view_count',
+                filter=Q(subcategories__products__is_active=True),
+                default=0,
+            ),
+        ).values_list('name', 'slug', 'views')
+    ]
+    return SuggestIndex(entries, generation)
+
+
+_index = None
+_checked_at = None
+# Held by whichever thread is building the index
+_build_lock = threading.Lock()
+
+
+def _rebuild(generation):
+    global _index
+    try:
+        _index = build_index(generation)
+    except Exception as e:
+        # Keep serving the previous index; the next check tries again
+        logger.error(f"Could not rebuild the suggest index: {str(e)}", exc_info=True)
+    finally:
+        _build_lock.release()
+
+
+def _rebuild_in_background(generation):
+    try:
+        _rebuild(generation)
+    finally:
+        # The thread's own database connection
+        connection.close()
+
+
+def get_index():
+    """This process's index, rebuilt when the catalog changed or it got too old."""
+    global _index, _checked_at
+    now = time.monotonic()
+    check_interval = getattr(settings, 'PRODUCT_SUGGEST_CHECK_INTERVAL', 1)
+    if _index is not None and _checked_at is not None and now - _checked_at < check_interval:
+        return _index
+
+    generation = get_generation(CATALOG)
+    max_age = getattr(settings, 'PRODUCT_SUGGEST_MAX_AGE', 60 * 5)
+    index = _index
+    if index is None:
+        # Nothing to serve yet: build in this request, once per process
+        with _build_lock:
+            if _index is None:
+                _index = build_index(generation)
+    elif (index.generation != generation or now - index.built_at >= max_age) and _build_lock.acquire(blocking=False):
+        # One rebuild at a time; requests keep serving `index` until it is swapped in
+        if _index is not index:
+            _build_lock.release()
+        elif getattr(settings, 'PRODUCT_SUGGEST_REBUILD_IN_BACKGROUND', True):
+            threading.Thread(
+                target=_rebuild_in_background, args=(generation,), name='product-suggest-index', daemon=True,
+            ).start()
+        else:
+            _rebuild(generation)
+    _checked_at = now
+    return _index
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    return get_index().suggest(query, limit)
@@ -1,3 +1,1021 @@
-from django.test import TestCase
+import base64
+import json
+import shutil
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.text import slugify
+from PIL import Image
+from rest_framework.test import APIClient
+
+from shops.models import Shop
+from users.models import User
+from . import suggest
+from .cache import CATALOG, bump_generation, get_generation
+from .filters import ProductFilter
+from .images import generate_variants, record_variants
+from .importer import ProductImporter, read_rows
+from .media import media_url
+from .richtext import make_excerpt, sanitize_html
+from .models import (
+    Category, Color, Product, ProductRatingSummary, ProductSpecification, Review, SimilarProduct, Size, SubCategory,
+)
+from .search import search_products
+from .similarity import build_features, chunk_rows, compute_similar_products, nearest_neighbours
+from .serializers import ProductBatchSerializer, ProductSerializer
+from .view_counts import flush_views, get_buffer
+from .views import ProductViewSet
+
+
+class CatalogFixtures:
+    """A shop owner, shop, category and sub-category to hang test products on."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        cls.shop = Shop.objects.create(owner=cls.owner, name='Shop', slug='shop', contact_email='owner@example.com')
+        cls.category = Category.objects.create(name='Category', slug='category')
+        cls.sub_category = SubCategory.objects.create(name='Sub', slug='sub', category=cls.category)
+
+    @classmethod
+    def create_product(cls, name, **fields):
+        fields = {'shop': cls.shop, 'sub_category': cls.sub_category, 'price': 10, 'slug': slugify(name), **fields}
+        return Product.objects.create(name=name, **fields)
+
+
+class CatalogIndexUsageTests(TestCase):
+    """The catalog's hot queries should be answered from the composite indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        cls.shop = Shop.objects.create(owner=owner, name='Shop', slug='shop', contact_email='owner@example.com')
+        category = Category.objects.create(name='Category', slug='category')
+        cls.sub_category = SubCategory.objects.create(name='Sub', slug='sub', category=category)
+        cls.product = Product.objects.create(
+            shop=cls.shop, name='Product', slug='product', description='Description',
+            sub_category=cls.sub_category, price=10,
+        )
+        Review.objects.create(user=owner, product=cls.product, rating=5)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_active_products_newest_first(self):
+        self.assertUsesIndex(
+            Product.objects.filter(is_active=True).order_by('-created_at'),
+            'product_active_created_idx',
+        )
+
+    def test_active_products_in_sub_category_by_price(self):
+        self.assertUsesIndex(
+            Product.objects.filter(is_active=True, sub_category=self.sub_category, price__gte=5, price__lte=50),
+            'product_active_sub_price_idx',
+        )
+
+    def test_active_products_of_shop(self):
+        self.assertUsesIndex(
+            Product.objects.filter(shop=self.shop, is_active=True),
+            'product_shop_active_idx',
+        )
+
+    def test_product_reviews_by_date(self):
+        self.assertUsesIndex(
+            Review.objects.filter(product=self.product).order_by('created_at'),
+            'review_product_created_idx',
+        )
+
+
+class ProductViewCountTests(TestCase):
+    """Detail views are buffered in memory and written in aggregate on flush."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        shop = Shop.objects.create(owner=cls.owner, name='Shop', slug='shop', contact_email='owner@example.com')
+        category = Category.objects.create(name='Category', slug='category')
+        sub_category = SubCategory.objects.create(name='Sub', slug='sub', category=category)
+        cls.popular = Product.objects.create(shop=shop, name='Popular', slug='popular', sub_category=sub_category, price=10)
+        cls.quiet = Product.objects.create(shop=shop, name='Quiet', slug='quiet', sub_category=sub_category, price=10)
+
+    def setUp(self):
+        cache.clear()
+        get_buffer().drain()
+        self.addCleanup(get_buffer().drain)
+        self.client = APIClient()
+
+    def test_views_are_buffered_until_flushed(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get('/api/products/popular/').status_code, 200)
+        self.client.get('/api/products/quiet/')
+
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.view_count, 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_views(), 4)
+        self.popular.refresh_from_db()
+        self.quiet.refresh_from_db()
+        self.assertEqual((self.popular.view_count, self.quiet.view_count), (3, 1))
+        self.assertEqual(flush_views(), 0)
+
+    def test_not_modified_responses_are_counted(self):
+        etag = self.client.get('/api/products/popular/')['ETag']
+        response = self.client.get('/api/products/popular/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        flush_views()
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.view_count, 2)
+
+    def test_most_viewed_ordering(self):
+        self.client.get('/api/products/quiet/')
+        flush_views()
+        response = self.client.get('/api/products/?ordering=-views')
+        self.assertEqual([product['slug'] for product in response.json()['results']], ['quiet', 'popular'])
+
+    def test_counts_stay_out_of_cached_bodies(self):
+        self.assertNotIn('view_count', self.client.get('/api/products/popular/').json())
+        self.assertNotIn('view_count', self.client.get('/api/products/').json()['results'][0])
+
+    def test_shop_traffic_is_private(self):
+        self.client.get('/api/products/popular/')
+        self.client.get('/api/products/popular/')
+        flush_views()
+        self.assertIn(self.client.get('/api/shops/shop/traffic/').status_code, (401, 403))
+
+        other = User.objects.create_user('other@example.com', 'password', name='Other', user_type='SELLER')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/shops/shop/traffic/').status_code, 403)
+
+        for user in (self.owner, User.objects.create_user('staff@example.com', 'password', name='Staff', is_staff=True)):
+            self.client.force_authenticate(user)
+            response = self.client.get('/api/shops/shop/traffic/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['total_views'], 2)
+            self.assertEqual(response.json()['top_products'][0]['slug'], 'popular')
+
+
+class ProductSuggestTests(TestCase):
+    """Autocomplete is served from the in-memory index and follows catalog changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        cls.shop = Shop.objects.create(owner=owner, name='Cotton Corner', slug='cotton-corner', contact_email='owner@example.com')
+        category = Category.objects.create(name='Clothing', slug='clothing')
+        cls.sub_category = SubCategory.objects.create(name='Shirts', slug='shirts', category=category)
+        Product.objects.create(
+            shop=cls.shop, name='Cotton Shirt', slug='cotton-shirt', sub_category=cls.sub_category, price=10, view_count=5,
+        )
+        Product.objects.create(
+            shop=cls.shop, name='Côte Jacket', slug='cote-jacket', sub_category=cls.sub_category, price=10, view_count=50,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def suggest(self, query):
+        response = self.client.get('/api/products/suggest/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['slug']) for result in response.json()['results']]
+
+    def test_prefix_matches_ranked_by_popularity(self):
+        self.assertEqual(
+            # The shop ranks by the views of all its products
+            self.suggest('Co'),
+            [('shop', 'cotton-corner'), ('product', 'cote-jacket'), ('product', 'cotton-shirt')],
+        )
+        self.assertEqual(self.suggest('cotton sh'), [('product', 'cotton-shirt')])
+        self.assertEqual(self.suggest('clo'), [('category', 'clothing')])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_suggestions_do_not_query_the_database(self):
+        self.suggest('cot')
+        with self.assertNumQueries(0):
+            self.suggest('cotto')
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.suggest('linen'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(shop=self.shop, name='Linen Shirt', slug='linen-shirt', sub_category=self.sub_category, price=10)
+        self.assertEqual(self.suggest('linen'), [('product', 'linen-shirt')])
+
+    def test_rebuilds_run_in_the_background(self):
+        index = suggest.get_index()
+        started, finish = threading.Event(), threading.Event()
+        builds = []
+
+        def slow_build(generation=None):
+            builds.append(generation)
+            started.set()
+            finish.wait(5)
+            return suggest.SuggestIndex([(1, suggest.Suggestion('product', 'Linen Shirt', 'linen-shirt'))], generation)
+
+        bump_generation(CATALOG)
+        with override_settings(PRODUCT_SUGGEST_REBUILD_IN_BACKGROUND=True), mock.patch.object(suggest, 'build_index', slow_build):
+            # The request that notices the change is served the previous index
+            self.assertIs(suggest.get_index(), index)
+            self.assertTrue(started.wait(5))
+            [thread] = [thread for thread in threading.enumerate() if thread.name == 'product-suggest-index']
+            # So are the others, without starting a second rebuild
+            self.assertIs(suggest.get_index(), index)
+            finish.set()
+            thread.join(5)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(self.suggest('linen'), [('product', 'linen-shirt')])
+
+
+class RatingSummaryTests(CatalogFixtures, TestCase):
+    """Review writes keep ProductRatingSummary in step with the Review table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.first = cls.create_product('First')
+        cls.second = cls.create_product('Second')
+        cls.reviewers = [
+            User.objects.create_user(f'reviewer{i}@example.com', 'password', name=f'Reviewer {i}') for i in range(3)
+        ]
+
+    def summary(self, product):
+        summary = ProductRatingSummary.objects.get(product=product)
+        return (
+            summary.review_count, summary.rating_total, summary.average_rating,
+            [getattr(summary, f'stars_{star}') for star in range(1, 6)],
+        )
+
+    def test_create_change_reassign_and_delete(self):
+        review = Review.objects.create(user=self.reviewers[0], product=self.first, rating=5)
+        Review.objects.create(user=self.reviewers[1], product=self.first, rating=2)
+        self.assertEqual(self.summary(self.first), (2, 7, 3.5, [0, 1, 0, 0, 1]))
+
+        review.rating = 3
+        review.save()
+        self.assertEqual(self.summary(self.first), (2, 5, 2.5, [0, 1, 1, 0, 0]))
+
+        review.product = self.second
+        review.save()
+        self.assertEqual(self.summary(self.first), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+        self.assertEqual(self.summary(self.second), (1, 3, 3.0, [0, 0, 1, 0, 0]))
+
+        Review.objects.get(pk=review.pk).delete()
+        self.assertEqual(self.summary(self.second), (0, 0, 0.0, [0, 0, 0, 0, 0]))
+
+    def test_rebuild_matches_aggregate(self):
+        for reviewer, rating in zip(self.reviewers, [4, 4, 1]):
+            Review.objects.create(user=reviewer, product=self.first, rating=rating)
+        Review.objects.create(user=self.reviewers[0], product=self.second, rating=5)
+        # Drift the summaries, as a raw SQL edit or a failed signal would
+        ProductRatingSummary.objects.update(review_count=99, rating_total=0, average_rating=0, stars_4=7)
+
+        call_command('rebuild_rating_summaries', stdout=StringIO())
+
+        aggregates = Review.objects.values('product').annotate(
+            count=Count('id'), total=Sum('rating'),
+            **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)},
+        )
+        for row in aggregates:
+            product = Product.objects.get(pk=row['product'])
+            self.assertEqual(self.summary(product), (
+                row['count'], row['total'], row['total'] / row['count'],
+                [row[f'stars_{star}'] for star in range(1, 6)],
+            ))
+
+
+class KeysetPaginationTests(CatalogFixtures, TestCase):
+    """Cursor pages walk forwards and backwards without skipping rows that tie on the sort value."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Equal prices, so only the id tie-breaker keeps the order stable
+        for i in range(5):
+            cls.create_product(f'Tied {i}', price=20)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def page(self, url=None):
+        # Links carry the cursor, ordering and page size of the first request
+        if url is None:
+            response = self.client.get('/api/products/', {'pagination': 'cursor', 'ordering': 'price', 'page_size': 2})
+        else:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def slugs(self, page):
+        return [product['slug'] for product in page['results']]
+
+    def test_round_trip(self):
+        first = self.page()
+        second = self.page(first['next'])
+        third = self.page(second['next'])
+        self.assertIsNone(third['next'])
+        slugs = self.slugs(first) + self.slugs(second) + self.slugs(third)
+        self.assertEqual(sorted(slugs), [f'tied-{i}' for i in range(5)])
+
+        back = self.page(third['previous'])
+        self.assertEqual(self.slugs(back), self.slugs(second))
+        self.assertEqual(self.slugs(self.page(back['previous'])), self.slugs(first))
+
+    def test_invalid_cursors(self):
+        forged = {'o': 'price', 'v': [1], 'id': {}, 'r': 0}
+        for cursor in [
+            'not-a-cursor',
+            base64.urlsafe_b64encode(json.dumps(forged).encode()).decode(),
+            base64.urlsafe_b64encode(json.dumps({**forged, 'v': None, 'id': None}).encode()).decode(),
+        ]:
+            response = self.client.get('/api/products/', {'pagination': 'cursor', 'ordering': 'price', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class ProductSearchTests(CatalogFixtures, TestCase):
+    """The full-text index follows product writes and ranks name matches first."""
+
+    def search(self, query, rank=True):
+        return [product.slug for product in search_products(Product.objects.all(), query, rank=rank)]
+
+    def test_index_follows_create_rename_and_delete(self):
+        product = self.create_product('Walnut Desk')
+        self.assertEqual(self.search('walnut'), ['walnut-desk'])
+        self.assertEqual(self.search('wal des'), ['walnut-desk'])
+
+        product.name = 'Oak Desk'
+        product.save()
+        self.assertEqual(self.search('walnut'), [])
+        self.assertEqual(self.search('oak'), ['walnut-desk'])
+
+        product.delete()
+        self.assertEqual(self.search('oak'), [])
+
+    def test_name_match_ranks_above_specification_match(self):
+        # Descriptions are not indexed; specifications are the lowest-weighted column
+        spec_only = self.create_product('Plain Chair')
+        ProductSpecification.objects.create(product=spec_only, name='Material', value='Bamboo')
+        self.create_product('Bamboo Stool')
+        self.assertEqual(self.search('bamboo'), ['bamboo-stool', 'plain-chair'])
+
+    def test_unranked_subquery(self):
+        self.create_product('Linen Sheet')
+        self.create_product('Cotton Sheet')
+        matches = search_products(Product.objects.all(), 'linen', rank=False)
+        # Usable inside another query, as facets and the admin do
+        self.assertEqual(list(Product.objects.filter(pk__in=matches.values('pk')).values_list('slug', flat=True)), ['linen-sheet'])
+        self.assertEqual(self.search('sheet', rank=False), ['cotton-sheet', 'linen-sheet'])
+
+
+class ProductFacetTests(CatalogFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        red = Color.objects.create(name='Red', hex_code='#FF0000')
+        blue = Color.objects.create(name='Blue', hex_code='#0000FF')
+        green = Color.objects.create(name='Green', hex_code='#00FF00')
+        small = Size.objects.create(name='S')
+        large = Size.objects.create(name='L')
+        for name, colors, sizes, price in [
+            ('Red Blue Shirt', [red, blue], [small], 20),
+            ('Red Shirt', [red], [large], 60),
+            ('Blue Shirt', [blue], [small], 20),
+            ('Green Shirt', [green], [large], 20),
+        ]:
+            product = cls.create_product(name, price=price)
+            product.colors.set(colors)
+            product.sizes.set(sizes)
+
+    def facets(self, query=''):
+        response = APIClient().get(f'/api/products/facets/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def counts(self, rows, key='name'):
+        return {row[key]: row['count'] for row in rows}
+
+    def test_facet_ignores_its_own_selection(self):
+        facets = self.facets('?colors=Red')
+        self.assertEqual(facets['total'], 2)
+        # Other colors are counted as if Red were not selected
+        self.assertEqual(self.counts(facets['colors']), {'Blue': 2, 'Green': 1, 'Red': 2})
+        # Other facets are narrowed by the color selection
+        self.assertEqual(self.counts(facets['sizes']), {'L': 1, 'S': 1})
+        self.assertEqual([bucket['count'] for bucket in facets['price'] if bucket['count']], [1, 1])
+
+    def test_facets_combine_other_selections(self):
+        facets = self.facets('?colors=Red&sizes=S')
+        self.assertEqual(facets['total'], 1)
+        self.assertEqual(self.counts(facets['colors']), {'Blue': 2, 'Red': 1})
+        self.assertEqual(self.counts(facets['sizes']), {'L': 1, 'S': 1})
+
+        facets = self.facets('?colors=Red&max_price=50')
+        self.assertEqual(facets['total'], 1)
+        # The price facet ignores the price range but keeps the color
+        self.assertEqual(sum(bucket['count'] for bucket in facets['price']), 2)
+
+
+class ProductListRepresentationTests(CatalogFixtures, TestCase):
+    """Product lists send compact cards unless ?view=full asks for the full representation."""
+
+    card_fields = {
+        'id', 'shop', 'name', 'slug', 'excerpt', 'sub_category', 'price', 'discount_price', 'stock',
+        'is_active', 'thumbnail_url', 'thumbnail_srcset', 'colors', 'sizes', 'rating', 'review_count',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        red = Color.objects.create(name='Red', hex_code='#ff0000')
+        small = Size.objects.create(name='S')
+        for i in range(12):
+            product = cls.create_product(f'Card Product {i}', description='<p>A long description</p>')
+            product.colors.add(red)
+            product.sizes.add(small)
+            ProductSpecification.objects.create(product=product, name='Material', value='Cotton')
+            Review.objects.create(user=cls.owner, product=product, rating=4)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def results(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_list_returns_cards(self):
+        for product in self.results('/api/products/'):
+            self.assertEqual(set(product), self.card_fields)
+            self.assertEqual(product['excerpt'], 'A long description')
+            self.assertEqual(product['review_count'], 1)
+
+    def test_full_view_returns_the_product_serializer(self):
+        results = self.results('/api/products/?view=full')
+        self.assertEqual(set(results[0]), set(ProductSerializer.Meta.fields))
+        self.assertEqual(len(results[0]['reviews']), 1)
+        self.assertEqual(results[0]['specifications'][0]['value'], 'Cotton')
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for view in ('card', 'full'):
+            with self.subTest(view=view):
+                with CaptureQueriesContext(connection) as small_page:
+                    self.assertEqual(len(self.results(f'/api/products/?view={view}&page_size=2')), 2)
+                with CaptureQueriesContext(connection) as large_page:
+                    self.assertEqual(len(self.results(f'/api/products/?view={view}&page_size=12')), 12)
+                self.assertEqual(len(large_page), len(small_page))
+
+
+class ProductBatchTests(CatalogFixtures, TestCase):
+    """The batch endpoint used to refresh carts and checkout."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.products = [cls.create_product(f'Batch Product {i}', stock=i) for i in range(20)]
+        cls.hidden = cls.create_product('Hidden Product', is_active=False)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def batch(self, query, status_code=200):
+        response = self.client.get(f'/api/products/batch/?{query}')
+        self.assertEqual(response.status_code, status_code)
+        return response.json()
+
+    def test_results_follow_the_request_order_once_each(self):
+        first, second, third = self.products[:3]
+        data = self.batch(
+            f'ids={third.pk},{first.pk},{third.pk}&slugs={second.slug},{first.slug}&slugs={second.slug}'
+        )
+        self.assertEqual([product['slug'] for product in data['results']], [third.slug, first.slug, second.slug])
+        self.assertEqual(data['missing'], [])
+
+    def test_unknown_and_malformed_values_are_missing(self):
+        unknown = '00000000-0000-0000-0000-000000000000'
+        data = self.batch(f'ids={self.products[0].pk},{unknown},not-a-uuid&slugs=no-such-product')
+        self.assertEqual([product['slug'] for product in data['results']], [self.products[0].slug])
+        self.assertEqual(data['missing'], [unknown, 'not-a-uuid', 'no-such-product'])
+
+    def test_inactive_products_are_returned(self):
+        data = self.batch(f'slugs={self.hidden.slug}')
+        self.assertEqual(len(data['results']), 1)
+        self.assertIs(data['results'][0]['is_active'], False)
+        self.assertEqual(data['missing'], [])
+
+    def test_requests_without_values_or_with_too_many_are_rejected(self):
+        self.batch('', status_code=400)
+        self.batch('ids=,&slugs=', status_code=400)
+        slugs = ','.join(f'product-{i}' for i in range(ProductViewSet.batch_max_size + 1))
+        self.batch(f'slugs={slugs}', status_code=400)
+
+    def test_cart_sized_batch_is_one_query(self):
+        ids = ','.join(str(product.pk) for product in self.products[:10])
+        slugs = ','.join(product.slug for product in self.products[10:])
+        with self.assertNumQueries(1):
+            data = self.batch(f'ids={ids}&slugs={slugs}')
+        self.assertEqual(len(data['results']), 20)
+
+
+class CatalogResponseCacheTests(CatalogFixtures, TestCase):
+    """Catalog writes bump the cache generation, retiring cached list and detail responses."""
+
+    def setUp(self):
+        cache.clear()
+        # Detail requests buffer views; drop them rather than flush them at exit
+        self.addCleanup(get_buffer().drain)
+        self.client = APIClient()
+        self.product = self.create_product('Cached Lamp')
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def list_names(self):
+        data = self.get('/api/products/')
+        return [product['name'] for product in data.get('results', data)]
+
+    def test_product_save_retires_cached_list_and_detail(self):
+        self.assertEqual(self.list_names(), ['Cached Lamp'])
+        self.assertEqual(self.get('/api/products/cached-lamp/')['name'], 'Cached Lamp')
+
+        # A write that skips the signals is not seen: both responses come from the cache
+        Product.objects.filter(pk=self.product.pk).update(name='Stale Lamp')
+        self.assertEqual(self.list_names(), ['Cached Lamp'])
+        self.assertEqual(self.get('/api/products/cached-lamp/')['name'], 'Cached Lamp')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Fresh Lamp'
+            self.product.save()
+        self.assertEqual(self.list_names(), ['Fresh Lamp'])
+        self.assertEqual(self.get('/api/products/cached-lamp/')['name'], 'Fresh Lamp')
+
+    def test_review_retires_cached_detail(self):
+        self.assertEqual(self.get('/api/products/cached-lamp/')['review_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.owner, product=self.product, rating=4)
+        detail = self.get('/api/products/cached-lamp/')
+        self.assertEqual(detail['review_count'], 1)
+        self.assertEqual(len(detail['reviews']), 1)
+
+    def test_generation_bumps_only_on_commit(self):
+        before = get_generation(CATALOG)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.save()
+            self.assertEqual(get_generation(CATALOG), before)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_generation(CATALOG), before)
+
+
+class ConditionalRequestTests(CatalogFixtures, TestCase):
+    """ETag / Last-Modified validators of the product and shop detail pages."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(get_buffer().drain)
+        self.client = APIClient()
+        self.product = self.create_product('Tagged Vase')
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        return response['ETag']
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.etag('/api/products/tagged-vase/')
+        response = self.client.get('/api/products/tagged-vase/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        etag = self.etag('/api/shops/shop/')
+        self.assertEqual(self.client.get('/api/shops/shop/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_review_changes_product_etag(self):
+        etag = self.etag('/api/products/tagged-vase/')
+        Review.objects.create(user=self.owner, product=self.product, rating=5)
+        response = self.client.get('/api/products/tagged-vase/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_shop_edit_changes_product_and_shop_etags(self):
+        product_etag = self.etag('/api/products/tagged-vase/')
+        shop_etag = self.etag('/api/shops/shop/')
+        self.shop.name = 'Renamed Shop'
+        self.shop.save()
+        self.assertNotEqual(self.etag('/api/products/tagged-vase/'), product_etag)
+        self.assertNotEqual(self.etag('/api/shops/shop/'), shop_etag)
+
+
+class CategoryTreeTests(CatalogFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.create_product('Tree Product')
+        cls.create_product('Inactive Tree Product', is_active=False)
+        # Set without signals: no variant generation for a file that does not exist
+        Category.objects.filter(pk=cls.category.pk).update(
+            image='categories/category.jpg', image_variants={'name': 'categories/category.jpg', 'widths': [320, 640]},
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def tree(self):
+        response = APIClient().get('/api/categories/tree/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_payload(self):
+        [category] = self.tree()
+        self.assertEqual(category['slug'], 'category')
+        self.assertEqual(category['product_count'], 1)
+        self.assertEqual(category['image'], 'http://testserver/media/categories/category.jpg')
+        self.assertEqual(
+            category['image_srcset']['webp'],
+            'http://testserver/media/categories/category_320w.webp 320w, '
+            'http://testserver/media/categories/category_640w.webp 640w',
+        )
+        [sub_category] = category['subcategories']
+        self.assertEqual(
+            {key: sub_category[key] for key in ('slug', 'product_count', 'image', 'image_srcset')},
+            {'slug': 'sub', 'product_count': 1, 'image': None, 'image_srcset': None},
+        )
+
+    def test_urls_follow_the_request_host(self):
+        self.tree()
+        response = APIClient().get('/api/categories/tree/', HTTP_HOST='shop.example.com')
+        self.assertEqual(response.json()[0]['image'], 'http://shop.example.com/media/categories/category.jpg')
+
+    def test_category_and_sub_category_saves_rebuild_the_tree(self):
+        self.tree()
+        with self.captureOnCommitCallbacks(execute=True):
+            SubCategory.objects.create(name='Another Sub', slug='another-sub', category=self.category)
+        self.assertEqual([sub['slug'] for sub in self.tree()[0]['subcategories']], ['another-sub', 'sub'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sub_category.name = 'Renamed Sub'
+            self.sub_category.save()
+        self.assertEqual([sub['name'] for sub in self.tree()[0]['subcategories']], ['Another Sub', 'Renamed Sub'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.filter(pk=self.category.pk).update(image='')
+            self.category.refresh_from_db()
+            self.category.name = 'Renamed Category'
+            self.category.save()
+        [category] = self.tree()
+        self.assertEqual((category['name'], category['image']), ('Renamed Category', None))
+
+
+class ImageVariantTests(CatalogFixtures, TestCase):
+    """srcsets list only the variant widths generated for the current image."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = self.create_product('Pictured Mug')
+
+    def store_image(self, name, width):
+        buffer = BytesIO()
+        Image.new('RGB', (width, width // 2), (200, 40, 40)).save(buffer, format='PNG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def use_thumbnail(self, name):
+        # Set without signals: the tests run generation themselves
+        Product.objects.filter(pk=self.product.pk).update(thumbnail=name)
+        self.product.refresh_from_db()
+
+    def srcset(self):
+        self.product.refresh_from_db()
+        return ProductSerializer(self.product).data['thumbnail_srcset']
+
+    def test_variants_are_never_wider_than_the_original(self):
+        name = self.store_image('products/thumbnails/mug.png', 700)
+        self.assertEqual(generate_variants(name), ([320, 640], 4))
+        self.assertTrue(default_storage.exists('products/thumbnails/mug_640w.webp'))
+        self.assertFalse(default_storage.exists('products/thumbnails/mug_1280w.webp'))
+        # Existing variants are kept
+        self.assertEqual(generate_variants(name), ([320, 640], 0))
+
+        name = self.store_image('products/thumbnails/icon.png', 100)
+        self.assertEqual(generate_variants(name), ([], 0))
+
+    def test_srcset_lists_recorded_widths_only(self):
+        name = self.store_image('products/thumbnails/mug.png', 700)
+        self.use_thumbnail(name)
+        self.assertIsNone(self.srcset())
+
+        widths, _ = generate_variants(name)
+        generation = get_generation(CATALOG)
+        self.assertEqual(record_variants('products.Product', 'thumbnail', name, widths), 1)
+        self.assertGreater(get_generation(CATALOG), generation)
+        self.assertEqual(self.srcset(), {
+            'jpeg': '/media/products/thumbnails/mug_320w.jpg 320w, /media/products/thumbnails/mug_640w.jpg 640w',
+            'webp': '/media/products/thumbnails/mug_320w.webp 320w, /media/products/thumbnails/mug_640w.webp 640w',
+        })
+        # Recording the same widths again changes nothing
+        self.assertEqual(record_variants('products.Product', 'thumbnail', name, widths), 0)
+
+    def test_replaced_image_has_no_srcset_until_its_variants_exist(self):
+        name = self.store_image('products/thumbnails/mug.png', 700)
+        self.use_thumbnail(name)
+        record_variants('products.Product', 'thumbnail', name, generate_variants(name)[0])
+
+        replacement = self.store_image('products/thumbnails/mug-large.png', 1500)
+        self.use_thumbnail(replacement)
+        self.assertIsNone(self.srcset())
+        # A late worker for the old image does not touch the row
+        self.assertEqual(record_variants('products.Product', 'thumbnail', name, [320, 640]), 0)
+
+        record_variants('products.Product', 'thumbnail', replacement, generate_variants(replacement)[0])
+        self.assertTrue(self.srcset()['webp'].endswith('mug-large_1280w.webp 1280w'))
+
+    def test_image_narrower_than_every_width_has_no_srcset(self):
+        name = self.store_image('products/thumbnails/icon.png', 100)
+        self.use_thumbnail(name)
+        record_variants('products.Product', 'thumbnail', name, generate_variants(name)[0])
+        self.assertIsNone(self.srcset())
+
+
+class MediaUrlTests(CatalogFixtures, TestCase):
+    """Media URLs are joined from one base URL per request, with no storage calls."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        name = 'products/thumbnails/mug.png'
+        cls.product = cls.create_product(
+            'Linked Mug', thumbnail=name, thumbnail_variants={'name': name, 'widths': [320]}
+        )
+        cls.bare = cls.create_product('Bare Mug')
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/products/', HTTP_HOST='shop.example.com')
+
+    def serialize(self, product, request=None):
+        context = {'request': request} if request is not None else {}
+        return ProductBatchSerializer(product, context=context).data
+
+    def test_request_host(self):
+        data = self.serialize(self.product, self.request)
+        self.assertEqual(data['thumbnail_url'], 'http://shop.example.com/media/products/thumbnails/mug.png')
+        self.assertIn(
+            'http://shop.example.com/media/products/thumbnails/mug_320w.webp 320w', data['thumbnail_srcset']['webp']
+        )
+
+    @override_settings(MEDIA_BASE_URL='https://cdn.example.com/media')
+    def test_configured_base_url_replaces_the_request_host(self):
+        data = self.serialize(self.product, self.request)
+        self.assertEqual(data['thumbnail_url'], 'https://cdn.example.com/media/products/thumbnails/mug.png')
+        self.assertIn(
+            'https://cdn.example.com/media/products/thumbnails/mug_320w.webp 320w', data['thumbnail_srcset']['webp']
+        )
+
+    def test_relative_url_without_a_request(self):
+        self.assertEqual(media_url('products/thumbnails/mug.png'), '/media/products/thumbnails/mug.png')
+        self.assertEqual(self.serialize(self.product)['thumbnail_url'], '/media/products/thumbnails/mug.png')
+
+    def test_base_url_is_built_once_per_request(self):
+        with mock.patch.object(self.request, 'build_absolute_uri', wraps=self.request.build_absolute_uri) as build:
+            ProductBatchSerializer([self.product, self.product], many=True, context={'request': self.request}).data
+        build.assert_called_once_with('/media/')
+        self.assertEqual(self.request._media_base_url, 'http://shop.example.com/media/')
+
+    def test_missing_image_is_null(self):
+        data = self.serialize(self.bare, self.request)
+        self.assertIsNone(data['thumbnail_url'])
+        self.assertIsNone(data['thumbnail_srcset'])
+        self.assertIsNone(media_url('', self.request))
+        self.assertIsNone(media_url(None))
+
+
+class SanitizeHtmlTests(SimpleTestCase):
+    def test_drops_scripts_and_styles_with_their_content(self):
+        self.assertEqual(
+            sanitize_html('<p>Hi<script>alert(1)</script><style>p {}</style></p><SCRIPT src="x.js"></SCRIPT>'),
+            '<p>Hi</p>',
+        )
+
+    def test_drops_event_handlers_style_and_class(self):
+        self.assertEqual(
+            sanitize_html('<p onclick="steal()" style="color: red" class="lead">Text</p><img src="/a.png" onerror="x()">'),
+            '<p>Text</p><img src="/a.png">',
+        )
+
+    def test_drops_unsafe_urls(self):
+        for url in [
+            'javascript:alert(1)',
+            'JavaScript:alert(1)',
+            'jav&#x61;script:alert(1)',
+            'jav&#97;script:alert(1)',
+            'java&#x09;script:alert(1)',
+            ' javascript:alert(1)',
+            'data:text/html;base64,PHNjcmlwdD5hbGVydCgxKTwvc2NyaXB0Pg==',
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(sanitize_html(f'<a href="{url}">x</a><img src="{url}">'), '<a>x</a><img>')
+
+    def test_keeps_allowlisted_markup(self):
+        html = (
+            '<h2>Care</h2><p><strong>Wash</strong> <em>cold</em>, see '
+            '<a href="https://example.com/care" title="Guide">guide</a>.</p>'
+            '<ul><li>One</li><li>Two</li></ul><table><tbody><tr><td colspan="2">Cell</td></tr></tbody></table>'
+            '<img src="/media/a.png" alt="A" width="10">'
+        )
+        self.assertEqual(sanitize_html(html), html)
+
+    def test_normalizes_markup(self):
+        self.assertEqual(sanitize_html('<P>one<li>a<li>b</ul>'), '<p>one<li>a</li><li>b</li></p>')
+        self.assertEqual(
+            sanitize_html('<a href=/x target=_blank>link'),
+            '<a href="/x" target="_blank" rel="noopener noreferrer">link</a>',
+        )
+
+    def test_excerpt(self):
+        self.assertEqual(make_excerpt('<p>Soft &amp; warm</p><p>Wool</p>'), 'Soft & warm Wool')
+        self.assertEqual(make_excerpt('<p>' + 'word ' * 100 + '</p>', length=20), 'word word word…')
+
+
+class ProductDescriptionTests(CatalogFixtures, TestCase):
+    def test_save_stores_sanitized_description(self):
+        product = self.create_product('Scarf', description='<p onclick="x()">Soft<script>alert(1)</script></p>')
+        self.assertEqual(product.description_html, '<p>Soft</p>')
+        self.assertEqual(product.description_excerpt, 'Soft')
+
+        product.description = '<a href="jav&#x61;script:alert(1)">Warm</a>'
+        product.save(update_fields=['description'])
+        product.refresh_from_db()
+        self.assertEqual((product.description_html, product.description_excerpt), ('<a>Warm</a>', 'Warm'))
+
+
+class ProductImportTests(CatalogFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for name, hex_code in [('Red', '#FF0000'), ('Blue', '#0000FF')]:
+            Color.objects.create(name=name, hex_code=hex_code)
+        for name in ['S', 'M']:
+            Size.objects.create(name=name)
+
+    def run_import(self, text, file_format='csv'):
+        return ProductImporter(batch_size=2).run(read_rows(StringIO(text), file_format))
+
+    def links(self, slug):
+        product = Product.objects.get(slug=slug)
+        colors = list(product.colors.through.objects.filter(product=product).values_list('color__name', flat=True).order_by('color__name'))
+        sizes = list(product.sizes.through.objects.filter(product=product).values_list('size__name', flat=True).order_by('size__name'))
+        return colors, sizes
+
+    def test_import_creates_then_updates(self):
+        result = self.run_import(
+            'slug,name,shop,sub_category,price,stock,colors,sizes,description\n'
+            'tee,Tee,shop,sub,10,5,Red|blue,S,<p onclick="x()">Cotton</p>\n'
+            'cap,Cap,shop,sub,7.5,0,Blue,,\n'
+            'sock,Sock,shop,sub,3,2,red,S|M,\n'
+        )
+        self.assertEqual((result.rows, result.created, result.updated, result.failed), (3, 3, 0, 0))
+        tee = Product.objects.get(slug='tee')
+        self.assertEqual((tee.name, tee.price, tee.stock, tee.description_html), ('Tee', 10, 5, '<p>Cotton</p>'))
+        self.assertEqual(self.links('tee'), (['Blue', 'Red'], ['S']))
+        self.assertEqual(self.links('cap'), (['Blue'], []))
+        self.assertEqual(self.links('sock'), (['Red'], ['M', 'S']))
+
+        # Re-run: rows are matched by slug, absent columns are left alone, links are replaced
+        result = self.run_import(
+            '{"slug": "tee", "price": "12", "colors": ["Red"], "sizes": ["M", "S"]}\n'
+            '{"slug": "cap", "name": "Blue Cap", "colors": []}\n'
+            '{"slug": "sock", "stock": "9"}\n',
+            'jsonl',
+        )
+        self.assertEqual((result.rows, result.created, result.updated, result.failed), (3, 0, 3, 0))
+        self.assertEqual(Product.objects.count(), 3)
+        tee = Product.objects.get(slug='tee')
+        self.assertEqual((tee.name, tee.price, tee.stock), ('Tee', 12, 5))
+        self.assertEqual(self.links('tee'), (['Red'], ['M', 'S']))
+        self.assertEqual(self.links('cap'), ([], []))
+        self.assertEqual(Product.objects.get(slug='cap').name, 'Blue Cap')
+        self.assertEqual(self.links('sock'), (['Red'], ['M', 'S']))
+        self.assertEqual(Product.objects.get(slug='sock').stock, 9)
+        # Imported products are searchable under their new names
+        self.assertEqual([product.slug for product in search_products(Product.objects.all(), 'blue cap')], ['cap'])
+
+    def test_invalid_rows_are_reported(self):
+        result = self.run_import(
+            'slug,name,shop,sub_category,price,colors\n'
+            'good,Good,shop,sub,5,Red\n'
+            'bad-shop,Bad,nowhere,sub,5,\n'
+            'bad-color,Bad,shop,sub,5,Purple\n'
+            'no-price,No Price,shop,sub,,\n'
+            'nan-price,NaN Price,shop,sub,NaN,\n'
+            'infinite-price,Infinite Price,shop,sub,Infinity,\n'
+            'negative-price,Negative Price,shop,sub,-1,\n'
+        )
+        self.assertEqual((result.created, result.failed), (1, 6))
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 5, 6, 7, 8])
+        self.assertEqual(list(Product.objects.values_list('slug', flat=True)), ['good'])
+
+
+class ProductFilterTests(CatalogFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.red = Color.objects.create(name='Red', hex_code='#FF0000')
+        cls.blue = Color.objects.create(name='Blue', hex_code='#0000FF')
+        cls.small = Size.objects.create(name='S')
+        cls.medium = Size.objects.create(name='M')
+        for name, colors, sizes in [
+            ('Striped Shirt', [cls.red, cls.blue], [cls.small, cls.medium]),
+            ('Red Shirt', [cls.red], [cls.medium]),
+            ('Plain Shirt', [], []),
+        ]:
+            product = cls.create_product(name)
+            product.colors.set(colors)
+            product.sizes.set(sizes)
+
+    def slugs(self, **data):
+        filterset = ProductFilter(data, queryset=Product.objects.order_by('name'))
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        return list(filterset.qs.values_list('slug', flat=True))
+
+    def test_multi_value_matches_return_each_product_once(self):
+        self.assertEqual(self.slugs(colors='Red,Blue'), ['red-shirt', 'striped-shirt'])
+        self.assertEqual(self.slugs(color_ids=f'{self.red.pk},{self.blue.pk}'), ['red-shirt', 'striped-shirt'])
+        self.assertEqual(self.slugs(colors='Red,Blue', sizes='S,M'), ['red-shirt', 'striped-shirt'])
+        self.assertEqual(self.slugs(size_ids=f'{self.small.pk}', colors='Red'), ['striped-shirt'])
+        self.assertEqual(self.slugs(colors='Green'), [])
+
+    def test_paginated_count_matches_the_results(self):
+        cache.clear()
+        response = APIClient().get('/api/products/?colors=Red,Blue&sizes=S,M')
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(sorted(product['slug'] for product in data['results']), ['red-shirt', 'striped-shirt'])
+
+
+class SimilarProductTests(CatalogFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        red = Color.objects.create(name='Red', hex_code='#FF0000')
+        blue = Color.objects.create(name='Blue', hex_code='#0000FF')
+        other_sub_category = SubCategory.objects.create(name='Other Sub', slug='other-sub', category=cls.category)
+        other_category = Category.objects.create(name='Other', slug='other')
+        foreign_sub_category = SubCategory.objects.create(name='Foreign', slug='foreign', category=other_category)
+        for name, sub_category, colors, price in [
+            ('Red Dress', cls.sub_category, [red], 50),
+            ('Red Gown', cls.sub_category, [red], 55),
+            ('Blue Dress', cls.sub_category, [blue], 50),
+            ('Red Coat', other_sub_category, [red], 300),
+            # Identical features, but in another category
+            ('Red Dress Twin', foreign_sub_category, [red], 50),
+        ]:
+            product = cls.create_product(name, sub_category=sub_category, price=price)
+            product.colors.set(colors)
+
+    def similar(self, slug):
+        return list(
+            SimilarProduct.objects.filter(product__slug=slug).order_by('rank').values_list('similar__slug', flat=True)
+        )
+
+    def test_neighbours_exclude_self_and_other_categories(self):
+        result = compute_similar_products(full=True)
+        self.assertEqual((result.categories, result.products), (2, 5))
+        self.assertEqual(self.similar('red-dress'), ['red-gown', 'blue-dress', 'red-coat'])
+        self.assertEqual(self.similar('red-coat'), ['red-gown', 'red-dress', 'blue-dress'])
+        # Alone in its category
+        self.assertEqual(self.similar('red-dress-twin'), [])
+
+        cache.clear()
+        response = APIClient().get('/api/products/red-dress/similar/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['slug'] for product in response.json()], ['red-gown', 'blue-dress'])
+
+    def test_chunking_does_not_change_neighbours(self):
+        _, sub_categories, log_prices, matrices = build_features(self.category.pk)
+        whole = [(row, list(neighbours)) for row, neighbours, _ in nearest_neighbours(sub_categories, log_prices, matrices)]
+        chunked = [
+            (row, list(neighbours))
+            for row, neighbours, _ in nearest_neighbours(sub_categories, log_prices, matrices, chunk_size=1)
+        ]
+        self.assertEqual(whole, chunked)
+
+    def test_chunk_rows_bound_the_score_matrix(self):
+        self.assertEqual(chunk_rows(10), 10)
+        self.assertEqual(chunk_rows(100_000, chunk_bytes=4 * 100_000 * 256), 256)
+        self.assertEqual(chunk_rows(10_000_000, chunk_bytes=1024), 1)
@@ -0,0 +1,169 @@
+# products/view_counts.py
+"""
+Buffered product view counters.
+
+Product detail views are counted in a buffer instead of the database:
+a Redis hash (HINCRBY per view) when the default cache is django-redis, so
+every worker shares one buffer, or an in-process Counter otherwise (e.g.
+the local-memory cache used by the tests). flush_views() drains the buffer
+and adds the aggregated deltas to Product.view_count, one UPDATE per batch
+of products.
+
+The buffer is flushed every PRODUCT_VIEW_FLUSH_INTERVAL seconds by a
+daemon thread started on the first recorded view, and by the
+`flush_product_views` command (e.g. from cron when the interval is 0).
+Views are keyed by slug, which is what the detail URL carries, so counting
+costs no query.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = getattr(settings, 'PRODUCT_VIEW_FLUSH_INTERVAL', 30)
+FLUSH_BATCH_SIZE = 500
+REDIS_BUFFER_KEY = 'products:view-buffer'
+
+
+class LocalViewBuffer:
+    """Per-process buffer; counts are lost if the process dies before a flush."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, slug, count=1):
+        with self._lock:
+            self._counts[slug] += count
+
+    def add_many(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return dict(counts)
+
+
+class RedisViewBuffer:
+    """Buffer shared by all processes through a Redis hash."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def add(self, slug, count=1):
+        self.client.hincrby(REDIS_BUFFER_KEY, slug, count)
+
+    def add_many(self, counts):
+        pipeline = self.client.pipeline()
+        for slug, count in counts.items():
+            pipeline.hincrby(REDIS_BUFFER_KEY, slug, count)
+        pipeline.execute()
+
+    def drain(self):
+        # Renaming is atomic: views recorded meanwhile start a fresh hash
+        from redis.exceptions import ResponseError
+
+        draining = f'{REDIS_BUFFER_KEY}:flushing:{uuid.uuid4().hex}'
+        try:
+            self.client.rename(REDIS_BUFFER_KEY, draining)
+        except ResponseError:
+            # Nothing buffered since the last flush: the key does not exist
+            return {}
+        pipeline = self.client.pipeline()
+        pipeline.hgetall(draining)
+        pipeline.delete(draining)
+        counts, _ = pipeline.execute()
+        return {slug.decode(): int(count) for slug, count in counts.items()}
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+_flusher = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                try:
+                    from django_redis import get_redis_connection
+                    from django_redis.cache import RedisCache
+                except ImportError:
+                    RedisCache = None
+                if RedisCache is not None and isinstance(caches['default'], RedisCache):
+                    _buffer = RedisViewBuffer(get_redis_connection('default'))
+                else:
+                    _buffer = LocalViewBuffer()
+                    # Do not lose this process's counts on a clean shutdown
+                    atexit.register(flush_views)
+    return _buffer
+
+
+def record_view(slug):
+    """Count one view of the product with this slug."""
+    try:
+        get_buffer().add(slug)
+        _ensure_flusher()
+    except Exception as e:
+        # Counting must never break the page
+        logger.warning(f"Could not record product view for {slug}: {str(e)}")
+
+
+def flush_views(batch_size=FLUSH_BATCH_SIZE):
+    """Add buffered views to Product.view_count. Returns the number of views written."""
+    buffer = get_buffer()
+    counts = buffer.drain()
+    if not counts:
+        return 0
+    slugs = list(counts)
+    written = 0
+    try:
+        for start in range(0, len(slugs), batch_size):
+            batch = slugs[start:start + batch_size]
+            delta = Case(*[When(slug=slug, then=Value(counts[slug])) for slug in batch], output_field=IntegerField())
+            Product.objects.filter(slug__in=batch).update(view_count=F('view_count') + delta)
+            for slug in batch:
+                written += counts.pop(slug)
+    except Exception:
+        # Put the unwritten counts back for the next flush
+        buffer.add_many(counts)
+        raise
+    return written
+
+
+def _flush_periodically(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush_views()
+        except Exception as e:
+            logger.error(f"Could not flush product views: {str(e)}", exc_info=True)
+        finally:
+            close_old_connections()
+
+
+def _ensure_flusher():
+    global _flusher
+    # A forked worker inherits the thread object but not the thread
+    if not FLUSH_INTERVAL or (_flusher is not None and _flusher.is_alive()):
+        return
+    with _buffer_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(
+                target=_flush_periodically, args=(FLUSH_INTERVAL,), name='product-view-flusher', daemon=True,
+            )
+            _flusher.start()
@@ -1,29 +1,78 @@
 # products/views.py
 import logging
+import uuid
 from rest_framework import viewsets, permissions
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import APIException
+from django.db.models import Q
 from .models import Product, Category, SubCategory, Color, Size
-from .serializers import ProductSerializer, CategorySerializer, SubCategorySerializer, ColorSerializer, SizeSerializer
+from .serializers import ProductSerializer, ProductCardSerializer, ProductBatchSerializer, CategorySerializer, SubCategorySerializer, ColorSerializer, SizeSerializer
 from .permissions import IsShopOwnerOrReadOnly
 from .filters import ProductFilter
+from .facets import get_facets
+from .cache import CATALOG, cache_response
+from .conditional import conditional_view, product_validators
+from .category_tree import get_category_tree
+from .similarity import TOP_K
+from .suggest import DEFAULT_LIMIT as SUGGEST_DEFAULT_LIMIT, suggest
+from .view_counts import record_view
+from .pagination import KeysetPagination, StandardResultsSetPagination
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.filter(is_active=True).select_related('shop', 'sub_category__category').prefetch_related('colors', 'sizes', 'reviews').order_by('-created_at')
+    queryset = Product.objects.filter(is_active=True).select_related('shop', 'sub_category__category', 'rating_summary').prefetch_related('colors', 'sizes').order_by('-created_at')
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]  # Changed to AllowAny for public read access
     filterset_class = ProductFilter
     lookup_field = 'slug'
     pagination_class = StandardResultsSetPagination
+    # Upper bound on ids + slugs accepted by the batch endpoint
+    batch_max_size = 100
+    # Most similar products returned; the table stores this many per product
+    similar_max_size = TOP_K
+
+    @property
+    def paginator(self):
+        """
+        Page-number pagination by default; ?pagination=cursor (or any request
+        carrying a cursor) switches to keyset pagination for infinite scroll.
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if 'cursor' in params or params.get('pagination') == 'cursor':
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def use_card_representation(self):
+        """
+        List responses use the compact product card unless the client opts
+        into the full representation with ?view=full.
+        """
+        return self.action == 'list' and self.request.query_params.get('view') != 'full'
+
+    def get_serializer_class(self):
+        if self.use_card_representation():
+            return ProductCardSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.use_card_representation():
+            # Cards only show the stored excerpt, so keep the descriptions out of the SELECT
+            return queryset.defer('description', 'description_html')
+        queryset = queryset.select_related('shop__owner').prefetch_related(
+            'specifications', 'additional_images', 'additional_descriptions', 'reviews__user'
+        )
+        if self.request.method in ('GET', 'HEAD'):
+            # Reads serve the stored rendering; the editor source is only needed for writes
+            queryset = queryset.defer('description')
+        return queryset
 
     def get_permissions(self):
         """
@@ -37,6 +86,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             self.permission_classes = [permissions.AllowAny]
         return super().get_permissions()
 
+    @cache_response(CATALOG)
     def list(self, request, *args, **kwargs):
         """
         Override list method to add proper error handling and logging.
@@ -59,6 +109,9 @@ class ProductViewSet(viewsets.ModelViewSet):
             logger.info(f"Successfully returned {len(queryset)} products")
             return Response(serializer.data)
             
+        except APIException:
+            # Client errors such as an invalid pagination cursor keep their status code
+            raise
         except Exception as e:
             logger.error(f"Error in ProductViewSet.list: {str(e)}", exc_info=True)
             return Response(
@@ -66,6 +119,15 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Count detail page views, cached and 304 Not Modified responses included
+        if self.action == 'retrieve' and request.method == 'GET' and response.status_code in (200, 304):
+            record_view(kwargs.get(self.lookup_field))
+        return response
+
+    @conditional_view(product_validators)
+    @cache_response(CATALOG)
     def retrieve(self, request, *args, **kwargs):
         """
         Override retrieve method to add proper error handling and logging.
@@ -83,6 +145,158 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Facet counts (colors, sizes, brands, categories, price buckets) for the
+        filter sidebar. Accepts the same query parameters as the product list.
+        GET /api/products/facets/?category=fashion&colors=Red
+        """
+        try:
+            logger.info(f"ProductViewSet.facets called with params: {request.query_params}")
+            return Response(get_facets(self.get_queryset(), request.query_params))
+        except APIException:
+            raise
+        except Exception as e:
+            logger.error(f"Error in ProductViewSet.facets: {str(e)}", exc_info=True)
+            return Response(
+                {"error": f"Internal server error: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """
+        Current price, stock and availability for many products in one query,
+        for cart and checkout refreshes. Inactive products are included with
+        is_active=false; unknown ids/slugs are reported in `missing`.
+        GET /api/products/batch/?ids=<uuid>,<uuid>&slugs=<slug>,<slug>
+        """
+        try:
+            logger.info(f"ProductViewSet.batch called with params: {request.query_params}")
+            ids = self._split_param('ids')
+            slugs = self._split_param('slugs')
+            if not ids and not slugs:
+                return Response(
+                    {"error": "Provide product ids and/or slugs."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if len(ids) + len(slugs) > self.batch_max_size:
+                return Response(
+                    {"error": f"At most {self.batch_max_size} products can be requested at once."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            parsed_ids = [(value, self._parse_uuid(value)) for value in ids]
+            valid_ids = [pk for _, pk in parsed_ids if pk is not None]
+
+            queryset = Product.objects.select_related('shop').only(
+                'id', 'slug', 'name', 'price', 'discount_price', 'stock', 'is_active',
+                'thumbnail', 'thumbnail_variants', 'shop__id', 'shop__name', 'shop__slug',
+            )
+            if slugs:
+                queryset = queryset.filter(Q(pk__in=valid_ids) | Q(slug__in=slugs))
+                products = queryset.in_bulk()
+            else:
+                products = queryset.in_bulk(valid_ids)
+            by_slug = {product.slug: product for product in products.values()}
+
+            found, missing, seen = [], [], set()
+            requested = [(value, products.get(pk)) for value, pk in parsed_ids]
+            requested += [(value, by_slug.get(value)) for value in slugs]
+            for value, product in requested:
+                if product is None:
+                    missing.append(value)
+                elif product.pk not in seen:
+                    seen.add(product.pk)
+                    found.append(product)
+
+            serializer = ProductBatchSerializer(found, many=True, context=self.get_serializer_context())
+            logger.info(f"Successfully returned {len(found)} products, {len(missing)} missing")
+            return Response({'results': serializer.data, 'missing': missing})
+        except Exception as e:
+            logger.error(f"Error in ProductViewSet.batch: {str(e)}", exc_info=True)
+            return Response(
+                {"error": f"Internal server error: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """
+        Type-ahead suggestions: the most viewed products, shops and categories
+        with a word starting with every word of the query. Served from an
+        in-memory prefix index (see products.suggest), not the database.
+        GET /api/products/suggest/?q=cott&limit=8
+        """
+        try:
+            try:
+                limit = int(request.query_params.get('limit', SUGGEST_DEFAULT_LIMIT))
+            except ValueError:
+                return Response(
+                    {"error": "limit must be an integer."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            query = request.query_params.get('q', '')
+            results = [suggestion._asdict() for suggestion in suggest(query, limit)]
+            return Response({'query': query, 'results': results})
+        except Exception as e:
+            logger.error(f"Error in ProductViewSet.suggest: {str(e)}", exc_info=True)
+            return Response(
+                {"error": f"Internal server error: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=True, methods=['get'])
+    @cache_response(CATALOG)
+    def similar(self, request, slug=None):
+        """
+        Precomputed similar products (see products.similarity), best first,
+        as product cards. Products without computed neighbours return an
+        empty list.
+        GET /api/products/<slug>/similar/?limit=6
+        """
+        try:
+            logger.info(f"ProductViewSet.similar called with slug: {slug}")
+            try:
+                limit = min(int(request.query_params.get('limit', self.similar_max_size)), self.similar_max_size)
+            except ValueError:
+                return Response(
+                    {"error": "limit must be an integer."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # One lookup on the (product, rank) index, joined to the neighbours
+            queryset = (
+                super().get_queryset()
+                .filter(similar_to__product__slug=slug)
+                .defer('description', 'description_html')
+                .order_by('similar_to__rank')[:max(limit, 0)]
+            )
+            serializer = ProductCardSerializer(queryset, many=True, context=self.get_serializer_context())
+            data = serializer.data
+            logger.info(f"Successfully returned {len(data)} similar products")
+            return Response(data)
+        except Exception as e:
+            logger.error(f"Error in ProductViewSet.similar: {str(e)}", exc_info=True)
+            return Response(
+                {"error": f"Internal server error: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    def _split_param(self, name):
+        """Comma-separated and/or repeated query parameter values, deduplicated in order."""
+        values = []
+        for raw in self.request.query_params.getlist(name):
+            values.extend(value.strip() for value in raw.split(','))
+        return list(dict.fromkeys(value for value in values if value))
+
+    @staticmethod
+    def _parse_uuid(value):
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            return None
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({"request": self.request})
@@ -97,11 +311,12 @@ class ProductViewSet(viewsets.ModelViewSet):
             raise ValidationError("You do not have a shop to add products to.")
 
 class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all().order_by('name')
+    queryset = Category.objects.prefetch_related('subcategories').order_by('name')
     serializer_class = CategorySerializer
     lookup_field = 'slug'
     permission_classes = [permissions.AllowAny]
 
+    @cache_response(CATALOG)
     def list(self, request, *args, **kwargs):
         """Override list method to add proper error handling and logging."""
         try:
@@ -116,6 +331,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @cache_response(CATALOG)
     def retrieve(self, request, *args, **kwargs):
         """Override retrieve method to add proper error handling and logging."""
         try:
@@ -130,12 +346,30 @@ class CategoryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Categories with their sub-categories and active product counts,
+        served from a precomputed blob.
+        GET /api/categories/tree/
+        """
+        try:
+            logger.info("CategoryViewSet.tree called")
+            return Response(get_category_tree(request))
+        except Exception as e:
+            logger.error(f"Error in CategoryViewSet.tree: {str(e)}", exc_info=True)
+            return Response(
+                {"error": f"Internal server error: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class SubCategoryViewSet(viewsets.ModelViewSet):
     queryset = SubCategory.objects.all().order_by('category__name', 'name')
     serializer_class = SubCategorySerializer
     lookup_field = 'slug'
     permission_classes = [permissions.AllowAny]
 
+    @cache_response(CATALOG)
     def list(self, request, *args, **kwargs):
         """Override list method to add proper error handling and logging."""
         try:
@@ -150,6 +384,7 @@ class SubCategoryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @cache_response(CATALOG)
     def retrieve(self, request, *args, **kwargs):
         """Override retrieve method to add proper error handling and logging."""
         try:
@@ -169,6 +404,7 @@ class ColorViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ColorSerializer
     permission_classes = [permissions.AllowAny]
 
+    @cache_response(CATALOG)
     def list(self, request, *args, **kwargs):
         """Override list method to add proper error handling and logging."""
         try:
@@ -183,6 +419,7 @@ class ColorViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @cache_response(CATALOG)
     def retrieve(self, request, *args, **kwargs):
         """Override retrieve method to add proper error handling and logging."""
         try:
@@ -202,6 +439,7 @@ class SizeViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = SizeSerializer
     permission_classes = [permissions.AllowAny]
 
+    @cache_response(CATALOG)
     def list(self, request, *args, **kwargs):
         """Override list method to add proper error handling and logging."""
         try:
@@ -216,6 +454,7 @@ class SizeViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @cache_response(CATALOG)
     def retrieve(self, request, *args, **kwargs):
         """Override retrieve method to add proper error handling and logging."""
         try:
@@ -9,6 +9,9 @@ class Shop(models.Model):
     description = models.TextField(blank=True, null=True)
     logo = models.ImageField(upload_to='shops/logos/', blank=True, null=True)
     cover_photo = models.ImageField(upload_to='shops/covers/', blank=True, null=True)
+    # Resized variants written for `logo` and `cover_photo`, see products/images.py
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    cover_photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     contact_email = models.EmailField()
     contact_phone = models.CharField(max_length=20, blank=True, null=True)
     address = models.CharField(max_length=255, blank=True, null=True)
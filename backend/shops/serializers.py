@@ -1,10 +1,13 @@
 # shops/serializers.py
 from rest_framework import serializers
 from .models import Shop
+from products.fields import ImageSrcsetField
 
 class ShopSerializer(serializers.ModelSerializer):
     owner = serializers.StringRelatedField(read_only=True) # The owner is set automatically in the view
+    logo_srcset = ImageSrcsetField(source='logo')
+    cover_photo_srcset = ImageSrcsetField(source='cover_photo')
 
     class Meta:
         model = Shop
-        fields = ['id', 'name', 'slug', 'owner', 'description', 'is_active']
\ No newline at end of file
+        fields = ['id', 'name', 'slug', 'owner', 'description', 'is_active', 'logo_srcset', 'cover_photo_srcset']
\ No newline at end of file
@@ -1,9 +1,12 @@
 import logging
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db.models import Count, Sum
 from .models import Shop
 from .serializers import ShopSerializer
-from users.permissions import IsSellerOrAdmin
+from users.permissions import IsSellerOrAdmin, IsShopOwnerOrAdmin
+from products.conditional import conditional_view, shop_validators
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -20,6 +23,9 @@ class ShopViewSet(viewsets.ModelViewSet):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             # Write operations require seller or admin permissions
             self.permission_classes = [IsSellerOrAdmin]
+        elif self.action == 'traffic':
+            # View counts are private to the shop
+            self.permission_classes = [IsShopOwnerOrAdmin]
         else:
             # Read operations are public
             self.permission_classes = [permissions.AllowAny]
@@ -47,6 +53,7 @@ class ShopViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @conditional_view(shop_validators)
     def retrieve(self, request, *args, **kwargs):
         """Override retrieve method to add proper error handling and logging."""
         try:
@@ -62,5 +69,34 @@ class ShopViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'])
+    def traffic(self, request, slug=None):
+        """
+        View totals for a shop's active products and its most viewed products,
+        for the shop owner and administrators only. Counts are written in
+        batches, so they trail live traffic by up to
+        PRODUCT_VIEW_FLUSH_INTERVAL seconds.
+        GET /api/shops/{slug}/traffic/
+        """
+        logger.info(f"ShopViewSet.traffic called with slug: {slug}")
+        # Outside the try: permission and lookup errors become 403 / 404, not 500
+        shop = self.get_object()
+        try:
+            products = shop.products.filter(is_active=True)
+            totals = products.aggregate(product_count=Count('pk'), total_views=Sum('view_count'))
+            top_products = products.order_by('-view_count').values('id', 'name', 'slug', 'view_count')[:10]
+            return Response({
+                'shop': shop.slug,
+                'product_count': totals['product_count'],
+                'total_views': totals['total_views'] or 0,
+                'top_products': list(top_products),
+            })
+        except Exception as e:
+            logger.error(f"Error in ShopViewSet.traffic: {str(e)}", exc_info=True)
+            return Response(
+                {"error": f"Internal server error: {str(e)}"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
\ No newline at end of file
@@ -159,6 +159,28 @@ class IsSellerOwnerOrAdmin(permissions.BasePermission):
         return False
 
 
+class IsShopOwnerOrAdmin(permissions.BasePermission):
+    """
+    Custom permission for a shop's private data.
+    Only allows the shop's owner, staff and admins to access it.
+    """
+    message = "Access denied. Only the shop owner or an administrator can access this resource."
+
+    def has_permission(self, request, view):
+        """
+        Check if the user is authenticated
+        """
+        return request.user and request.user.is_authenticated
+
+    def has_object_permission(self, request, view, obj):
+        """
+        Check if the user is staff, an admin or the owner of the shop
+        """
+        if request.user.is_staff or getattr(request.user, 'user_type', None) == 'ADMIN':
+            return True
+        return obj.owner_id == request.user.pk
+
+
 class ReadOnlyOrIsAdmin(permissions.BasePermission):
     """
     Custom permission to allow read-only access to everyone,